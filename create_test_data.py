@@ -201,4 +201,10 @@ def main():
     print(f"Total time: {total_time:.2f} seconds")
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    if '--bulk' in sys.argv:
+        # High-volume mode lives in the management command, e.g.
+        # python create_test_data.py --bulk --rides=1000000 --workers=4
+        from django.core.management import call_command
+        call_command('create_test_data', *sys.argv[1:])
+    else:
+        main() 
\ No newline at end of file
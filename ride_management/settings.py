@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -40,12 +41,11 @@ INSTALLED_APPS = [
     'rest_framework',
     'rest_framework.authtoken',
     'corsheaders',
-    'debug_toolbar',
     'rides',
 ]
 
 MIDDLEWARE = [
-    'debug_toolbar.middleware.DebugToolbarMiddleware',
+    'rides.middleware.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
@@ -56,6 +56,12 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# The debug toolbar's middleware is sync-only: in an ASGI deployment it would
+# push every async view back onto a thread, so it's only installed in DEBUG
+if DEBUG:
+    INSTALLED_APPS.insert(INSTALLED_APPS.index('rides'), 'debug_toolbar')
+    MIDDLEWARE.insert(1, 'debug_toolbar.middleware.DebugToolbarMiddleware')
+
 ROOT_URLCONF = 'ride_management.urls'
 
 TEMPLATES = [
@@ -83,9 +89,105 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # A file-backed test database: the default in-memory one uses SQLite's
+        # shared cache, which fails concurrent writers with "database table is
+        # locked" instead of waiting for the lock
+        'TEST': {
+            'NAME': BASE_DIR / 'test_db.sqlite3',
+        },
+    }
+}
+
+# SQLite connection profiles, picked with DJANGO_SQLITE_PROFILE ('default'
+# unless set). 'performance' is opt-in, as it changes the database file: it
+# puts the database in WAL mode, so readers no longer wait for writers;
+# relaxes fsyncs to checkpoints (synchronous=NORMAL is still safe
+# in WAL mode, a power loss can only drop the latest commits); gives each
+# connection a 64 MB page cache and 256 MB of memory-mapped I/O; waits up
+# to 20s for locks; starts transactions with BEGIN IMMEDIATE so writers
+# queue on the busy timeout instead of failing when upgrading a read lock;
+# and keeps connections open between requests. 'performance_asgi' is the
+# same for ASGI servers, where every request runs its queries on a thread of
+# its own and persistent (per-thread) connections would only pile up.
+SQLITE_PROFILES = {
+    'default': {
+        'OPTIONS': {},
+        'CONN_MAX_AGE': 0,
+    },
+    'performance': {
+        'OPTIONS': {
+            'init_command': (
+                'PRAGMA journal_mode=WAL;'
+                'PRAGMA synchronous=NORMAL;'
+                'PRAGMA cache_size=-65536;'
+                'PRAGMA mmap_size=268435456;'
+                'PRAGMA temp_store=MEMORY'
+            ),
+            'transaction_mode': 'IMMEDIATE',
+            'timeout': 20,
+        },
+        'CONN_MAX_AGE': 600,
+        'CONN_HEALTH_CHECKS': True,
+    },
+}
+SQLITE_PROFILES['performance_asgi'] = {**SQLITE_PROFILES['performance'], 'CONN_MAX_AGE': 0}
+SQLITE_PROFILE = os.environ.get('DJANGO_SQLITE_PROFILE', 'default')
+DATABASES['default'].update(SQLITE_PROFILES[SQLITE_PROFILE])
+
+# Read replicas (rides.routers): safe API requests read from one of the
+# aliases listed in DJANGO_READ_REPLICAS, writes always go to 'default'.
+# 'replica' is a local SQLite file standing in for a real replica; fill it
+# with `python manage.py refresh_replica`.
+DATABASES['replica'] = {
+    **DATABASES['default'],
+    'NAME': BASE_DIR / 'replica.sqlite3',
+    'TEST': {
+        'NAME': BASE_DIR / 'test_replica.sqlite3',
+    },
+}
+DATABASE_ROUTERS = ['rides.routers.ReadReplicaRouter']
+DATABASE_READ_REPLICAS = [alias for alias in os.environ.get('DJANGO_READ_REPLICAS', '').split(',') if alias]
+# How long a user reads from the primary after a write
+DATABASE_PRIMARY_STICKY_SECONDS = 5
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'ride-management',
     }
 }
 
+# Ride list/detail response cache (rides.cache); set the timeout to 0 to disable
+RIDE_RESPONSE_CACHE_ALIAS = 'default'
+RIDE_RESPONSE_CACHE_TIMEOUT = 5
+
+# ETag/Last-Modified and 304 responses on the ride list, detail and events
+# endpoints (rides.conditional)
+RIDE_CONDITIONAL_REQUESTS = True
+
+# Server-Sent Events stream of ride events (rides.streams): seconds between
+# keepalive comments
+RIDE_EVENT_STREAM_KEEPALIVE = 15
+
+# Token authentication cache (rides.authentication): a per-process LRU of
+# AUTH_TOKEN_CACHE_SIZE tokens, optionally backed by a cache shared between
+# processes; a TTL of 0 disables it
+AUTH_TOKEN_CACHE_SIZE = 10000
+AUTH_TOKEN_CACHE_TTL = 30
+AUTH_TOKEN_SHARED_CACHE_ALIAS = None
+
+
+# Per-request query/timing instrumentation (rides.metrics); set
+# REQUEST_METRICS_DIR to let dump_request_metrics read every worker's numbers
+REQUEST_METRICS_ENABLED = True
+REQUEST_METRICS_SERVER_TIMING = True
+REQUEST_METRICS_DIR = os.environ.get('REQUEST_METRICS_DIR')
+REQUEST_METRICS_FLUSH_SECONDS = 10
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -134,7 +236,7 @@ AUTH_USER_MODEL = 'rides.User'
 # REST Framework settings
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'rides.authentication.CachedTokenAuthentication',
         'rest_framework.authentication.SessionAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
@@ -148,8 +250,14 @@ INTERNAL_IPS = [
 ]
 
 # Configure debug toolbar to show SQL queries
+def show_toolbar(request):
+    # Read DEBUG at request time so the test runner (which turns DEBUG off)
+    # doesn't render a toolbar whose URLs were never registered
+    from django.conf import settings
+    return settings.DEBUG
+
 DEBUG_TOOLBAR_CONFIG = {
-    'SHOW_TOOLBAR_CALLBACK': lambda request: True,
+    'SHOW_TOOLBAR_CALLBACK': show_toolbar,
 }
 
 DEBUG_TOOLBAR_PANELS = [
@@ -169,7 +277,8 @@ DEBUG_TOOLBAR_PANELS = [
     'debug_toolbar.panels.profiling.ProfilingPanel',
 ]
 
-# Enable SQL query logging
+# SQL query logging (only with DEBUG on); every statement goes to the
+# console, which is slow, so it has to be asked for with DJANGO_LOG_SQL=1
 LOGGING = {
     'version': 1,
     'disable_existing_loggers': False,
@@ -180,7 +289,7 @@ LOGGING = {
     },
     'loggers': {
         'django.db.backends': {
-            'level': 'DEBUG',
+            'level': 'DEBUG' if os.environ.get('DJANGO_LOG_SQL') else 'INFO',
             'handlers': ['console'],
         },
     },
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Ride, RideEvent, User
+from .models import Ride, RideEvent, RideEventArchive, User
 
 class RideEventInline(admin.TabularInline):
     model = RideEvent
@@ -27,3 +27,10 @@ class RideEventAdmin(admin.ModelAdmin):
     list_filter = ('new_status',)
     search_fields = ('id_ride__id_ride', 'user__username')
     readonly_fields = ('id_ride', 'old_status', 'new_status', 'user', 'created_at')
+
+@admin.register(RideEventArchive)
+class RideEventArchiveAdmin(admin.ModelAdmin):
+    list_display = ('id_ride_event', 'id_ride', 'old_status', 'new_status', 'user', 'created_at', 'archived_at')
+    search_fields = ('id_ride__id_ride',)
+    readonly_fields = ('id_ride_event', 'id_ride', 'description', 'old_status', 'new_status', 'user', 'created_at',
+                       'archived_at')
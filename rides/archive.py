@@ -0,0 +1,65 @@
+"""
+Archival of old ride events.
+
+Every read path only looks at recent events, so events older than
+``RIDE_EVENTS_ARCHIVE_AFTER_DAYS`` are moved from ``ride_event`` to
+``ride_event_archive`` in batches (``archive_ride_events`` command). Each
+batch is copied and deleted in one transaction, so an interrupted run leaves
+every event in exactly one of the tables and can simply be restarted.
+``ride_event_history`` reads both tables for the full history of a ride.
+"""
+from datetime import timedelta
+from itertools import chain
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.utils import timezone
+
+from .models import RideEvent, RideEventArchive
+
+ARCHIVED_FIELDS = ('id_ride_event', 'id_ride_id', 'description', 'created_at', 'user_id', 'old_status', 'new_status')
+
+
+def archive_cutoff(days=None):
+    if days is None:
+        days = getattr(settings, 'RIDE_EVENTS_ARCHIVE_AFTER_DAYS', 90)
+    return timezone.now() - timedelta(days=days)
+
+
+def archive_events(cutoff, batch_size=5000, using='default'):
+    """
+    Move the events created before ``cutoff`` to the archive, oldest ids
+    first; yields the size of each committed batch
+    """
+    connection = connections[using]
+    while True:
+        with transaction.atomic(using=using):
+            rows = list(
+                RideEvent.objects.using(using).filter(created_at__lt=cutoff)
+                .order_by('id_ride_event').values_list(*ARCHIVED_FIELDS)[:batch_size]
+            )
+            if not rows:
+                return
+            # ignore_conflicts: rows copied by a run whose delete didn't
+            # happen (only possible if the tables were edited by hand)
+            RideEventArchive.objects.using(using).bulk_create(
+                [RideEventArchive(**dict(zip(ARCHIVED_FIELDS, row))) for row in rows],
+                batch_size=batch_size, ignore_conflicts=True
+            )
+            # A plain DELETE: QuerySet.delete() would load every event to
+            # send its post_delete signal. One statement per chunk of ids the
+            # backend accepts as parameters
+            ids = [row[0] for row in rows]
+            chunk_size = connection.features.max_query_params or len(ids)
+            for start in range(0, len(ids), chunk_size):
+                RideEvent.objects.using(using).filter(pk__in=ids[start:start + chunk_size])._raw_delete(using)
+        yield len(rows)
+
+
+def ride_event_history(ride):
+    """
+    Live and archived events of ``ride``, newest first
+    """
+    live = ride.events.select_related('user')
+    archived = RideEventArchive.objects.filter(id_ride=ride).select_related('user')
+    return sorted(chain(live, archived), key=lambda event: (event.created_at, event.id_ride_event), reverse=True)
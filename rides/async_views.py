@@ -0,0 +1,274 @@
+"""
+Async (ASGI) versions of the read endpoints, served under ``/api/async/``.
+
+DRF views are synchronous, so under ASGI every request to them holds a
+worker thread for its whole duration. These views run on the event loop and
+only hop to a thread for each database round trip (Django's async ORM).
+They reuse the viewsets' query building, filtering, ordering, pagination
+and fast-path serialization, so their JSON bodies and status codes match
+``/api/rides/``, ``/api/rides/{id}/`` and ``/api/events/`` byte for byte.
+
+Cursor pagination and distance sorting still run their queries through
+``sync_to_async`` as they are implemented synchronously.
+
+``/api/async/events/stream/`` pushes new ride events as Server-Sent Events
+(see rides.streams).
+"""
+import asyncio
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.paginator import InvalidPage
+from django.http import HttpResponse, StreamingHttpResponse
+from rest_framework import exceptions
+from rest_framework.authtoken.models import Token
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+
+from .authentication import token_cache
+from .cache import response_cache
+from .models import Ride, RideEvent
+from .pagination import KeysetPagination
+from .permissions import IsAdminUser
+from .routers import ais_pinned_to_primary, choose_replica, read_from
+from .serializers import ride_event_representation, ride_representation
+from .streams import RESUME_LIMIT, StreamEvent, event_broker
+from .views import RideEventViewSet, RideViewSet
+
+EVENTS_CHUNK_SIZE = 2000
+# How long EventSource clients wait before reconnecting (ms)
+STREAM_RETRY = 3000
+
+
+def api_response(data, status=200, headers=None):
+    return HttpResponse(
+        JSONRenderer().render(data), status=status, headers=headers, content_type='application/json'
+    )
+
+
+async def authenticate(request):
+    """
+    Async equivalent of CachedTokenAuthentication followed by SessionAuthentication
+    """
+    auth = request.headers.get('Authorization', '').split()
+    if auth and auth[0].lower() == 'token':
+        if len(auth) == 1:
+            raise exceptions.AuthenticationFailed('Invalid token header. No credentials provided.')
+        if len(auth) > 2:
+            raise exceptions.AuthenticationFailed('Invalid token header. Token string should not contain spaces.')
+        user = await token_cache.aget(auth[1])
+        if user is not None:
+            return user
+        token = await Token.objects.select_related('user').filter(key=auth[1]).afirst()
+        if token is None:
+            raise exceptions.AuthenticationFailed('Invalid token.')
+        if not token.user.is_active:
+            raise exceptions.AuthenticationFailed('User inactive or deleted.')
+        await token_cache.aset(auth[1], token.user)
+        return token.user
+
+    user = await request.auser()
+    return user if user.is_active else None
+
+
+def async_api_view(view):
+    """
+    Authenticate, check IsAdminUser, route reads like ReplicaReadMixin and
+    turn API exceptions into DRF-style JSON error responses
+    """
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        try:
+            if request.method not in ('GET', 'HEAD'):
+                raise exceptions.MethodNotAllowed(request.method)
+            user = await authenticate(request)
+            if user is None or not user.is_authenticated:
+                raise exceptions.NotAuthenticated()
+            # Keep the lazy middleware user from being evaluated synchronously
+            request.user = user
+            drf_request = Request(request, authenticators=())
+            drf_request.user = user
+            if not IsAdminUser().has_permission(drf_request, None):
+                raise exceptions.PermissionDenied()
+
+            alias = None if await ais_pinned_to_primary(user) else choose_replica()
+            with read_from(alias):
+                return await view(drf_request, *args, **kwargs)
+        except exceptions.APIException as exc:
+            headers = {'WWW-Authenticate': 'Token'} if exc.status_code == 401 else None
+            data = exc.detail if isinstance(exc.detail, (list, dict)) else {'detail': exc.detail}
+            return api_response(data, exc.status_code, headers)
+    return wrapper
+
+
+def get_viewset(viewset_class, request, action, **kwargs):
+    view = viewset_class(request=request, action=action, args=(), kwargs=kwargs, format_kwarg=None)
+    view.headers = {}
+    return view
+
+
+def uses_sync_queries(view):
+    """
+    Distance sorting counts rides around the point while the queryset is built
+    """
+    params = view.request.query_params
+    return view.action == 'list' and params.get('lat') and params.get('lng') and params.get('sort_by_distance')
+
+
+async def paginate(view, queryset):
+    """
+    Async ``view.paginate_queryset()`` for page number pagination
+    """
+    paginator = view.paginator
+    if paginator is None:
+        return None
+    if isinstance(paginator, KeysetPagination):
+        return await sync_to_async(paginator.paginate_queryset)(queryset, view.request, view)
+
+    page_size = paginator.get_page_size(view.request)
+    if not page_size:
+        return None
+    django_paginator = paginator.django_paginator_class(queryset, page_size)
+    django_paginator.count = await queryset.acount()
+    page_number = paginator.get_page_number(view.request, django_paginator)
+    try:
+        paginator.page = django_paginator.page(page_number)
+    except InvalidPage as exc:
+        raise exceptions.NotFound(paginator.invalid_page_message.format(page_number=page_number, message=str(exc)))
+    paginator.request = view.request
+    paginator.page.object_list = [obj async for obj in paginator.page.object_list]
+    return paginator.page.object_list
+
+
+@async_api_view
+async def ride_list(request):
+    view = get_viewset(RideViewSet, request, 'list')
+    cache_key, cached = await response_cache.aget(request)
+    if cached is not None:
+        return view.get_cached_response(cached, api_response)
+
+    validators, not_modified = await sync_to_async(view.get_not_modified_response)()
+    if not_modified is not None:
+        return not_modified
+
+    if uses_sync_queries(view):
+        queryset = await sync_to_async(lambda: view.filter_queryset(view.get_queryset()))()
+    else:
+        queryset = view.filter_queryset(view.get_queryset())
+
+    fields = view.get_ride_fields()
+    page = await paginate(view, queryset)
+    if page is not None:
+        data = view.paginator.get_paginated_response([ride_representation(ride, fields) for ride in page]).data
+    else:
+        data = [ride_representation(ride, fields) async for ride in queryset]
+    await response_cache.aset(cache_key, (data, validators))
+    return view.add_validators(api_response(data), validators)
+
+
+@async_api_view
+async def ride_detail(request, pk):
+    view = get_viewset(RideViewSet, request, 'retrieve', pk=pk)
+    cache_key, cached = await response_cache.aget(request)
+    if cached is not None:
+        return view.get_cached_response(cached, api_response)
+
+    validators, not_modified = await sync_to_async(view.get_not_modified_response)()
+    if not_modified is not None:
+        return not_modified
+
+    queryset = view.filter_queryset(view.get_queryset())
+    try:
+        ride = await queryset.aget(pk=pk)
+    except (Ride.DoesNotExist, ValueError, TypeError):
+        raise exceptions.NotFound()
+    data = ride_representation(ride, view.get_ride_fields())
+    await response_cache.aset(cache_key, (data, validators))
+    return view.add_validators(api_response(data), validators)
+
+
+@async_api_view
+async def ride_event_list(request):
+    view = get_viewset(RideEventViewSet, request, 'list')
+    queryset = view.filter_queryset(view.get_queryset()).select_related('user')
+
+    page = await paginate(view, queryset)
+    if page is not None:
+        data = view.paginator.get_paginated_response([ride_event_representation(event) for event in page]).data
+    else:
+        data = [ride_event_representation(event) async for event in queryset.aiterator(chunk_size=EVENTS_CHUNK_SIZE)]
+    return api_response(data)
+
+
+def get_last_event_id(request):
+    value = request.headers.get('Last-Event-ID') or request.query_params.get('last_event_id')
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+async def stream_events(ride_id, statuses, last_id):
+    """
+    SSE messages: the events after ``last_id`` (if given), then new events
+    as they are published, with a comment line every
+    ``RIDE_EVENT_STREAM_KEEPALIVE`` seconds so proxies keep the connection
+    """
+    keepalive = getattr(settings, 'RIDE_EVENT_STREAM_KEEPALIVE', 15)
+    # Subscribed before looking up the missed events, so none falls between
+    subscription = event_broker.subscribe(ride_id, statuses)
+    try:
+        yield f'retry: {STREAM_RETRY}\n\n'
+        sent = set()
+        if last_id is not None:
+            events = RideEvent.objects.filter(id_ride_event__gt=last_id).select_related('user')
+            if ride_id is not None:
+                events = events.filter(id_ride=ride_id)
+            if statuses:
+                events = events.filter(new_status__in=statuses)
+            async for event in events.order_by('id_ride_event')[:RESUME_LIMIT]:
+                sent.add(event.id_ride_event)
+                yield StreamEvent(event).message
+
+        while True:
+            try:
+                event = await asyncio.wait_for(subscription.queue.get(), keepalive)
+            except asyncio.TimeoutError:
+                yield ': keepalive\n\n'
+                continue
+            # None: this client fell too far behind, it resumes on reconnect
+            if event is None:
+                break
+            if event.id not in sent:
+                yield event.message
+    finally:
+        event_broker.unsubscribe(subscription)
+
+
+@async_api_view
+async def ride_event_stream(request, pk=None):
+    """
+    New ride events as Server-Sent Events: of one ride
+    (``/api/async/rides/{id}/events/stream/`` or ``?ride_id=``) and/or with
+    one of the ``?status=`` new statuses (comma separated). Resumes after
+    the ``Last-Event-ID`` header or ``?last_event_id=``.
+    """
+    ride_id = pk if pk is not None else request.query_params.get('ride_id')
+    if ride_id is not None:
+        try:
+            ride_id = int(ride_id)
+        except (TypeError, ValueError):
+            raise exceptions.ValidationError({'ride_id': ['A valid integer is required.']})
+        if pk is not None and not await Ride.objects.filter(pk=ride_id).aexists():
+            raise exceptions.NotFound()
+    statuses = {status.strip().upper() for value in request.query_params.getlist('status')
+                for status in value.split(',') if status.strip()}
+
+    response = StreamingHttpResponse(
+        stream_events(ride_id, statuses, get_last_event_id(request)), content_type='text/event-stream'
+    )
+    response['Cache-Control'] = 'no-cache'
+    # Don't let nginx buffer the stream
+    response['X-Accel-Buffering'] = 'no'
+    return response
@@ -0,0 +1,186 @@
+"""
+Token authentication that doesn't query the database on every request.
+
+``CachedTokenAuthentication`` maps token keys to the few user fields the API
+needs (id, username, role and the staff/superuser flags) in a bounded LRU
+kept by each process, optionally backed by a Django cache shared between
+processes (``AUTH_TOKEN_SHARED_CACHE_ALIAS``). Entries expire after
+``AUTH_TOKEN_CACHE_TTL`` seconds. Deleting a token, or saving a user whose
+role or active/staff/superuser flags changed, drops the affected entries
+(see rides.signals). Other processes only see that through the shared cache,
+so their own LRU may keep a stale entry for up to the TTL.
+
+The user handed to the view is built from the cached fields; any other field
+is loaded from the database on first access.
+"""
+from collections import OrderedDict
+import hashlib
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS, transaction
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+from .models import User
+
+CACHED_FIELDS = ('id_user', 'username', 'role', 'is_active', 'is_staff', 'is_superuser')
+
+# Saving a user with only other fields (e.g. last_login) keeps their entries
+AUTH_FIELDS = frozenset(('role', 'is_active', 'is_staff', 'is_superuser'))
+
+KEY_PREFIX = 'rides:auth-token:'
+
+
+class TokenUserCache:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def max_size(self):
+        return getattr(settings, 'AUTH_TOKEN_CACHE_SIZE', 10000)
+
+    @property
+    def ttl(self):
+        return getattr(settings, 'AUTH_TOKEN_CACHE_TTL', 30)
+
+    @property
+    def shared(self):
+        alias = getattr(settings, 'AUTH_TOKEN_SHARED_CACHE_ALIAS', None)
+        return caches[alias] if alias else None
+
+    def shared_key(self, key):
+        # Keep raw tokens out of the shared cache
+        return KEY_PREFIX + hashlib.sha256(key.encode('utf-8')).hexdigest()
+
+    def get_local(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires, values = entry
+                if expires > time.monotonic():
+                    self._entries.move_to_end(key)
+                    return values
+                del self._entries[key]
+        return None
+
+    def set_local(self, key, values):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, values)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def get(self, key):
+        """
+        Cached user of the token, or None on a miss
+        """
+        if not self.ttl:
+            return None
+        values = self.get_local(key)
+        if values is None and self.shared is not None:
+            values = self.shared.get(self.shared_key(key))
+            if values is not None:
+                self.set_local(key, values)
+        self.count(values)
+        return self.build_user(values) if values is not None else None
+
+    async def aget(self, key):
+        """
+        ``get()`` for async views
+        """
+        if not self.ttl:
+            return None
+        values = self.get_local(key)
+        if values is None and self.shared is not None:
+            values = await self.shared.aget(self.shared_key(key))
+            if values is not None:
+                self.set_local(key, values)
+        self.count(values)
+        return self.build_user(values) if values is not None else None
+
+    def set(self, key, user):
+        if not self.ttl:
+            return
+        values = tuple(getattr(user, field) for field in CACHED_FIELDS)
+        self.set_local(key, values)
+        if self.shared is not None:
+            self.shared.set(self.shared_key(key), values, self.ttl)
+
+    async def aset(self, key, user):
+        if not self.ttl:
+            return
+        values = tuple(getattr(user, field) for field in CACHED_FIELDS)
+        self.set_local(key, values)
+        if self.shared is not None:
+            await self.shared.aset(self.shared_key(key), values, self.ttl)
+
+    def build_user(self, values):
+        # The remaining fields are deferred and load on first access
+        return User.from_db(DEFAULT_DB_ALIAS, CACHED_FIELDS, values)
+
+    def count(self, values):
+        with self._lock:
+            if values is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+
+    def invalidate(self, keys):
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+        if self.shared is not None and keys:
+            self.shared.delete_many([self.shared_key(key) for key in keys])
+
+    def invalidate_user(self, user_id):
+        with self._lock:
+            keys = {key for key, (_, values) in self._entries.items() if values[0] == user_id}
+        keys.update(Token.objects.filter(user_id=user_id).values_list('key', flat=True))
+        self.invalidate(list(keys))
+
+    def invalidate_on_commit(self, keys=None, user_id=None):
+        # Dropping entries before commit would let a concurrent request cache
+        # the old rows again
+        if keys is not None:
+            transaction.on_commit(lambda: self.invalidate(keys))
+        if user_id is not None:
+            transaction.on_commit(lambda: self.invalidate_user(user_id))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            hits, misses, size = self.hits, self.misses, len(self._entries)
+        total = hits + misses
+        return {
+            'enabled': bool(self.ttl),
+            'size': size,
+            'hits': hits,
+            'misses': misses,
+            'hit_rate': hits / total if total else 0.0,
+        }
+
+
+token_cache = TokenUserCache()
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    TokenAuthentication backed by ``token_cache``
+    """
+
+    def authenticate_credentials(self, key):
+        user = token_cache.get(key)
+        if user is None:
+            user, token = super().authenticate_credentials(key)
+            token_cache.set(key, user)
+            return user, token
+        return user, Token(key=key, user=user)
@@ -0,0 +1,138 @@
+"""
+Response cache for the ride list/detail endpoints.
+
+Entries are keyed on the scheme, host and path of the request plus the
+normalized query parameters (paginated responses embed absolute next/previous
+links) and on a global version number. Any change to a ride or ride event bumps the
+version (see rides.signals), which orphans every cached response at once;
+orphaned entries simply expire. Works with any Django cache backend,
+including the local-memory one.
+"""
+import hashlib
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+from .routers import current_read_alias
+
+VERSION_KEY = 'rides:response-cache:version'
+
+
+class RideResponseCache:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def cache(self):
+        return caches[getattr(settings, 'RIDE_RESPONSE_CACHE_ALIAS', 'default')]
+
+    @property
+    def timeout(self):
+        return getattr(settings, 'RIDE_RESPONSE_CACHE_TIMEOUT', 5)
+
+    @property
+    def enabled(self):
+        return bool(self.timeout)
+
+    def get_version(self):
+        version = self.cache.get(VERSION_KEY)
+        if version is None:
+            # Start from the clock rather than 1 so that a version key lost to
+            # eviction can't bring back entries written under an old version
+            self.cache.add(VERSION_KEY, time.time_ns(), timeout=None)
+            version = self.cache.get(VERSION_KEY)
+        return version
+
+    async def aget_version(self):
+        version = await self.cache.aget(VERSION_KEY)
+        if version is None:
+            await self.cache.aadd(VERSION_KEY, time.time_ns(), timeout=None)
+            version = await self.cache.aget(VERSION_KEY)
+        return version
+
+    def invalidate(self):
+        try:
+            self.cache.incr(VERSION_KEY)
+        except ValueError:
+            self.cache.add(VERSION_KEY, time.time_ns(), timeout=None)
+
+    def invalidate_on_commit(self):
+        # Bumping before commit would let a concurrent request cache the old
+        # rows under the new version
+        transaction.on_commit(self.invalidate)
+
+    def make_key(self, request, version=None):
+        params = sorted(
+            (key, sorted(value for value in values if value != ''))
+            for key, values in request.query_params.lists()
+        )
+        # Replicas may lag behind the primary, so responses read from them
+        # are cached apart from the primary's (see rides.routers)
+        alias = current_read_alias() or 'default'
+        url = (request.scheme, request.get_host(), request.path)
+        digest = hashlib.sha1(repr((alias, url, params)).encode('utf-8')).hexdigest()
+        if version is None:
+            version = self.get_version()
+        return f'rides:response:{version}:{digest}'
+
+    def get(self, request):
+        """
+        Return ``(key, data)`` for the request; ``data`` is None on a miss.
+        The key is computed once, before the view runs, so a response built
+        while the version changes is stored under the old, orphaned version.
+        """
+        if not self.enabled:
+            return None, None
+        key = self.make_key(request)
+        data = self.cache.get(key)
+        self.count(data)
+        return key, data
+
+    async def aget(self, request):
+        """
+        ``get()`` for async views
+        """
+        if not self.enabled:
+            return None, None
+        key = self.make_key(request, await self.aget_version())
+        data = await self.cache.aget(key)
+        self.count(data)
+        return key, data
+
+    def count(self, data):
+        with self._lock:
+            if data is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+
+    def set(self, key, data):
+        if key is not None:
+            self.cache.set(key, data, self.timeout)
+
+    async def aset(self, key, data):
+        if key is not None:
+            await self.cache.aset(key, data, self.timeout)
+
+    def stats(self):
+        with self._lock:
+            hits, misses = self.hits, self.misses
+        total = hits + misses
+        return {
+            'enabled': self.enabled,
+            'hits': hits,
+            'misses': misses,
+            'hit_rate': hits / total if total else 0.0,
+        }
+
+    def reset_stats(self):
+        with self._lock:
+            self.hits = self.misses = 0
+
+
+response_cache = RideResponseCache()
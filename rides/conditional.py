@@ -0,0 +1,150 @@
+"""
+Conditional GET (ETag / Last-Modified) for the ride endpoints.
+
+The validators are computed from cheap aggregates over the rows a response
+is built from, so a request whose ``If-None-Match`` (or
+``If-Modified-Since``) still matches gets a 304 before the joined query runs
+or anything is serialized:
+
+- ride list: the number of rides matching the filters (a ``COUNT(*)``
+  rather than the rides.rollups counts, which bulk inserts like
+  rides.datagen don't update) and their latest ``updated_at``, plus the
+  newest ride event and the oldest event still in the recent-events window,
+  since events leaving the window change the list too
+- ride detail: the ride's ``updated_at`` and the count and newest id of its
+  events in the window
+- ride events: the count and newest id of the ride's events (and of its
+  archived events with ``?history=full``)
+
+Cached responses (rides.cache) keep the validators they were built with,
+so cache hits answer conditional requests without a query.
+
+The ETag is the precise validator; ``Last-Modified`` can't reflect deleted
+rows, so clients should prefer ``If-None-Match``. Edits to a rider's or
+driver's profile don't change either.
+"""
+import hashlib
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Count, Max
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+from .models import Ride, RideEvent, RideEventArchive
+from .queries import filter_rides, get_recent_events_window
+
+
+def enabled():
+    return getattr(settings, 'RIDE_CONDITIONAL_REQUESTS', True)
+
+
+class Validators:
+    def __init__(self, request, parts, last_modified):
+        self.parts = parts
+        params = sorted((key, sorted(values)) for key, values in request.query_params.lists())
+        # The response also depends on the path, the query parameters
+        # (fields, events window, pagination...) and the format
+        media_type = getattr(request, 'accepted_media_type', None)
+        digest = hashlib.sha1(repr((request.path, params, media_type, parts)).encode('utf-8')).hexdigest()
+        self.etag = f'W/"{digest}"'
+        self.last_modified = last_modified
+
+    def for_request(self, request):
+        """
+        The same validators for another request with the same cache key,
+        which may differ in format or in blank parameters
+        """
+        return Validators(request, self.parts, self.last_modified)
+
+    def get_not_modified_response(self, request):
+        """
+        The 304 answering ``request``, or None if it has to be answered in full
+        """
+        # Whole seconds, like the Last-Modified header
+        timestamp = int(self.last_modified.timestamp()) if self.last_modified else None
+        response = get_conditional_response(request, etag=self.etag, last_modified=timestamp)
+        if response is not None:
+            self.add_headers(response)
+        return response
+
+    def add_headers(self, response):
+        response['ETag'] = self.etag
+        if self.last_modified:
+            response['Last-Modified'] = http_date(self.last_modified.timestamp())
+        return response
+
+
+def _latest(*values):
+    values = [value for value in values if value is not None]
+    return max(values) if values else None
+
+
+def _window_start(query_params):
+    hours, _ = get_recent_events_window(query_params)
+    return timezone.now() - timedelta(hours=hours)
+
+
+def ride_list_validators(request, with_events=True):
+    params = request.query_params
+    rides = filter_rides(Ride.objects.all(), params)
+    # Separate queries: SQLite answers a lone COUNT(*) or MAX() from an index
+    # without visiting every matching row, but not both in one statement
+    count = rides.count()
+    updated_at = rides.aggregate(updated_at=Max('updated_at'))['updated_at']
+    parts = [count, updated_at]
+    last_modified = updated_at
+
+    if with_events:
+        newest = RideEvent.objects.aggregate(newest=Max('id_ride_event'))['newest']
+        created_at = RideEvent.objects.aggregate(created_at=Max('created_at'))['created_at']
+        oldest = RideEvent.objects.filter(created_at__gte=_window_start(params)).order_by(
+            'created_at', 'id_ride_event'
+        ).values_list('id_ride_event', flat=True).first()
+        parts += [newest, oldest]
+        last_modified = _latest(last_modified, created_at)
+    return Validators(request, parts, last_modified)
+
+
+def ride_validators(request, ride_id, with_events=True):
+    """
+    None if the ride doesn't exist
+    """
+    try:
+        updated_at = Ride.objects.filter(pk=ride_id).values_list('updated_at', flat=True).first()
+    except (TypeError, ValueError):
+        return None
+    if updated_at is None:
+        return None
+    parts = [updated_at]
+    last_modified = updated_at
+
+    if with_events:
+        events = RideEvent.objects.filter(
+            id_ride=ride_id, created_at__gte=_window_start(request.query_params)
+        ).aggregate(count=Count('pk'), newest=Max('id_ride_event'), created_at=Max('created_at'))
+        parts += [events['count'], events['newest']]
+        last_modified = _latest(last_modified, events['created_at'])
+    return Validators(request, parts, last_modified)
+
+
+def ride_events_validators(request, ride_id, history=False):
+    """
+    None if the ride doesn't exist
+    """
+    try:
+        exists = Ride.objects.filter(pk=ride_id).exists()
+    except (TypeError, ValueError):
+        return None
+    if not exists:
+        return None
+    parts = []
+    last_modified = None
+    for model in (RideEvent, RideEventArchive) if history else (RideEvent,):
+        events = model.objects.filter(id_ride=ride_id).aggregate(
+            count=Count('pk'), newest=Max('id_ride_event'), created_at=Max('created_at')
+        )
+        parts += [events['count'], events['newest']]
+        last_modified = _latest(last_modified, events['created_at'])
+    return Validators(request, parts, last_modified)
@@ -0,0 +1,257 @@
+"""
+High-volume synthetic data generation for capacity testing.
+
+Rides are generated in fixed-size blocks. Every block has its own random
+generator seeded from ``(seed, block number)``, so the generated data only
+depends on the seed and the sizes, not on how blocks are spread over worker
+processes. Each block is written with ``bulk_create`` inside one transaction;
+``bulk_create`` stamps the rides' ``auto_now``/``auto_now_add`` fields with the
+current time, so the generated times are written back with ``bulk_update``.
+
+Times are generated backwards from the plan's ``anchor`` rather than from
+the clock, so the same seed gives the same rows on every run.
+"""
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone as dt_timezone
+import math
+import multiprocessing
+import random
+import time
+
+from django.contrib.auth.hashers import make_password
+from django.db import OperationalError, connections, transaction
+
+from .models import Ride, RideEvent, User
+
+# (latitude, longitude, weight): pickups cluster around a few cities
+CITIES = (
+    (40.7128, -74.0060, 0.30),   # New York
+    (34.0522, -118.2437, 0.20),  # Los Angeles
+    (41.8781, -87.6298, 0.15),   # Chicago
+    (37.7749, -122.4194, 0.15),  # San Francisco
+    (29.7604, -95.3698, 0.10),   # Houston
+    (47.6062, -122.3321, 0.10),  # Seattle
+)
+CITY_SPREAD_DEGREES = 0.08
+
+STATUS_WEIGHTS = (
+    ('COMPLETED', 0.65),
+    ('CANCELLED', 0.15),
+    ('IN_PROGRESS', 0.10),
+    ('REQUESTED', 0.10),
+)
+
+UPDATE_DESCRIPTIONS = ('GPS update', 'ETA update', 'Traffic alert', 'Payment processed')
+
+DESCRIPTIONS = ('Ride requested', 'Ride started', 'Ride completed', 'Ride cancelled') + UPDATE_DESCRIPTIONS
+
+# Events per ride follow a log-normal distribution (many quiet rides, a few
+# very busy ones) with this shape parameter, capped at MAX_EVENTS_FACTOR
+# times the requested mean
+EVENTS_SIGMA = 1.0
+MAX_EVENTS_FACTOR = 50
+
+LOCK_RETRIES = 10
+
+# The default anchor of a seed is this date plus ``seed % 365`` days
+ANCHOR_EPOCH = datetime(2025, 1, 1, tzinfo=dt_timezone.utc)
+
+
+@dataclass
+class GenerationPlan:
+    rides: int
+    events_per_ride: float
+    rider_ids: list
+    driver_ids: list
+    seed: int
+    batch_size: int
+    days: int = 30
+    # Latest time of the generated data; derived from the seed by default
+    anchor: datetime = None
+
+    def __post_init__(self):
+        if self.anchor is None:
+            self.anchor = ANCHOR_EPOCH + timedelta(days=self.seed % 365)
+
+    @property
+    def blocks(self):
+        return math.ceil(self.rides / self.batch_size)
+
+
+def ensure_users(prefix, riders, drivers, batch_size=1000):
+    """
+    Create (or reuse) ``riders`` rider and ``drivers`` driver accounts named
+    after ``prefix``; returns their ids
+    """
+    password = make_password(None)
+    users = [
+        User(username=f'{prefix}_{role}{i}', email=f'{prefix}_{role}{i}@example.com',
+             first_name='Load', last_name=f'{role.title()}{i}', phone_number=f'555-{i:07d}',
+             role=role, password=password)
+        for role, count in (('rider', riders), ('driver', drivers))
+        for i in range(count)
+    ]
+    # bulk_create doesn't call save()
+    for user in users:
+        user.update_email_lower()
+    User.objects.bulk_create(users, batch_size=batch_size, ignore_conflicts=True)
+
+    def ids(role, count):
+        return list(User.objects.filter(username__startswith=f'{prefix}_{role}', role=role)
+                    .order_by('id_user').values_list('id_user', flat=True)[:count])
+
+    return ids('rider', riders), ids('driver', drivers)
+
+
+def _ride(rng, plan, now):
+    lat, lng, _ = rng.choices(CITIES, weights=[city[2] for city in CITIES])[0]
+    status = rng.choices([s for s, _ in STATUS_WEIGHTS], weights=[w for _, w in STATUS_WEIGHTS])[0]
+    if status == 'REQUESTED':
+        pickup_time = now + timedelta(minutes=rng.randint(0, 120))
+        created_at = now - timedelta(seconds=rng.randint(0, 1800))
+    else:
+        pickup_time = now - timedelta(seconds=rng.randint(0, plan.days * 86400))
+        created_at = pickup_time - timedelta(minutes=rng.randint(1, 30))
+    has_driver = status in ('IN_PROGRESS', 'COMPLETED') or (status == 'CANCELLED' and rng.random() < 0.5)
+    # The last status change
+    if status in ('COMPLETED', 'CANCELLED'):
+        updated_at = min(pickup_time + timedelta(minutes=rng.randint(5, 90)), now)
+    elif status == 'IN_PROGRESS':
+        updated_at = pickup_time
+    else:
+        updated_at = created_at
+
+    ride = Ride(
+        status=status,
+        id_rider_id=rng.choice(plan.rider_ids),
+        id_driver_id=rng.choice(plan.driver_ids) if has_driver else None,
+        pickup_latitude=rng.gauss(lat, CITY_SPREAD_DEGREES),
+        pickup_longitude=rng.gauss(lng, CITY_SPREAD_DEGREES),
+        dropoff_latitude=rng.gauss(lat, CITY_SPREAD_DEGREES),
+        dropoff_longitude=rng.gauss(lng, CITY_SPREAD_DEGREES),
+        pickup_time=pickup_time,
+        created_at=created_at,
+        updated_at=updated_at,
+    )
+    # bulk_create doesn't call save()
+    ride.update_pickup_grid()
+    return ride
+
+
+def _event_count(rng, mean):
+    if mean <= 0:
+        return 0
+    mu = math.log(mean) - EVENTS_SIGMA ** 2 / 2
+    return max(1, min(int(round(rng.lognormvariate(mu, EVENTS_SIGMA))), int(mean * MAX_EVENTS_FACTOR)))
+
+
+def _events(rng, ride, count, now):
+    """
+    A status history consistent with the ride's status and timestamps,
+    padded with updates
+    """
+    if count == 0:
+        return []
+    requested_at = ride.created_at
+    history = [(None, 'REQUESTED', 'Ride requested', ride.id_rider_id, requested_at)]
+    if ride.id_driver_id and ride.status != 'REQUESTED':
+        history.append(('REQUESTED', 'IN_PROGRESS', 'Ride started', ride.id_driver_id, ride.pickup_time))
+    if ride.status in ('COMPLETED', 'CANCELLED'):
+        user_id = ride.id_driver_id if ride.status == 'COMPLETED' else ride.id_rider_id
+        history.append((history[-1][1], ride.status, f'Ride {ride.status.lower()}', user_id, ride.updated_at))
+
+    events = [
+        RideEvent(id_ride_id=ride.id_ride, old_status=old, new_status=new, description=description,
+                  user_id=user_id, created_at=min(created_at, now))
+        for old, new, description, user_id, created_at in history[:count]
+    ]
+    span = max((history[-1][4] - requested_at).total_seconds(), 60)
+    for _ in range(count - len(events)):
+        events.append(RideEvent(
+            id_ride_id=ride.id_ride, old_status=ride.status, new_status=ride.status,
+            description=rng.choice(UPDATE_DESCRIPTIONS),
+            user_id=rng.choice([ride.id_rider_id, ride.id_driver_id or ride.id_rider_id]),
+            created_at=min(requested_at + timedelta(seconds=rng.uniform(0, span)), now),
+        ))
+    return events
+
+
+def generate_block(plan, block, using='default'):
+    """
+    Generate and insert one block of rides with their events; returns the
+    number of (rides, events) written
+    """
+    rng = random.Random(plan.seed * 1_000_003 + block)
+    now = plan.anchor
+    first = block * plan.batch_size
+    count = min(plan.batch_size, plan.rides - first)
+
+    # Create the description rows up front, so that the inserts below find
+    # their ids in the process cache
+    RideEvent._meta.get_field('description').interner.intern(DESCRIPTIONS, using)
+    for attempt in range(LOCK_RETRIES):
+        try:
+            with transaction.atomic(using=using):
+                rides = [_ride(rng, plan, now) for _ in range(count)]
+                timestamps = [(ride.created_at, ride.updated_at) for ride in rides]
+                Ride.objects.using(using).bulk_create(rides)
+                # Put back the generated times bulk_create stamped over
+                for ride, (created_at, updated_at) in zip(rides, timestamps):
+                    ride.created_at, ride.updated_at = created_at, updated_at
+                Ride.objects.using(using).bulk_update(rides, ['created_at', 'updated_at'],
+                                                      batch_size=plan.batch_size)
+                events = []
+                for ride in rides:
+                    events.extend(_events(rng, ride, _event_count(rng, plan.events_per_ride), now))
+                RideEvent.objects.using(using).bulk_create(events, batch_size=plan.batch_size)
+            return len(rides), len(events)
+        except OperationalError as exc:
+            # Other workers hold SQLite's write lock; retry the whole block
+            # with the same generator state
+            if 'locked' not in str(exc) or attempt == LOCK_RETRIES - 1:
+                raise
+            rng = random.Random(plan.seed * 1_000_003 + block)
+            time.sleep(0.1 * (attempt + 1))
+
+
+def _run_blocks(args):
+    plan, blocks, using = args
+    totals = [0, 0]
+    try:
+        for block in blocks:
+            rides, events = generate_block(plan, block, using)
+            totals[0] += rides
+            totals[1] += events
+    finally:
+        connections.close_all()
+    return totals
+
+
+def generate(plan, workers=1, using='default', progress=None):
+    """
+    Generate ``plan.rides`` rides, sharding blocks over ``workers`` processes.
+    Returns ``(rides, events, seconds)``.
+    """
+    start = time.perf_counter()
+    blocks = list(range(plan.blocks))
+    rides = events = 0
+
+    if workers <= 1:
+        for block in blocks:
+            block_rides, block_events = generate_block(plan, block, using)
+            rides += block_rides
+            events += block_events
+            if progress:
+                progress(rides, events, time.perf_counter() - start)
+    else:
+        # Children must not share the parent's database connection
+        connections.close_all()
+        shards = [(plan, blocks[i::workers], using) for i in range(workers)]
+        with multiprocessing.get_context('fork').Pool(workers) as pool:
+            for shard_rides, shard_events in pool.imap_unordered(_run_blocks, shards):
+                rides += shard_rides
+                events += shard_events
+                if progress:
+                    progress(rides, events, time.perf_counter() - start)
+
+    return rides, events, time.perf_counter() - start
@@ -0,0 +1,281 @@
+"""
+Driver auto-dispatch.
+
+Drivers report their position and availability through
+``POST /api/users/{id}/location/``. The available ones are kept in memory,
+per process, in grid cells of ``RIDE_GRID_CELL_DEGREES`` degrees (like ride
+pickups, see rides.geo), so the nearest free driver to a pickup is found by
+looking at a few cells around it rather than at every driver.
+
+dispatch() then takes the requested rides in pickup time order, in batches,
+pairs each with the nearest free driver within ``RIDE_DISPATCH_MAX_RINGS``
+cells and starts the whole batch in one transaction: one conditional UPDATE
+and one bulk insert of the "Ride started" events, the same changes the
+``start`` action makes one ride at a time. Matched drivers leave the index
+until they report themselves available again.
+
+The index lives in the process that received the location updates: run a
+single dispatching process, or route location updates and dispatch runs to
+the same one.
+"""
+import math
+import threading
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, When
+from django.utils import timezone
+
+from . import rollups
+from .cache import response_cache
+from .geo import DEFAULT_MAX_RINGS, cell_size, grid_cell
+from .models import Ride, RideEvent, User
+from .streams import event_broker
+from .transitions import TransitionConflict
+
+DEFAULT_BATCH_SIZE = 500
+
+
+def max_rings():
+    return getattr(settings, 'RIDE_DISPATCH_MAX_RINGS', DEFAULT_MAX_RINGS)
+
+
+def ring_cells(cell, ring):
+    """
+    The cells exactly ``ring`` rings away from ``cell``
+    """
+    x, y = cell
+    if ring == 0:
+        yield cell
+        return
+    for dx in range(-ring, ring + 1):
+        yield x + dx, y - ring
+        yield x + dx, y + ring
+    for dy in range(-ring + 1, ring):
+        yield x - ring, y + dy
+        yield x + ring, y + dy
+
+
+class DriverIndex:
+    """
+    Available drivers by grid cell, with their last reported position
+    """
+
+    def __init__(self, size=None):
+        self.size = size
+        self.lock = threading.RLock()
+        self.positions = {}
+        self.cells = {}
+
+    def __len__(self):
+        return len(self.positions)
+
+    def get_size(self):
+        return self.size or cell_size()
+
+    def update(self, driver_id, latitude, longitude, available=True):
+        with self.lock:
+            self.remove(driver_id)
+            if available:
+                cell = grid_cell(latitude, longitude, self.get_size())
+                self.positions[driver_id] = (latitude, longitude, cell)
+                self.cells.setdefault(cell, set()).add(driver_id)
+
+    def remove(self, driver_id):
+        """
+        Take ``driver_id`` out of the index; returns its position, if it was
+        available
+        """
+        with self.lock:
+            position = self.positions.pop(driver_id, None)
+            if position is not None:
+                drivers = self.cells[position[2]]
+                drivers.discard(driver_id)
+                if not drivers:
+                    del self.cells[position[2]]
+            return position
+
+    def clear(self):
+        with self.lock:
+            self.positions.clear()
+            self.cells.clear()
+
+    def _distance(self, driver_id, latitude, longitude):
+        # Planar distance in degrees, like rides.geo.annotate_distance
+        driver_latitude, driver_longitude, _ = self.positions[driver_id]
+        return math.hypot(driver_latitude - latitude, driver_longitude - longitude)
+
+    def _closest(self, drivers, latitude, longitude):
+        # Ties go to the lowest driver id, so matching is deterministic
+        return min(((self._distance(driver_id, latitude, longitude), driver_id) for driver_id in drivers),
+                   default=None)
+
+    def nearest(self, latitude, longitude, rings=None):
+        """
+        ``(distance, driver_id)`` of the nearest available driver whose cell
+        is at most ``rings`` rings away from the point's, or None.
+
+        Rings are searched outwards until the closest driver found so far is
+        nearer than the inner edge of the next ring, which no driver of that
+        ring or beyond can beat. Once the rings cover more cells than there
+        are drivers left, the drivers are scanned instead.
+        """
+        rings = max_rings() if rings is None else rings
+        size = self.get_size()
+        x, y = cell = grid_cell(latitude, longitude, size)
+        with self.lock:
+            best = None
+            for ring in range(rings + 1):
+                if (2 * ring + 1) ** 2 > len(self.positions):
+                    return self._scan(cell, latitude, longitude, rings)
+                if best is not None:
+                    edge = min(latitude - (x - ring + 1) * size, (x + ring) * size - latitude,
+                               longitude - (y - ring + 1) * size, (y + ring) * size - longitude)
+                    if edge > best[0]:
+                        break
+                drivers = [driver_id for ring_cell in ring_cells(cell, ring)
+                           for driver_id in self.cells.get(ring_cell, ())]
+                closest = self._closest(drivers, latitude, longitude)
+                if closest is not None and (best is None or closest < best):
+                    best = closest
+            return best
+
+    def _scan(self, cell, latitude, longitude, rings):
+        x, y = cell
+        return self._closest(
+            [driver_id for driver_id, (_, _, (driver_x, driver_y)) in self.positions.items()
+             if abs(driver_x - x) <= rings and abs(driver_y - y) <= rings],
+            latitude, longitude
+        )
+
+    def match(self, rides, rings=None):
+        """
+        Pair each of ``rides`` (``(id_ride, latitude, longitude)``, in
+        priority order) with the nearest available driver, taking matched
+        drivers out of the index. Returns ``{id_ride: (driver_id, distance,
+        position)}``; rides without a driver in range are left out.
+        """
+        matches = {}
+        with self.lock:
+            for id_ride, latitude, longitude in rides:
+                if not self.positions:
+                    break
+                nearest = self.nearest(latitude, longitude, rings)
+                if nearest is not None:
+                    distance, driver_id = nearest
+                    matches[id_ride] = (driver_id, distance, self.remove(driver_id))
+        return matches
+
+    def restore(self, matches):
+        """
+        Put the drivers of unused ``matches`` back, unless they reported a
+        new position meanwhile
+        """
+        with self.lock:
+            for driver_id, _, (latitude, longitude, _) in matches.values():
+                if driver_id not in self.positions:
+                    self.update(driver_id, latitude, longitude)
+
+
+driver_index = DriverIndex()
+
+
+def start_rides(matches, index=driver_index):
+    """
+    Start the rides of ``matches`` (see DriverIndex.match) with their
+    drivers, like the ``start`` action: only rides that are still requested,
+    with users that still exist, are drivers and have no ride in progress.
+    The drivers of the other matches go back to the index, except the busy
+    ones and the users that aren't drivers (any more).
+    Returns the started ``{id_ride: (driver_id, distance)}``.
+    """
+    if not matches:
+        return {}
+    driver_ids = {driver_id for driver_id, _, _ in matches.values()}
+    busy = set(Ride.objects.filter(status='IN_PROGRESS', id_driver__in=driver_ids).values_list(
+        'id_driver', flat=True
+    ))
+    names = {
+        id_user: f'{first_name} {last_name}'
+        for id_user, first_name, last_name in User.objects.filter(
+            id_user__in=driver_ids - busy, role='driver'
+        ).values_list('id_user', 'first_name', 'last_name')
+    }
+    # Cached up front, so the bulk insert below doesn't look them up
+    # one by one (see rides.fields.Interner)
+    RideEvent._meta.get_field('description').interner.intern(
+        {f'Ride started with driver {name}' for name in names.values()}
+    )
+    now = timezone.now()
+
+    with transaction.atomic():
+        requested = set(Ride.objects.select_for_update().filter(
+            id_ride__in=list(matches), status='REQUESTED'
+        ).values_list('id_ride', flat=True))
+        started = {id_ride: match for id_ride, match in matches.items()
+                   if id_ride in requested and match[0] in names}
+        if started:
+            updated = Ride.objects.filter(id_ride__in=list(started), status='REQUESTED').update(
+                status='IN_PROGRESS',
+                id_driver=Case(*(When(id_ride=id_ride, then=driver_id)
+                                 for id_ride, (driver_id, _, _) in started.items())),
+                updated_at=now,
+            )
+            if updated != len(started):
+                index.restore({id_ride: match for id_ride, match in matches.items() if match[0] in names})
+                raise TransitionConflict()
+
+            events = RideEvent.objects.bulk_create([
+                RideEvent(
+                    id_ride_id=id_ride,
+                    description=f'Ride started with driver {names[driver_id]}',
+                    old_status='REQUESTED',
+                    new_status='IN_PROGRESS',
+                    user_id=driver_id,
+                    created_at=now,
+                )
+                for id_ride, (driver_id, _, _) in started.items()
+            ])
+            # update() and bulk_create() don't send model signals
+            response_cache.invalidate_on_commit()
+            event_broker.publish_on_commit(events)
+            rollups.status_changed('REQUESTED', 'IN_PROGRESS', len(started))
+            rollups.events_created(events)
+
+    index.restore({id_ride: match for id_ride, match in matches.items()
+                   if id_ride not in started and match[0] in names})
+    return {id_ride: (driver_id, distance) for id_ride, (driver_id, distance, _) in started.items()}
+
+
+def dispatch(batch_size=DEFAULT_BATCH_SIZE, limit=None, index=driver_index):
+    """
+    Match requested rides, earliest pickup first, to the nearest available
+    drivers and start them, ``batch_size`` rides per transaction, until
+    ``limit`` rides were looked at, no driver is left or every requested
+    ride was looked at once. Returns a list of ``{'id_ride', 'id_driver',
+    'distance'}`` dicts.
+    """
+    results = []
+    seen = 0
+    after = None
+    while len(index) and (limit is None or seen < limit):
+        rides = Ride.objects.filter(status='REQUESTED').order_by('pickup_time', 'id_ride')
+        if after is not None:
+            rides = rides.filter(pickup_time__gte=after[0]).exclude(pickup_time=after[0], id_ride__lte=after[1])
+        size = batch_size if limit is None else min(batch_size, limit - seen)
+        batch = list(rides.values_list('id_ride', 'pickup_latitude', 'pickup_longitude', 'pickup_time')[:size])
+        if not batch:
+            break
+        seen += len(batch)
+        after = batch[-1][3], batch[-1][0]
+        matches = index.match([(id_ride, latitude, longitude) for id_ride, latitude, longitude, _ in batch])
+        try:
+            started = start_rides(matches, index)
+        except TransitionConflict:
+            # A ride changed concurrently: its batch is retried next run
+            continue
+        results.extend(
+            {'id_ride': id_ride, 'id_driver': driver_id, 'distance': distance}
+            for id_ride, (driver_id, distance) in started.items()
+        )
+    return results
@@ -0,0 +1,217 @@
+"""
+Compact column types for values that repeat across millions of rows.
+
+``StatusField`` stores a ride status as a small integer and
+``InternedTextField`` stores a text as the id of its row in a lookup table.
+On the Python side both still hold plain strings, so querysets, ``values()``,
+serializers and the JSON API see exactly what a CharField would give them.
+"""
+import weakref
+
+from django.apps import apps
+from django.db import connections, models, transaction
+
+RIDE_STATUSES = ('REQUESTED', 'IN_PROGRESS', 'COMPLETED', 'CANCELLED')
+
+STATUS_CODES = {status: code for code, status in enumerate(RIDE_STATUSES, 1)}
+STATUS_NAMES = {code: status for status, code in STATUS_CODES.items()}
+
+# Stands in for unknown statuses in lookups; no row has it
+NO_CODE = 0
+
+
+class StatusField(models.CharField):
+    """
+    A ride status, stored as its index in RIDE_STATUSES
+    """
+
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault('max_length', max(len(status) for status in RIDE_STATUSES))
+        kwargs.setdefault('choices', [(status, status) for status in RIDE_STATUSES])
+        super().__init__(*args, **kwargs)
+
+    def deconstruct(self):
+        name, path, args, kwargs = super().deconstruct()
+        kwargs.pop('max_length', None)
+        kwargs.pop('choices', None)
+        return name, path, args, kwargs
+
+    def get_internal_type(self):
+        return 'SmallIntegerField'
+
+    def from_db_value(self, value, expression, connection):
+        return STATUS_NAMES.get(value, value)
+
+    def to_python(self, value):
+        if isinstance(value, int):
+            return STATUS_NAMES.get(value, str(value))
+        return super().to_python(value)
+
+    def get_prep_value(self, value):
+        value = super().get_prep_value(value)
+        if value is None:
+            return None
+        return STATUS_CODES.get(value, NO_CODE)
+
+    def get_db_prep_save(self, value, connection):
+        value = self.to_python(value)
+        if value is not None and value not in STATUS_CODES:
+            raise ValueError(f'Unknown ride status {value!r}')
+        return super().get_db_prep_save(value, connection)
+
+
+class Interner:
+    """
+    Maps texts to lookup table ids and back, per database. Rows that were
+    already in the table are cached as soon as they are read. Rows inserted
+    by an open transaction are only cached once it commits, as ids of rolled
+    back rows can be reused; until then it looks them up in the database.
+    """
+
+    def __init__(self, model):
+        self.model = model
+        self._ids = {}
+        self._texts = {}
+        # connection -> {text: pk} of the rows its open transaction inserted
+        self._uncommitted = weakref.WeakKeyDictionary()
+
+    def get_model(self):
+        return apps.get_model(self.model) if isinstance(self.model, str) else self.model
+
+    def _key(self, connection):
+        return connection.settings_dict['NAME']
+
+    def store(self, key, rows):
+        ids, texts = self._ids.setdefault(key, {}), self._texts.setdefault(key, {})
+        for pk, text in rows:
+            ids[text] = pk
+            texts[pk] = text
+
+    def uncommitted(self, connection):
+        """
+        ``{text: pk}`` of the rows inserted by the open transaction of
+        ``connection``. Outside a transaction there are none: committed rows
+        were cached by their on-commit callback, the others rolled back.
+        """
+        if not connection.in_atomic_block:
+            self._uncommitted.pop(connection, None)
+            return {}
+        return self._uncommitted.setdefault(connection, {})
+
+    def remember(self, connection, rows, inserted=False):
+        """
+        Cache ``rows`` ((pk, text) pairs); pass ``inserted=True`` for rows
+        the current transaction inserted, which are cached once it commits
+        """
+        key = self._key(connection)
+        uncommitted = self.uncommitted(connection)
+        if not inserted or not connection.in_atomic_block:
+            self.store(key, [(pk, text) for pk, text in rows if text not in uncommitted])
+            return
+        uncommitted.update((text, pk) for pk, text in rows)
+
+        # Registered with the insert: a rollback of its savepoint or
+        # transaction discards it
+        def store():
+            self.store(key, rows)
+            for _, text in rows:
+                uncommitted.pop(text, None)
+        transaction.on_commit(store, using=connection.alias)
+
+    def get_id(self, text, connection, create=True):
+        pk = self._ids.get(self._key(connection), {}).get(text)
+        if pk is not None:
+            return pk
+        queryset = self.get_model().objects.using(connection.alias)
+        if create:
+            row, created = queryset.get_or_create(text=text)
+            self.remember(connection, [(row.pk, text)], inserted=created)
+            return row.pk
+        pk = queryset.filter(text=text).values_list('pk', flat=True).first()
+        if pk is not None:
+            self.remember(connection, [(pk, text)])
+        return pk
+
+    def get_text(self, pk, connection):
+        text = self._texts.get(self._key(connection), {}).get(pk)
+        if text is None:
+            # The table is small: load all of it rather than one row per miss
+            rows = list(self.get_model().objects.using(connection.alias).values_list('pk', 'text'))
+            self.remember(connection, rows)
+            text = dict(rows).get(pk)
+        return text
+
+    def intern(self, texts, using='default'):
+        """
+        Make sure ``texts`` have rows and are cached, e.g. before inserting
+        many rows. Call it outside the transaction of the inserts, or the
+        new rows are only cached once that transaction commits.
+        """
+        connection = connections[using]
+        missing = set(texts) - set(self._ids.get(self._key(connection), {})) - set(self.uncommitted(connection))
+        if not missing:
+            return
+        model = self.get_model()
+        queryset = model.objects.using(using)
+        existing = list(queryset.filter(text__in=missing).values_list('pk', 'text'))
+        self.remember(connection, existing)
+        missing -= {text for _, text in existing}
+        if missing:
+            queryset.bulk_create([model(text=text) for text in missing], ignore_conflicts=True)
+            self.remember(connection, list(queryset.filter(text__in=missing).values_list('pk', 'text')),
+                          inserted=True)
+
+
+_interners = {}
+
+
+class InternedTextField(models.CharField):
+    """
+    Text stored as the id of its row in ``to``, a model with a unique
+    ``text`` field that only ever grows. Only equality lookups (``exact``,
+    ``in``, ``isnull``) are supported: the others, like ``icontains`` or
+    ``gt``, would compare the ids. Ordering by the field sorts by id too.
+    """
+    supported_lookups = ('exact', 'in', 'isnull')
+
+    def __init__(self, to, *args, **kwargs):
+        self.to = to
+        # Fields sharing a lookup table share its cache
+        self.interner = _interners.setdefault(to, Interner(to))
+        super().__init__(*args, **kwargs)
+
+    def deconstruct(self):
+        name, path, args, kwargs = super().deconstruct()
+        return name, path, [self.to, *args], kwargs
+
+    def get_internal_type(self):
+        return 'IntegerField'
+
+    def get_lookup(self, lookup_name):
+        # None makes the query raise FieldError (unsupported lookup)
+        if lookup_name not in self.supported_lookups:
+            return None
+        return super().get_lookup(lookup_name)
+
+    def get_transform(self, name):
+        return None
+
+    def from_db_value(self, value, expression, connection):
+        if value is None:
+            return None
+        return self.interner.get_text(value, connection)
+
+    def get_db_prep_value(self, value, connection, prepared=False):
+        # Lookups: unknown texts can't match any row
+        if not prepared:
+            value = self.get_prep_value(value)
+        if value is None:
+            return None
+        pk = self.interner.get_id(value, connection, create=False)
+        return NO_CODE if pk is None else pk
+
+    def get_db_prep_save(self, value, connection):
+        value = self.get_prep_value(value)
+        if value is None:
+            return None
+        return self.interner.get_id(value, connection)
@@ -0,0 +1,83 @@
+"""
+Grid-cell spatial index helpers for ride pickup locations.
+
+Pickup coordinates are bucketed into square cells of ``RIDE_GRID_CELL_DEGREES``
+degrees. Each ride stores its cell as two integer columns covered by a
+composite index, so a "box" of cells around a point is an index range scan
+instead of a full table scan.
+"""
+import math
+
+from django.conf import settings
+from django.db.models import ExpressionWrapper, F, FloatField, Q
+from django.db.models.functions import Power, Sqrt
+
+DEFAULT_CELL_DEGREES = 0.01
+DEFAULT_MAX_RINGS = 64
+
+
+def cell_size():
+    return getattr(settings, 'RIDE_GRID_CELL_DEGREES', DEFAULT_CELL_DEGREES)
+
+
+def grid_cell(latitude, longitude, size=None):
+    """
+    Return the (x, y) grid cell containing the given coordinates
+    """
+    size = size or cell_size()
+    return math.floor(latitude / size), math.floor(longitude / size)
+
+
+def box_q(cell, radius):
+    """
+    Q object matching every ride whose pickup cell lies within ``radius``
+    rings of ``cell`` (a square of ``2 * radius + 1`` cells per side)
+    """
+    x, y = cell
+    return Q(
+        pickup_grid_x__gte=x - radius, pickup_grid_x__lte=x + radius,
+        pickup_grid_y__gte=y - radius, pickup_grid_y__lte=y + radius,
+    )
+
+
+def annotate_distance(queryset, latitude, longitude):
+    # Planar distance in degrees; for production, consider PostGIS for
+    # geographic distance calculations
+    return queryset.annotate(
+        distance=ExpressionWrapper(
+            Sqrt(
+                Power(F('pickup_latitude') - latitude, 2) +
+                Power(F('pickup_longitude') - longitude, 2)
+            ),
+            output_field=FloatField()
+        )
+    )
+
+
+def nearest_rides(queryset, latitude, longitude, limit, max_rings=None):
+    """
+    Order ``queryset`` by distance from the given point, only looking at the
+    rides needed to answer the first ``limit`` rows.
+
+    Rides are counted in a box of cells around the caller's cell, doubling
+    its radius until it holds at least ``limit`` rides, so a sparse area
+    costs one query per doubling rather than per ring. The ``limit``-th
+    nearest ride is then at most ``(radius + 1) * sqrt(2)`` cells away, and
+    anything outside a box of that radius is further than that, so the
+    queryset is restricted to the box before the distance sort. If a box of
+    ``max_rings`` rings is not enough the full table is sorted instead, which
+    keeps the result exact.
+    """
+    if max_rings is None:
+        max_rings = getattr(settings, 'RIDE_GRID_MAX_RINGS', DEFAULT_MAX_RINGS)
+
+    cell = grid_cell(latitude, longitude)
+    radius = 0
+    while queryset.filter(box_q(cell, radius)).count() < limit:
+        if radius >= max_rings:
+            return annotate_distance(queryset, latitude, longitude).order_by('distance')
+        radius = min(max(radius * 2, 1), max_rings)
+
+    radius = math.ceil((radius + 1) * math.sqrt(2))
+    queryset = queryset.filter(box_q(cell, radius))
+    return annotate_distance(queryset, latitude, longitude).order_by('distance')
@@ -0,0 +1,52 @@
+"""
+Helpers shared by the serialization benchmarks (bench_serializers,
+bench_renderers)
+"""
+from datetime import timedelta
+import time
+
+from django.utils import timezone
+from rides.models import Ride, RideEvent, User
+
+
+def build_ride_page(ride_count, events_per_ride, user_count=20):
+    """
+    Unsaved rides shaped like a page of the prefetched list queryset, so
+    benchmarks measure serialization only and need no database
+    """
+    now = timezone.now()
+    users = [
+        User(id_user=i, username=f'user{i}', first_name='Test', last_name=f'User{i}',
+             email=f'user{i}@example.com', phone_number='555-000-0000', role='user')
+        for i in range(1, user_count + 1)
+    ]
+    rides = []
+    for i in range(ride_count):
+        ride = Ride(
+            id_ride=i + 1, status='IN_PROGRESS',
+            id_rider=users[i % user_count], id_driver=users[(i + 7) % user_count],
+            pickup_latitude=40.7128, pickup_longitude=-74.0060,
+            dropoff_latitude=40.7306, dropoff_longitude=-73.9352,
+            pickup_time=now, created_at=now, updated_at=now,
+        )
+        ride.todays_events = [
+            RideEvent(id_ride_event=i * events_per_ride + j, id_ride=ride, description='GPS update',
+                      old_status='IN_PROGRESS', new_status='IN_PROGRESS', user=users[(i + j) % user_count],
+                      created_at=now - timedelta(minutes=j))
+            for j in range(events_per_ride)
+        ]
+        rides.append(ride)
+    return rides
+
+
+def measure(func, repeat):
+    """
+    Median wall time of ``repeat`` calls of ``func``, in seconds
+    """
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    timings.sort()
+    return timings[len(timings) // 2]
@@ -0,0 +1,44 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from rides.archive import archive_cutoff, archive_events
+from rides.cache import response_cache
+from rides.models import RideEvent
+
+
+class Command(BaseCommand):
+    help = 'Moves old ride events to the ride_event_archive table'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older_than_days', type=int,
+                            help='Archive events older than this (default: RIDE_EVENTS_ARCHIVE_AFTER_DAYS, 90)')
+        parser.add_argument('--batch_size', type=int, default=5000, help='Events moved per transaction')
+        parser.add_argument('--max_batches', type=int, help='Stop after this many batches')
+        parser.add_argument('--dry_run', action='store_true', help='Only count the events to archive')
+
+    def handle(self, *args, **options):
+        days = options['older_than_days']
+        if days is None:
+            days = getattr(settings, 'RIDE_EVENTS_ARCHIVE_AFTER_DAYS', 90)
+        # Ride responses show events up to RIDE_EVENTS_MAX_WINDOW_HOURS old;
+        # those have to stay in ride_event
+        max_window_hours = getattr(settings, 'RIDE_EVENTS_MAX_WINDOW_HOURS', 24 * 7)
+        if days * 24 < max_window_hours:
+            raise CommandError(f'Events younger than RIDE_EVENTS_MAX_WINDOW_HOURS ({max_window_hours}h) '
+                               "can't be archived")
+        cutoff = archive_cutoff(days)
+
+        if options['dry_run']:
+            count = RideEvent.objects.filter(created_at__lt=cutoff).count()
+            self.stdout.write(f'{count} events created before {cutoff:%Y-%m-%d %H:%M} would be archived')
+            return
+
+        archived = 0
+        for batch, count in enumerate(archive_events(cutoff, options['batch_size']), 1):
+            archived += count
+            self.stdout.write(f'Archived {archived} events')
+            if options['max_batches'] and batch >= options['max_batches']:
+                break
+
+        if archived:
+            response_cache.invalidate()
+        self.stdout.write(self.style.SUCCESS(f'Archived {archived} events created before {cutoff:%Y-%m-%d %H:%M}'))
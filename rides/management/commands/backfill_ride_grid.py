@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from rides.models import Ride
+
+
+class Command(BaseCommand):
+    help = 'Fills in the pickup grid cell of existing rides'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Rides updated per transaction')
+        parser.add_argument('--all', action='store_true', help='Recompute every ride, not only rides without a cell')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        queryset = Ride.objects.all()
+        if not options['all']:
+            queryset = queryset.filter(pickup_grid_x__isnull=True)
+        queryset = queryset.only('id_ride', 'pickup_latitude', 'pickup_longitude').order_by('id_ride')
+
+        # Walk the table by primary key so an interrupted run can simply be restarted
+        last_id = 0
+        updated = 0
+        while True:
+            batch = list(queryset.filter(id_ride__gt=last_id)[:batch_size])
+            if not batch:
+                break
+            for ride in batch:
+                ride.update_pickup_grid()
+            with transaction.atomic():
+                Ride.objects.bulk_update(batch, ['pickup_grid_x', 'pickup_grid_y'])
+            last_id = batch[-1].id_ride
+            updated += len(batch)
+            self.stdout.write(f'Updated {updated} rides (last id {last_id})')
+
+        self.stdout.write(self.style.SUCCESS(f'Backfilled pickup grid cells for {updated} rides'))
@@ -0,0 +1,132 @@
+from datetime import timedelta
+import math
+import random
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection, connections
+from django.test.utils import setup_test_environment, teardown_test_environment
+from django.utils import timezone
+from rides import rollups
+from rides.datagen import CITIES, CITY_SPREAD_DEGREES, ensure_users
+from rides.dispatch import DEFAULT_BATCH_SIZE, DriverIndex, dispatch
+from rides.models import Ride
+
+
+def brute_force_match(drivers, rides):
+    """
+    The matching of DriverIndex.match, comparing every ride with every free
+    driver
+    """
+    free = dict(drivers)
+    matches = {}
+    for id_ride, latitude, longitude in rides:
+        nearest = min(
+            ((math.hypot(driver_latitude - latitude, driver_longitude - longitude), driver_id)
+             for driver_id, (driver_latitude, driver_longitude) in free.items()),
+            default=None
+        )
+        if nearest is None:
+            break
+        matches[id_ride] = nearest[1]
+        del free[nearest[1]]
+    return matches
+
+
+class Command(BaseCommand):
+    help = 'Measures auto-dispatch match throughput, in memory and optionally against a SQLite database'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--drivers', type=int, default=10000, help='Available drivers')
+        parser.add_argument('--rides', type=int, default=50000, help='Requested rides')
+        parser.add_argument('--batch_size', type=int, default=DEFAULT_BATCH_SIZE, help='Rides matched per batch')
+        parser.add_argument('--sample', type=int, default=2000,
+                            help='Rides matched by brute force for comparison (0 to skip)')
+        parser.add_argument('--seed', type=int, default=42, help='Random seed of the positions')
+        parser.add_argument('--end_to_end', action='store_true',
+                            help='Also seed --database and time dispatch() with its database writes')
+        parser.add_argument('--database', type=str, default=str(settings.BASE_DIR / 'dispatch_benchmark.sqlite3'),
+                            help='SQLite file for --end_to_end, recreated on every run')
+
+    def positions(self, rng, count):
+        # Clustered around the same cities as the generated rides
+        weights = [city[2] for city in CITIES]
+        positions = []
+        for _ in range(count):
+            latitude, longitude, _ = rng.choices(CITIES, weights=weights)[0]
+            positions.append((rng.gauss(latitude, CITY_SPREAD_DEGREES), rng.gauss(longitude, CITY_SPREAD_DEGREES)))
+        return positions
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        drivers = dict(enumerate(self.positions(rng, options['drivers']), 1))
+        rides = [(id_ride, latitude, longitude)
+                 for id_ride, (latitude, longitude) in enumerate(self.positions(rng, options['rides']), 1)]
+        self.stdout.write(f"{options['drivers']} drivers, {options['rides']} requested rides, "
+                          f"batches of {options['batch_size']}")
+
+        index = DriverIndex()
+        start = time.perf_counter()
+        for driver_id, (latitude, longitude) in drivers.items():
+            index.update(driver_id, latitude, longitude)
+        elapsed = time.perf_counter() - start
+        self.stdout.write(f'Index build:  {elapsed * 1000:8.1f} ms ({len(drivers) / elapsed:,.0f} updates/s)')
+
+        matches = {}
+        start = time.perf_counter()
+        for offset in range(0, len(rides), options['batch_size']):
+            matches.update(index.match(rides[offset:offset + options['batch_size']]))
+        elapsed = time.perf_counter() - start
+        distances = [distance for _, distance, _ in matches.values()]
+        self.stdout.write(
+            f'Grid match:   {elapsed * 1000:8.1f} ms, {len(matches)} matched '
+            f'({len(matches) / elapsed:,.0f} matches/s), mean distance {sum(distances) / max(len(distances), 1):.4f} degrees'
+        )
+
+        if options['sample']:
+            sample = rides[:options['sample']]
+            start = time.perf_counter()
+            expected = brute_force_match(drivers, sample)
+            elapsed = time.perf_counter() - start
+            self.stdout.write(f'Brute force:  {elapsed * 1000:8.1f} ms for the first {len(sample)} rides '
+                              f'({len(expected) / elapsed:,.0f} matches/s)')
+            actual = {id_ride: matches[id_ride][0] for id_ride, _, _ in sample if id_ride in matches}
+            if actual != expected:
+                self.stderr.write(self.style.ERROR('Grid matches differ from brute force'))
+                return
+
+        if options['end_to_end']:
+            self.end_to_end(drivers, rides, options)
+
+    def end_to_end(self, drivers, rides, options):
+        setup_test_environment(debug=False)
+        connection.settings_dict['TEST']['NAME'] = options['database']
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            [rider_id], driver_ids = ensure_users('dispatch', 1, len(drivers))
+            now = timezone.now()
+            seeded = []
+            for id_ride, latitude, longitude in rides:
+                ride = Ride(status='REQUESTED', id_rider_id=rider_id, pickup_latitude=latitude,
+                            pickup_longitude=longitude, pickup_time=now + timedelta(seconds=id_ride))
+                ride.update_pickup_grid()
+                seeded.append(ride)
+            Ride.objects.bulk_create(seeded, batch_size=5000)
+            # bulk_create doesn't send the signals that keep the rollups current
+            rollups.rebuild()
+
+            index = DriverIndex()
+            for driver_id, (latitude, longitude) in zip(driver_ids, drivers.values()):
+                index.update(driver_id, latitude, longitude)
+            start = time.perf_counter()
+            started = dispatch(options['batch_size'], index=index)
+            elapsed = time.perf_counter() - start
+            self.stdout.write(self.style.SUCCESS(
+                f'End to end:   {elapsed * 1000:8.1f} ms, {len(started)} rides started '
+                f'({len(started) / elapsed:,.0f} starts/s)'
+            ))
+        finally:
+            connections.close_all()
+            connection.settings_dict['NAME'] = old_name
+            teardown_test_environment()
@@ -0,0 +1,35 @@
+import gzip
+
+from django.core.management.base import BaseCommand
+from rest_framework.renderers import JSONRenderer
+from rides.management.commands._bench import build_ride_page, measure
+from rides.renderers import ColumnarJSONRenderer, MessagePackRenderer
+from rides.serializers import ride_representation
+
+
+class Command(BaseCommand):
+    help = 'Compares the size and encode time of a ride list page in JSON, columnar JSON and MessagePack'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rides', type=int, default=1000, help='Rides in the page')
+        parser.add_argument('--events_per_ride', type=int, default=5, help='Recent events per ride')
+        parser.add_argument('--users', type=int, default=200, help='Distinct riders/drivers in the page')
+        parser.add_argument('--repeat', type=int, default=20, help='Number of timed iterations')
+
+    def handle(self, *args, **options):
+        rides = build_ride_page(options['rides'], options['events_per_ride'], options['users'])
+        data = {'count': len(rides), 'next': None, 'previous': None,
+                'results': [ride_representation(ride) for ride in rides]}
+
+        self.stdout.write(f"Page of {options['rides']} rides with {options['events_per_ride']} events each and "
+                          f"{options['users']} users (median of {options['repeat']} runs)")
+        self.stdout.write(f"{'renderer':22} {'KB':>9} {'gzip KB':>9} {'encode ms':>10}")
+        baseline = None
+        for renderer in (JSONRenderer(), ColumnarJSONRenderer(), MessagePackRenderer()):
+            output = renderer.render(data)
+            encode = measure(lambda: renderer.render(data), options['repeat'])
+            baseline = baseline or len(output)
+            self.stdout.write(
+                f'{type(renderer).__name__:22} {len(output) / 1024:9.1f} {len(gzip.compress(output)) / 1024:9.1f} '
+                f'{encode * 1000:10.2f}  ({len(output) / baseline:.0%} of JSON)'
+            )
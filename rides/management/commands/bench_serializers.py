@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+from rest_framework.renderers import JSONRenderer
+from rides.management.commands._bench import build_ride_page, measure
+from rides.serializers import RideSerializer, ride_representation
+
+
+class Command(BaseCommand):
+    help = 'Microbenchmark of RideSerializer against the read-only fast path'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rides', type=int, default=100, help='Rides per page')
+        parser.add_argument('--events_per_ride', type=int, default=5, help='Recent events per ride')
+        parser.add_argument('--repeat', type=int, default=50, help='Number of timed iterations')
+
+    def handle(self, *args, **options):
+        rides = build_ride_page(options['rides'], options['events_per_ride'])
+        renderer = JSONRenderer()
+
+        drf_output = renderer.render(RideSerializer(rides, many=True).data)
+        fast_output = renderer.render([ride_representation(ride) for ride in rides])
+        if drf_output != fast_output:
+            self.stderr.write(self.style.ERROR('Fast path output differs from RideSerializer'))
+            return
+
+        drf = measure(lambda: RideSerializer(rides, many=True).data, options['repeat'])
+        fast = measure(lambda: [ride_representation(ride) for ride in rides], options['repeat'])
+
+        self.stdout.write(f"Page of {options['rides']} rides with {options['events_per_ride']} events each "
+                          f"(median of {options['repeat']} runs)")
+        self.stdout.write(f'RideSerializer: {drf * 1000:.2f} ms')
+        self.stdout.write(f'Fast path:      {fast * 1000:.2f} ms')
+        self.stdout.write(self.style.SUCCESS(f'Speedup: {drf / fast:.1f}x'))
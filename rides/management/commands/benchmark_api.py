@@ -0,0 +1,242 @@
+from concurrent.futures import ThreadPoolExecutor
+import json
+import math
+import platform
+import random
+import sqlite3
+import subprocess
+import time
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection, connections
+from django.test import Client
+from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from rides.datagen import GenerationPlan, ensure_users, generate
+from rides.models import Ride, RideEvent, User
+
+
+def percentile(sorted_values, fraction):
+    # Nearest-rank percentile; rounded first so that float error (0.07 * 100
+    # is 7.000000000000001) can't push a whole rank up by one
+    if not sorted_values:
+        return None
+    index = max(0, min(len(sorted_values) - 1, math.ceil(round(fraction * len(sorted_values), 9)) - 1))
+    return sorted_values[index]
+
+
+def sample_ride_ids(count, seed):
+    # Seeded, so runs over the same dataset request the same rides
+    ride_ids = list(Ride.objects.order_by('id_ride').values_list('id_ride', flat=True))
+    return random.Random(seed).sample(ride_ids, min(count, len(ride_ids)))
+
+
+class Command(BaseCommand):
+    help = 'Seeds a local SQLite database and measures API latency and throughput'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rides', type=int, default=10000, help='Rides in the seeded dataset')
+        parser.add_argument('--events_per_ride', type=int, default=10, help='Mean events per ride')
+        parser.add_argument('--riders', type=int, default=1000, help='Riders in the seeded dataset')
+        parser.add_argument('--drivers', type=int, default=200, help='Drivers in the seeded dataset')
+        parser.add_argument('--seed', type=int, default=42, help='Random seed of the dataset')
+        parser.add_argument('--requests', type=int, default=200, help='Timed requests per scenario')
+        parser.add_argument('--warmup', type=int, default=10, help='Untimed requests per scenario')
+        parser.add_argument('--concurrency', type=int, default=1, help='Client threads per scenario')
+        parser.add_argument('--scenarios', type=str, default='', help='Comma-separated scenario names (default: all)')
+        parser.add_argument('--database', type=str, default=str(settings.BASE_DIR / 'benchmark.sqlite3'),
+                            help='SQLite file holding the benchmark dataset')
+        parser.add_argument('--keepdb', action='store_true',
+                            help='Reuse the dataset in --database instead of seeding a new one')
+        parser.add_argument('--cache', action='store_true', help='Leave the ride response cache enabled')
+        parser.add_argument('--output', type=str, help='Write the JSON results to this file')
+        parser.add_argument('--compare', type=str, help='JSON results of a previous run to compare against')
+
+    def handle(self, *args, **options):
+        # DEBUG off: no query log, no debug toolbar
+        setup_test_environment(debug=False)
+        connection.settings_dict['TEST']['NAME'] = options['database']
+        old_name = connection.creation.create_test_db(
+            verbosity=0, autoclobber=True, serialize=False, keepdb=options['keepdb']
+        )
+        try:
+            cache_timeout = settings.RIDE_RESPONSE_CACHE_TIMEOUT if options['cache'] else 0
+            with override_settings(RIDE_RESPONSE_CACHE_TIMEOUT=cache_timeout):
+                results = self.run(options)
+        finally:
+            connections.close_all()
+            connection.settings_dict['NAME'] = old_name
+            teardown_test_environment()
+
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump(results, output, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Results written to {options['output']}"))
+        if options['compare']:
+            with open(options['compare']) as baseline:
+                self.compare(json.load(baseline), results)
+
+    def run(self, options):
+        if not Ride.objects.exists():
+            self.seed(options)
+
+        admin = User.objects.filter(username='benchmark_admin').first() or User.objects.create_superuser(
+            'benchmark_admin', 'benchmark_admin@example.com', 'password',
+            first_name='Benchmark', last_name='Admin', phone_number='555-000-0000'
+        )
+        token, _ = Token.objects.get_or_create(user=admin)
+        self.auth = {'HTTP_AUTHORIZATION': f'Token {token.key}'}
+
+        selected = [name for name in options['scenarios'].split(',') if name]
+        results = {}
+        for name, requests in self.scenarios(options):
+            if selected and name not in selected:
+                continue
+            results[name] = self.measure(requests, options)
+            self.report(name, results[name])
+
+        return {
+            'meta': self.metadata(options),
+            'results': results,
+        }
+
+    def seed(self, options):
+        self.stdout.write(f"Seeding {options['rides']} rides...")
+        rider_ids, driver_ids = ensure_users(f"bench{options['seed']}", options['riders'], options['drivers'])
+        plan = GenerationPlan(
+            rides=options['rides'], events_per_ride=options['events_per_ride'],
+            rider_ids=rider_ids, driver_ids=driver_ids, seed=options['seed'], batch_size=5000,
+            # Relative to now, so the recent-events window holds its usual share
+            anchor=timezone.now(),
+        )
+        rides, events, seconds = generate(plan)
+        self.stdout.write(f'Seeded {rides} rides and {events} events in {seconds:.1f}s')
+
+    def scenarios(self, options):
+        """
+        Yield ``(name, requests)`` pairs; ``requests`` is a list of
+        ``(method, path, data)`` with one entry per timed or warmup request
+        """
+        count = options['requests'] + options['warmup']
+        ride_ids = sample_ride_ids(count, options['seed'])
+        rider = User.objects.filter(role='rider').order_by('id_user').first()
+        driver = User.objects.filter(role='driver').order_by('id_user').first()
+        center = Ride.objects.order_by('id_ride').values('pickup_latitude', 'pickup_longitude').first()
+
+        def repeat(path):
+            return [('get', path, None)] * count
+
+        list_params = {
+            'list': '',
+            'list_status': '?status=REQUESTED',
+            'list_rider_email': f'?rider_email={rider.email if rider else "none"}',
+            'list_ordering_pickup_time': '?ordering=pickup_time',
+            'list_ordering_updated_at': '?ordering=-updated_at',
+            'list_deep_page': '?page=50',
+            'list_cursor': '?pagination=cursor',
+            'list_events_limit': '?events_limit=5',
+        }
+        if center:
+            list_params['list_distance'] = (
+                f"?lat={center['pickup_latitude']}&lng={center['pickup_longitude']}&sort_by_distance=true"
+            )
+        for name, query in list_params.items():
+            yield name, repeat(f'/api/rides/{query}')
+
+        yield 'detail', [('get', f'/api/rides/{pk}/', None) for pk in ride_ids]
+        yield 'ride_events', [('get', f'/api/rides/{pk}/events/', None) for pk in ride_ids]
+        yield 'events_list', [('get', f'/api/events/?ride_id={pk}', None) for pk in ride_ids]
+        yield 'events_list_cursor', repeat('/api/events/?pagination=cursor')
+
+        # Transitions consume rides, so each request gets its own ride
+        requested = list(Ride.objects.filter(status='REQUESTED').order_by('id_ride')
+                         .values_list('id_ride', flat=True)[:2 * count])
+        to_start, to_cancel = requested[:count], requested[count:]
+        if driver:
+            yield 'start', [('post', f'/api/rides/{pk}/start/', {'driver_id': driver.id_user}) for pk in to_start]
+            yield 'complete', [('post', f'/api/rides/{pk}/complete/', None) for pk in to_start]
+        yield 'cancel', [('post', f'/api/rides/{pk}/cancel/', None) for pk in to_cancel]
+
+    def measure(self, requests, options):
+        warmup, timed = requests[:options['warmup']], requests[options['warmup']:]
+
+        def send(request):
+            method, path, data = request
+            client = Client()
+            start = time.perf_counter()
+            if method == 'get':
+                response = client.get(path, **self.auth)
+            else:
+                response = client.post(path, data or {}, content_type='application/json', **self.auth)
+            return time.perf_counter() - start, response.status_code
+
+        for request in warmup:
+            send(request)
+
+        start = time.perf_counter()
+        if options['concurrency'] > 1:
+            with ThreadPoolExecutor(options['concurrency']) as executor:
+                samples = list(executor.map(send, timed))
+        else:
+            samples = [send(request) for request in timed]
+        elapsed = time.perf_counter() - start
+
+        latencies = sorted(seconds * 1000 for seconds, _ in samples)
+        return {
+            'requests': len(samples),
+            'errors': sum(1 for _, code in samples if code >= 400),
+            'throughput_rps': len(samples) / elapsed if elapsed else None,
+            'mean_ms': sum(latencies) / len(latencies) if latencies else None,
+            'p50_ms': percentile(latencies, 0.50),
+            'p95_ms': percentile(latencies, 0.95),
+            'p99_ms': percentile(latencies, 0.99),
+            'max_ms': latencies[-1] if latencies else None,
+        }
+
+    def metadata(self, options):
+        try:
+            commit = subprocess.run(
+                ['git', 'rev-parse', 'HEAD'], cwd=settings.BASE_DIR, capture_output=True, text=True
+            ).stdout.strip() or None
+        except OSError:
+            commit = None
+        return {
+            'commit': commit,
+            'timestamp': timezone.now().isoformat(),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'dataset': {
+                'rides': Ride.objects.count(),
+                'events': RideEvent.objects.count(),
+                'users': User.objects.count(),
+                'seed': options['seed'],
+            },
+            'options': {
+                key: options[key] for key in ('requests', 'warmup', 'concurrency', 'cache')
+            },
+        }
+
+    def report(self, name, result):
+        if not result['requests']:
+            self.stdout.write(f'{name:28} skipped (no data)')
+            return
+        self.stdout.write(
+            f"{name:28} p50 {result['p50_ms']:8.2f} ms  p95 {result['p95_ms']:8.2f} ms  "
+            f"p99 {result['p99_ms']:8.2f} ms  {result['throughput_rps']:8.1f} req/s"
+            + (self.style.ERROR(f"  {result['errors']} errors") if result['errors'] else '')
+        )
+
+    def compare(self, baseline, current):
+        self.stdout.write(f"\nCompared with {baseline['meta'].get('commit') or 'baseline'} (p50 / p95 ratio):")
+        for name, result in current['results'].items():
+            before = baseline['results'].get(name)
+            if not before or not before['p50_ms'] or not result['p50_ms']:
+                continue
+            p50 = result['p50_ms'] / before['p50_ms']
+            p95 = result['p95_ms'] / before['p95_ms']
+            style = self.style.SUCCESS if p50 <= 1 else self.style.WARNING
+            self.stdout.write(style(f'{name:28} {p50:6.2f}x  {p95:6.2f}x'))
@@ -0,0 +1,199 @@
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import io
+import json
+import time
+from urllib.parse import urlsplit
+from wsgiref.util import setup_testing_defaults
+
+from django.conf import settings
+from django.core.asgi import get_asgi_application
+from django.core.management.base import BaseCommand
+from django.core.wsgi import get_wsgi_application
+from django.db import connection, connections
+from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from rides.datagen import GenerationPlan, ensure_users, generate
+from rides.models import Ride, User
+
+from .benchmark_api import percentile, sample_ride_ids
+
+# (server, path prefix): the sync DRF views under WSGI (a threaded server
+# like gunicorn gthread), the same views under ASGI, and the async views
+# under ASGI
+TARGETS = (
+    ('wsgi', '/api/'),
+    ('asgi_sync_views', '/api/'),
+    ('asgi_async_views', '/api/async/'),
+)
+
+
+class Command(BaseCommand):
+    help = 'Compares concurrent read throughput of the WSGI and ASGI code paths'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rides', type=int, default=10000, help='Rides in the seeded dataset')
+        parser.add_argument('--events_per_ride', type=int, default=10, help='Mean events per ride')
+        parser.add_argument('--seed', type=int, default=42, help='Random seed of the dataset')
+        parser.add_argument('--requests', type=int, default=300, help='Timed requests per scenario and server')
+        parser.add_argument('--concurrency', type=int, default=16,
+                            help='Requests in flight (threads for WSGI, tasks on one event loop for ASGI)')
+        parser.add_argument('--database', type=str, default=str(settings.BASE_DIR / 'benchmark.sqlite3'),
+                            help='SQLite file holding the benchmark dataset')
+        parser.add_argument('--keepdb', action='store_true', help='Reuse the dataset in --database')
+        parser.add_argument('--output', type=str, help='Write the JSON results to this file')
+
+    def handle(self, *args, **options):
+        setup_test_environment(debug=False)
+        connection.settings_dict['TEST']['NAME'] = options['database']
+        old_name = connection.creation.create_test_db(
+            verbosity=0, autoclobber=True, serialize=False, keepdb=options['keepdb']
+        )
+        # The debug toolbar middleware is sync-only and isn't used in production
+        middleware = [name for name in settings.MIDDLEWARE if not name.startswith('debug_toolbar.')]
+        try:
+            with override_settings(RIDE_RESPONSE_CACHE_TIMEOUT=0, MIDDLEWARE=middleware):
+                results = self.run(options)
+        finally:
+            connections.close_all()
+            connection.settings_dict['NAME'] = old_name
+            connection.settings_dict['CONN_MAX_AGE'] = settings.DATABASES['default']['CONN_MAX_AGE']
+            teardown_test_environment()
+
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump(results, output, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Results written to {options['output']}"))
+
+    def run(self, options):
+        if not Ride.objects.exists():
+            self.stdout.write(f"Seeding {options['rides']} rides...")
+            rider_ids, driver_ids = ensure_users(f"bench{options['seed']}", 1000, 200)
+            generate(GenerationPlan(
+                rides=options['rides'], events_per_ride=options['events_per_ride'],
+                rider_ids=rider_ids, driver_ids=driver_ids, seed=options['seed'], batch_size=5000,
+                # Relative to now, so the recent-events window holds its usual share
+                anchor=timezone.now(),
+            ))
+
+        admin = User.objects.filter(username='benchmark_admin').first() or User.objects.create_superuser(
+            'benchmark_admin', 'benchmark_admin@example.com', 'password',
+            first_name='Benchmark', last_name='Admin', phone_number='555-000-0000'
+        )
+        self.token = Token.objects.get_or_create(user=admin)[0].key
+        ride_ids = sample_ride_ids(options['requests'], options['seed'])
+        connections.close_all()
+
+        scenarios = {
+            'list': ['rides/'] * options['requests'],
+            'list_status': ['rides/?status=REQUESTED'] * options['requests'],
+            'detail': [f'rides/{pk}/' for pk in ride_ids],
+            'events': [f'events/?ride_id={pk}' for pk in ride_ids],
+        }
+        wsgi, asgi = get_wsgi_application(), get_asgi_application()
+        conn_max_age = connection.settings_dict['CONN_MAX_AGE']
+
+        results = {}
+        for name, paths in scenarios.items():
+            results[name] = {}
+            for target, prefix in TARGETS:
+                urls = [prefix + path for path in paths]
+                if target == 'wsgi':
+                    connection.settings_dict['CONN_MAX_AGE'] = conn_max_age
+                    samples, elapsed = self.run_wsgi(wsgi, urls, options['concurrency'])
+                else:
+                    # As with the performance_asgi profile
+                    connection.settings_dict['CONN_MAX_AGE'] = 0
+                    samples, elapsed = asyncio.run(self.run_asgi(asgi, urls, options['concurrency']))
+                connections.close_all()
+                results[name][target] = self.summarize(samples, elapsed)
+                self.report(name, target, results[name][target])
+        return results
+
+    def run_wsgi(self, application, urls, concurrency):
+        def request(url):
+            parts = urlsplit(url)
+            environ = {
+                'PATH_INFO': parts.path, 'QUERY_STRING': parts.query, 'SERVER_NAME': 'testserver',
+                'HTTP_HOST': 'testserver', 'HTTP_AUTHORIZATION': f'Token {self.token}', 'wsgi.input': io.BytesIO(),
+            }
+            setup_testing_defaults(environ)
+            status = []
+            start = time.perf_counter()
+            body = application(environ, lambda code, headers, exc_info=None: status.append(int(code[:3])))
+            try:
+                for _ in body:
+                    pass
+            finally:
+                body.close()
+            return time.perf_counter() - start, status[0]
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(concurrency) as executor:
+            samples = list(executor.map(request, urls))
+        return samples, time.perf_counter() - start
+
+    async def run_asgi(self, application, urls, concurrency):
+        # Drive the application the way uvicorn does: one event loop, one
+        # application(scope, receive, send) call per request
+        async def request(url):
+            parts = urlsplit(url)
+            scope = {
+                'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET',
+                'scheme': 'http', 'path': parts.path, 'raw_path': parts.path.encode(),
+                'query_string': parts.query.encode(), 'root_path': '',
+                'headers': [(b'host', b'testserver'), (b'authorization', f'Token {self.token}'.encode())],
+                'server': ('testserver', 80), 'client': ('127.0.0.1', 50000),
+            }
+            status = []
+            body_sent = False
+            finished = asyncio.Event()
+
+            async def receive():
+                nonlocal body_sent
+                if not body_sent:
+                    body_sent = True
+                    return {'type': 'http.request', 'body': b'', 'more_body': False}
+                # Like a server, report the disconnect once the client is gone
+                await finished.wait()
+                return {'type': 'http.disconnect'}
+
+            async def send(message):
+                if message['type'] == 'http.response.start':
+                    status.append(message['status'])
+                elif message['type'] == 'http.response.body' and not message.get('more_body'):
+                    finished.set()
+
+            start = time.perf_counter()
+            await application(scope, receive, send)
+            return time.perf_counter() - start, status[0]
+
+        queue = list(reversed(urls))
+        samples = []
+
+        async def worker():
+            while queue:
+                samples.append(await request(queue.pop()))
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        return samples, time.perf_counter() - start
+
+    def summarize(self, samples, elapsed):
+        latencies = sorted(seconds * 1000 for seconds, _ in samples)
+        return {
+            'requests': len(samples),
+            'errors': sum(1 for _, code in samples if code >= 400),
+            'throughput_rps': len(samples) / elapsed if elapsed else None,
+            'p50_ms': percentile(latencies, 0.50),
+            'p95_ms': percentile(latencies, 0.95),
+            'p99_ms': percentile(latencies, 0.99),
+        }
+
+    def report(self, name, target, result):
+        self.stdout.write(
+            f"{name:12} {target:17} {result['throughput_rps']:8.1f} req/s  p50 {result['p50_ms']:8.2f} ms  "
+            f"p95 {result['p95_ms']:8.2f} ms  p99 {result['p99_ms']:8.2f} ms"
+            + (self.style.ERROR(f"  {result['errors']} errors") if result['errors'] else '')
+        )
@@ -0,0 +1,186 @@
+import itertools
+import json
+import shutil
+import sqlite3
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.test import Client
+from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from rides.datagen import GenerationPlan, ensure_users, generate
+from rides.models import Ride, User
+
+from .benchmark_api import percentile
+
+
+class Command(BaseCommand):
+    help = 'Compares mixed read/write API throughput under each SQLite connection profile'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rides', type=int, default=20000, help='Rides in the seeded dataset')
+        parser.add_argument('--events_per_ride', type=int, default=10, help='Mean events per ride')
+        parser.add_argument('--seed', type=int, default=42, help='Random seed of the dataset')
+        parser.add_argument('--readers', type=int, default=4, help='Threads listing rides')
+        parser.add_argument('--writers', type=int, default=2, help='Threads cancelling rides')
+        parser.add_argument('--duration', type=float, default=10, help='Seconds per profile')
+        # performance_asgi only differs in connection reuse, which these
+        # threads don't exercise
+        parser.add_argument('--profiles', type=str, default='default,performance',
+                            help='Comma-separated profiles from SQLITE_PROFILES')
+        parser.add_argument('--database', type=str, default=str(settings.BASE_DIR / 'benchmark.sqlite3'),
+                            help='SQLite file holding the seeded dataset; each profile runs on a copy')
+        parser.add_argument('--keepdb', action='store_true', help='Reuse the dataset in --database')
+        parser.add_argument('--output', type=str, help='Write the JSON results to this file')
+
+    def handle(self, *args, **options):
+        profiles = [name for name in options['profiles'].split(',') if name]
+        unknown = set(profiles) - set(settings.SQLITE_PROFILES)
+        if unknown:
+            raise CommandError(f"Unknown profiles: {', '.join(sorted(unknown))}")
+
+        setup_test_environment(debug=False)
+        settings_dict = connection.settings_dict
+        original = {key: settings_dict.get(key) for key in ('NAME', 'OPTIONS', 'CONN_MAX_AGE', 'CONN_HEALTH_CHECKS')}
+        settings_dict['TEST']['NAME'] = options['database']
+        old_name = connection.creation.create_test_db(
+            verbosity=0, autoclobber=True, serialize=False, keepdb=options['keepdb']
+        )
+        results = {}
+        try:
+            if not Ride.objects.exists():
+                self.seed(options)
+            connections.close_all()
+
+            with override_settings(RIDE_RESPONSE_CACHE_TIMEOUT=0):
+                for name in profiles:
+                    results[name] = self.run_profile(name, options)
+                    self.report(name, results[name])
+        finally:
+            connections.close_all()
+            settings_dict.update(original)
+            settings_dict['NAME'] = old_name
+            teardown_test_environment()
+
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump(results, output, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Results written to {options['output']}"))
+
+    def seed(self, options):
+        self.stdout.write(f"Seeding {options['rides']} rides...")
+        rider_ids, driver_ids = ensure_users(f"bench{options['seed']}", 1000, 200)
+        plan = GenerationPlan(
+            rides=options['rides'], events_per_ride=options['events_per_ride'],
+            rider_ids=rider_ids, driver_ids=driver_ids, seed=options['seed'], batch_size=5000,
+            # Relative to now, so the recent-events window holds its usual share
+            anchor=timezone.now(),
+        )
+        generate(plan)
+
+    def use_copy(self, name, options):
+        """
+        Point every connection at a fresh copy of the dataset, configured
+        with the profile ``name``
+        """
+        connections.close_all()
+        path = f"{options['database']}.{name}"
+        shutil.copyfile(options['database'], path)
+        # The journal mode is stored in the file; start every profile from
+        # the rollback journal like a new database
+        with sqlite3.connect(path) as db:
+            db.execute('PRAGMA journal_mode=DELETE')
+
+        profile = settings.SQLITE_PROFILES[name]
+        # Every thread's connection shares this settings dict
+        connection.settings_dict.update({
+            'NAME': path,
+            'OPTIONS': profile.get('OPTIONS', {}),
+            'CONN_MAX_AGE': profile.get('CONN_MAX_AGE', 0),
+            'CONN_HEALTH_CHECKS': profile.get('CONN_HEALTH_CHECKS', False),
+        })
+        return path
+
+    def run_profile(self, name, options):
+        self.use_copy(name, options)
+
+        admin = User.objects.create_superuser(
+            f'benchmark_{name}', f'benchmark_{name}@example.com', 'password',
+            first_name='Benchmark', last_name='Admin', phone_number='555-000-0000'
+        )
+        auth = {'HTTP_AUTHORIZATION': f'Token {Token.objects.create(user=admin).key}'}
+        ride_ids = iter(Ride.objects.filter(status__in=['REQUESTED', 'IN_PROGRESS'])
+                        .order_by('id_ride').values_list('id_ride', flat=True))
+        ride_ids_lock = threading.Lock()
+        connections.close_all()
+
+        deadline = time.perf_counter() + options['duration']
+        samples = {'read': [], 'write': []}
+        errors = {'read': 0, 'write': 0}
+        stats_lock = threading.Lock()
+
+        def record(kind, seconds, status_code):
+            with stats_lock:
+                samples[kind].append(seconds * 1000)
+                if status_code >= 400:
+                    errors[kind] += 1
+
+        def reader(index):
+            client = Client()
+            for page in itertools.cycle(range(1, 21)):
+                if time.perf_counter() >= deadline:
+                    break
+                start = time.perf_counter()
+                response = client.get(f'/api/rides/?page={page + index}', **auth)
+                record('read', time.perf_counter() - start, response.status_code)
+
+        def writer(index):
+            client = Client()
+            while time.perf_counter() < deadline:
+                with ride_ids_lock:
+                    ride_id = next(ride_ids, None)
+                if ride_id is None:
+                    break
+                start = time.perf_counter()
+                try:
+                    status_code = client.post(f'/api/rides/{ride_id}/cancel/', **auth).status_code
+                except Exception:
+                    # "database is locked" once the busy timeout runs out
+                    status_code = 500
+                record('write', time.perf_counter() - start, status_code)
+
+        threads = [threading.Thread(target=reader, args=(i,)) for i in range(options['readers'])]
+        threads += [threading.Thread(target=writer, args=(i,)) for i in range(options['writers'])]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+
+        result = {}
+        for kind in ('read', 'write'):
+            latencies = sorted(samples[kind])
+            result[kind] = {
+                'requests': len(latencies),
+                'errors': errors[kind],
+                'throughput_rps': len(latencies) / elapsed,
+                'p50_ms': percentile(latencies, 0.50),
+                'p95_ms': percentile(latencies, 0.95),
+                'p99_ms': percentile(latencies, 0.99),
+            }
+        return result
+
+    def report(self, name, result):
+        self.stdout.write(self.style.MIGRATE_HEADING(name))
+        for kind, values in result.items():
+            if not values['requests']:
+                continue
+            self.stdout.write(
+                f"  {kind:6} {values['throughput_rps']:8.1f} req/s  p50 {values['p50_ms']:8.2f} ms  "
+                f"p95 {values['p95_ms']:8.2f} ms  p99 {values['p99_ms']:8.2f} ms  errors {values['errors']}"
+            )
@@ -1,7 +1,9 @@
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
 from rides.models import Ride, RideEvent, User
+from rides import rollups
+from rides.datagen import GenerationPlan, ensure_users, generate
 from django.utils import timezone
-from datetime import timedelta
+from datetime import datetime, timedelta, timezone as dt_timezone
 import random
 
 class Command(BaseCommand):
@@ -10,8 +12,22 @@ class Command(BaseCommand):
     def add_arguments(self, parser):
         parser.add_argument('--rides', type=int, default=5, help='Number of rides to create')
         parser.add_argument('--events_per_ride', type=int, default=100, help='Number of events per ride')
+        
+        # High-volume mode
+        parser.add_argument('--bulk', action='store_true',
+                            help='Use batched bulk inserts with realistic distributions (events_per_ride becomes a mean)')
+        parser.add_argument('--riders', type=int, default=1000, help='Bulk mode: number of riders')
+        parser.add_argument('--drivers', type=int, default=200, help='Bulk mode: number of drivers')
+        parser.add_argument('--seed', type=int, default=42, help='Bulk mode: random seed')
+        parser.add_argument('--batch_size', type=int, default=5000, help='Bulk mode: rides per transaction')
+        parser.add_argument('--workers', type=int, default=1, help='Bulk mode: number of worker processes')
+        parser.add_argument('--anchor', type=str, default=None,
+                            help='Bulk mode: latest time of the data, ISO 8601 or "now" (default: a fixed date per seed)')
 
     def handle(self, *args, **options):
+        if options['bulk']:
+            return self.handle_bulk(**options)
+        
         ride_count = options['rides']
         events_per_ride = options['events_per_ride']
         
@@ -112,4 +128,40 @@ class Command(BaseCommand):
             self.stdout.write(self.style.SUCCESS(f'Created {events_per_ride} events for ride {i+1}'))
         
         self.stdout.write(self.style.SUCCESS(f'Created {ride_count} rides with {events_per_ride} events each'))
-        self.stdout.write(self.style.SUCCESS(f'Total: {ride_count * events_per_ride} ride events created')) 
\ No newline at end of file
+        self.stdout.write(self.style.SUCCESS(f'Total: {ride_count * events_per_ride} ride events created')) 
+    
+    def parse_anchor(self, value):
+        if value is None:
+            return None
+        if value == 'now':
+            return timezone.now()
+        try:
+            anchor = datetime.fromisoformat(value)
+        except ValueError:
+            raise CommandError(f'Invalid --anchor: {value}')
+        return anchor if timezone.is_aware(anchor) else timezone.make_aware(anchor, dt_timezone.utc)
+    
+    def handle_bulk(self, **options):
+        rider_ids, driver_ids = ensure_users(f"load{options['seed']}", options['riders'], options['drivers'])
+        self.stdout.write(self.style.SUCCESS(f'Using {len(rider_ids)} riders and {len(driver_ids)} drivers'))
+        
+        plan = GenerationPlan(
+            rides=options['rides'],
+            events_per_ride=options['events_per_ride'],
+            rider_ids=rider_ids,
+            driver_ids=driver_ids,
+            seed=options['seed'],
+            batch_size=options['batch_size'],
+            anchor=self.parse_anchor(options['anchor']),
+        )
+        
+        def progress(rides, events, seconds):
+            self.stdout.write(f'{rides}/{plan.rides} rides, {events} events '
+                              f'({(rides + events) / seconds:,.0f} rows/sec)')
+        
+        rides, events, seconds = generate(plan, workers=options['workers'], progress=progress)
+        # bulk_create skips the signals that keep the rollups current
+        rollups.rebuild()
+        
+        self.stdout.write(self.style.SUCCESS(f'Created {rides} rides and {events} events in {seconds:.1f}s'))
+        self.stdout.write(self.style.SUCCESS(f'Throughput: {(rides + events) / seconds:,.0f} rows/sec'))
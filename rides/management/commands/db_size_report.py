@@ -0,0 +1,58 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, OperationalError, connections
+
+
+class Command(BaseCommand):
+    help = 'Reports the on-disk size of every table and index of a SQLite database'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS, help='Database alias to report on')
+        parser.add_argument('--tables', type=str, help='Comma-separated tables to include (default: all)')
+        parser.add_argument('--json', action='store_true', help='Print the sizes as JSON')
+
+    def handle(self, *args, **options):
+        connection = connections[options['database']]
+        if connection.vendor != 'sqlite':
+            raise CommandError("db_size_report reads SQLite's dbstat table and only supports SQLite")
+
+        with connection.cursor() as cursor:
+            try:
+                cursor.execute('SELECT name, SUM(pgsize) FROM dbstat GROUP BY name')
+            except OperationalError:
+                raise CommandError('This SQLite build has no dbstat virtual table (SQLITE_ENABLE_DBSTAT_VTAB)')
+            sizes = dict(cursor.fetchall())
+            cursor.execute("SELECT name, tbl_name, type FROM sqlite_master WHERE type IN ('table', 'index')")
+            objects = cursor.fetchall()
+            cursor.execute('PRAGMA page_size')
+            page_size = cursor.fetchone()[0]
+            cursor.execute('PRAGMA page_count')
+            file_size = cursor.fetchone()[0] * page_size
+
+        wanted = set(options['tables'].split(',')) if options['tables'] else None
+        tables = {}
+        for name, table, kind in objects:
+            if wanted is not None and table not in wanted:
+                continue
+            entry = tables.setdefault(table, {'table_bytes': 0, 'index_bytes': 0, 'indexes': {}})
+            if kind == 'table':
+                entry['table_bytes'] += sizes.get(name, 0)
+            else:
+                entry['index_bytes'] += sizes.get(name, 0)
+                entry['indexes'][name] = sizes.get(name, 0)
+
+        if options['json']:
+            self.stdout.write(json.dumps({'file_bytes': file_size, 'tables': tables}, indent=2))
+            return
+
+        self.stdout.write(f"{'table':32} {'table MB':>10} {'indexes MB':>11} {'total MB':>10}")
+        for table, entry in sorted(tables.items(), key=lambda item: -(item[1]['table_bytes'] + item[1]['index_bytes'])):
+            total = entry['table_bytes'] + entry['index_bytes']
+            self.stdout.write(
+                f"{table:32} {entry['table_bytes'] / 2 ** 20:10.2f} {entry['index_bytes'] / 2 ** 20:11.2f} "
+                f"{total / 2 ** 20:10.2f}"
+            )
+            for index, size in sorted(entry['indexes'].items(), key=lambda item: -item[1]):
+                self.stdout.write(f"  {index:30} {'':10} {size / 2 ** 20:11.2f}")
+        self.stdout.write(f'File: {file_size / 2 ** 20:.2f} MB')
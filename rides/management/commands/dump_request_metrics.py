@@ -0,0 +1,45 @@
+import json
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from rides.metrics import merge_snapshots, summarize
+
+
+class Command(BaseCommand):
+    help = 'Prints the request metrics histograms written by every server process'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dir', type=str, default=None, help='Metrics directory (default: REQUEST_METRICS_DIR)')
+        parser.add_argument('--json', action='store_true', help='Print the summary as JSON')
+        parser.add_argument('--reset', action='store_true', help='Delete the metrics files after reading them')
+
+    def handle(self, *args, **options):
+        directory = options['dir'] or getattr(settings, 'REQUEST_METRICS_DIR', None)
+        if not directory:
+            raise CommandError('Set REQUEST_METRICS_DIR or pass --dir')
+
+        files = sorted(Path(directory).glob('metrics-*.json'))
+        snapshots = []
+        for path in files:
+            try:
+                snapshots.append(json.loads(path.read_text())['histograms'])
+            except (OSError, ValueError, KeyError):
+                self.stderr.write(f'Skipping unreadable {path}')
+        summary = summarize(merge_snapshots(snapshots))
+
+        if options['json']:
+            self.stdout.write(json.dumps(summary, indent=2))
+        else:
+            self.stdout.write(f'{len(snapshots)} processes; p50/p95/p99 are histogram bucket bounds (ms)')
+            for view, metrics in summary.items():
+                self.stdout.write(self.style.MIGRATE_HEADING(f"{view} ({metrics['total']['count']} requests)"))
+                for metric, values in metrics.items():
+                    if not values['count']:
+                        continue
+                    quantiles = '/'.join('-' if values[q] is None else str(values[q]) for q in ('p50', 'p95', 'p99'))
+                    self.stdout.write(f"  {metric:8} mean {values['mean']:9.2f}  p50/p95/p99 {quantiles}")
+
+        if options['reset']:
+            for path in files:
+                path.unlink(missing_ok=True)
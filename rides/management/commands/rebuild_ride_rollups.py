@@ -0,0 +1,15 @@
+import time
+
+from django.core.management.base import BaseCommand
+from rides.rollups import rebuild
+
+
+class Command(BaseCommand):
+    help = 'Recomputes the ride status counts and hourly rollups from the ride and ride event tables'
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        rows = rebuild()
+        self.stdout.write(self.style.SUCCESS(
+            f'Rebuilt ride rollups ({rows} hourly rows) in {time.perf_counter() - start:.1f}s'
+        ))
@@ -0,0 +1,30 @@
+import sqlite3
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+
+class Command(BaseCommand):
+    help = 'Copies the primary SQLite database into a local stand-in replica'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', type=str, default='replica', help='Replica alias to overwrite')
+
+    def handle(self, *args, **options):
+        alias = options['database']
+        if alias == 'default' or alias not in connections:
+            raise CommandError(f'{alias!r} is not a replica alias')
+        primary, replica = connections['default'], connections[alias]
+        if primary.vendor != 'sqlite' or replica.vendor != 'sqlite':
+            raise CommandError('Only SQLite databases can be copied; use the database server\'s replication')
+
+        # The online backup API takes a consistent snapshot while the primary
+        # stays writable
+        primary.ensure_connection()
+        replica.close()
+        target = sqlite3.connect(replica.settings_dict['NAME'])
+        try:
+            primary.connection.backup(target)
+        finally:
+            target.close()
+        self.stdout.write(self.style.SUCCESS(f"Copied {primary.settings_dict['NAME']} to {replica.settings_dict['NAME']}"))
@@ -0,0 +1,217 @@
+"""
+Per-request query and timing instrumentation that works with DEBUG off.
+
+Every database connection gets an ``execute_wrapper`` that reports each
+query to the ``QueryRecorder`` objects active in the current context (see
+``record_queries``). Context variables follow a request into the threads
+``sync_to_async`` runs its queries in, so this works for async views too.
+``RequestMetricsMiddleware`` (rides.middleware) records every request and
+feeds the totals into the process-wide ``request_metrics`` histograms. Each
+process keeps its own histograms in memory; when ``REQUEST_METRICS_DIR`` is
+set they are also written there periodically, one file per process, so
+``dump_request_metrics`` can merge the numbers of every worker.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+import atexit
+import json
+import os
+from pathlib import Path
+import threading
+import time
+
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+# Upper bounds of the histogram buckets, in milliseconds (the last bucket
+# is unbounded); for the query count metric the bounds are query counts
+BUCKET_BOUNDS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000)
+
+METRICS = ('total', 'view', 'render', 'db', 'queries')
+
+_recorders = ContextVar('rides_query_recorders', default=())
+
+
+class QueryRecorder:
+    """
+    Counts queries and the time spent in them; with ``capture=True`` it also
+    keeps the SQL like ``connection.queries``
+    """
+
+    def __init__(self, capture=False):
+        self.count = 0
+        self.seconds = 0.0
+        self.capture = capture
+        self.queries = []
+
+    def add(self, sql, elapsed):
+        self.count += 1
+        self.seconds += elapsed
+        if self.capture:
+            self.queries.append({'sql': sql, 'time': f'{elapsed:.3f}'})
+
+
+def execute_wrapper(execute, sql, params, many, context):
+    recorders = _recorders.get()
+    if not recorders:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        elapsed = time.perf_counter() - start
+        for recorder in recorders:
+            recorder.add(sql, elapsed)
+
+
+def install_execute_wrapper(connection, **kwargs):
+    if execute_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, execute_wrapper)
+
+
+connection_created.connect(install_execute_wrapper, dispatch_uid='rides.metrics')
+
+
+@contextmanager
+def record_queries(capture=False):
+    """
+    Record the queries run inside the block, including nested blocks and
+    ``sync_to_async`` calls made from it
+    """
+    # Connections opened before this module was imported missed the signal
+    for connection in connections.all(initialized_only=True):
+        install_execute_wrapper(connection)
+    recorder = QueryRecorder(capture=capture)
+    token = _recorders.set(_recorders.get() + (recorder,))
+    try:
+        yield recorder
+    finally:
+        _recorders.reset(token)
+
+
+class Histogram:
+    def __init__(self):
+        self.count = 0
+        self.sum = 0.0
+        self.buckets = [0] * (len(BUCKET_BOUNDS) + 1)
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        for index, bound in enumerate(BUCKET_BOUNDS):
+            if value <= bound:
+                self.buckets[index] += 1
+                return
+        self.buckets[-1] += 1
+
+    def merge(self, data):
+        self.count += data['count']
+        self.sum += data['sum']
+        self.buckets = [a + b for a, b in zip(self.buckets, data['buckets'])]
+
+    def quantile(self, fraction):
+        """
+        Upper bound of the bucket holding the quantile (None if unbounded)
+        """
+        if not self.count:
+            return None
+        rank = fraction * self.count
+        seen = 0
+        for index, count in enumerate(self.buckets):
+            seen += count
+            if seen >= rank:
+                return BUCKET_BOUNDS[index] if index < len(BUCKET_BOUNDS) else None
+        return None
+
+    def to_dict(self):
+        return {'count': self.count, 'sum': self.sum, 'buckets': list(self.buckets)}
+
+
+class RequestMetrics:
+    """
+    Histograms of every metric in METRICS per view, for this process
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.histograms = {}
+        self.last_flush = time.monotonic()
+
+    @property
+    def directory(self):
+        return getattr(settings, 'REQUEST_METRICS_DIR', None)
+
+    def observe(self, view, values):
+        with self._lock:
+            histograms = self.histograms.setdefault(view, {metric: Histogram() for metric in METRICS})
+            for metric, value in values.items():
+                histograms[metric].observe(value)
+        self.maybe_flush()
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                view: {metric: histogram.to_dict() for metric, histogram in histograms.items()}
+                for view, histograms in self.histograms.items()
+            }
+
+    def reset(self):
+        with self._lock:
+            self.histograms = {}
+
+    def maybe_flush(self):
+        interval = getattr(settings, 'REQUEST_METRICS_FLUSH_SECONDS', 10)
+        if self.directory and time.monotonic() - self.last_flush >= interval:
+            self.flush()
+
+    def flush(self):
+        """
+        Write this process' histograms to REQUEST_METRICS_DIR
+        """
+        if not self.directory:
+            return
+        self.last_flush = time.monotonic()
+        directory = Path(self.directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        path = directory / f'metrics-{os.getpid()}.json'
+        temporary = path.with_suffix(f'.{threading.get_ident()}.tmp')
+        temporary.write_text(json.dumps({'pid': os.getpid(), 'histograms': self.snapshot()}))
+        # Readers never see a partially written file
+        os.replace(temporary, path)
+
+
+def merge_snapshots(snapshots):
+    """
+    Merge snapshots of several processes into ``{view: {metric: Histogram}}``
+    """
+    merged = {}
+    for snapshot in snapshots:
+        for view, histograms in snapshot.items():
+            target = merged.setdefault(view, {metric: Histogram() for metric in METRICS})
+            for metric, data in histograms.items():
+                target[metric].merge(data)
+    return merged
+
+
+def summarize(merged):
+    """
+    JSON-friendly count/mean/quantiles of merged histograms
+    """
+    return {
+        view: {
+            metric: {
+                'count': histogram.count,
+                'mean': histogram.sum / histogram.count if histogram.count else None,
+                'p50': histogram.quantile(0.50),
+                'p95': histogram.quantile(0.95),
+                'p99': histogram.quantile(0.99),
+            }
+            for metric, histogram in histograms.items()
+        }
+        for view, histograms in sorted(merged.items())
+    }
+
+
+request_metrics = RequestMetrics()
+atexit.register(request_metrics.flush)
@@ -0,0 +1,98 @@
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+from .metrics import record_queries, request_metrics
+
+
+class RequestMetricsMiddleware:
+    """
+    Time every request and count its queries without relying on DEBUG.
+
+    ``view`` runs from the view call until it returns its (unrendered)
+    response, ``render`` covers DRF's serialization to the response body and
+    ``db`` is the time spent executing queries within the request. The
+    values are sent back in a ``Server-Timing`` header and added to the
+    process histograms in rides.metrics. Works in both sync (WSGI) and async
+    (ASGI) middleware chains, so async views don't get pushed onto a thread.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+            # Django would otherwise run the sync hooks through sync_to_async
+            self.process_view = self.aprocess_view
+            self.process_template_response = self.aprocess_template_response
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        if not getattr(settings, 'REQUEST_METRICS_ENABLED', True):
+            return self.get_response(request)
+
+        start = time.perf_counter()
+        request._metrics_marks = {}
+        with record_queries() as recorder:
+            response = self.get_response(request)
+        return self.finish(request, response, start, recorder)
+
+    async def __acall__(self, request):
+        if not getattr(settings, 'REQUEST_METRICS_ENABLED', True):
+            return await self.get_response(request)
+
+        start = time.perf_counter()
+        request._metrics_marks = {}
+        with record_queries() as recorder:
+            response = await self.get_response(request)
+        return self.finish(request, response, start, recorder)
+
+    def finish(self, request, response, start, recorder):
+        end = time.perf_counter()
+
+        # Requests that never reach a view (404s, middleware short-circuits)
+        # count towards the total only
+        marks = request._metrics_marks
+        view_end = marks.get('view_end', end)
+        values = {
+            'total': (end - start) * 1000,
+            'view': (view_end - marks['view_start']) * 1000 if 'view_start' in marks else 0.0,
+            'render': (end - view_end) * 1000,
+            'db': recorder.seconds * 1000,
+            'queries': recorder.count,
+        }
+
+        match = request.resolver_match
+        request_metrics.observe(f"{request.method} {match.view_name if match else 'unresolved'}", values)
+
+        if getattr(settings, 'REQUEST_METRICS_SERVER_TIMING', True):
+            response['Server-Timing'] = ', '.join([
+                f'db;dur={values["db"]:.2f};desc="{recorder.count} queries"',
+                f'view;dur={values["view"]:.2f}',
+                f'render;dur={values["render"]:.2f}',
+                f'total;dur={values["total"]:.2f}',
+            ])
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        self.mark(request, 'view_start')
+
+    def process_template_response(self, request, response):
+        # Called once the view has returned, before the response is rendered
+        self.mark(request, 'view_end')
+        return response
+
+    async def aprocess_view(self, request, view_func, view_args, view_kwargs):
+        self.mark(request, 'view_start')
+
+    async def aprocess_template_response(self, request, response):
+        self.mark(request, 'view_end')
+        return response
+
+    def mark(self, request, name):
+        if hasattr(request, '_metrics_marks'):
+            request._metrics_marks[name] = time.perf_counter()
@@ -0,0 +1,27 @@
+# Generated by Django 5.2 on 2026-10-17 18:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rides', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ride',
+            name='pickup_grid_x',
+            field=models.IntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='ride',
+            name='pickup_grid_y',
+            field=models.IntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='ride',
+            index=models.Index(fields=['pickup_grid_x', 'pickup_grid_y'], name='ride_pickup_grid_idx'),
+        ),
+    ]
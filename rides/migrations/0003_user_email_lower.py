@@ -0,0 +1,25 @@
+# Generated by Django 5.2 on 2026-10-17 19:06
+
+from django.db import migrations, models
+from django.db.models.functions import Lower
+
+
+def fill_email_lower(apps, schema_editor):
+    User = apps.get_model('rides', 'User')
+    User.objects.using(schema_editor.connection.alias).update(email_lower=Lower('email'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rides', '0002_ride_pickup_grid'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='email_lower',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=254),
+        ),
+        migrations.RunPython(fill_email_lower, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2 on 2026-10-17 19:08
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rides', '0003_user_email_lower'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RideEventArchive',
+            fields=[
+                ('id_ride_event', models.IntegerField(primary_key=True, serialize=False)),
+                ('description', models.CharField(default='Event recorded', max_length=255)),
+                ('created_at', models.DateTimeField(db_index=True)),
+                ('old_status', models.CharField(blank=True, max_length=50, null=True)),
+                ('new_status', models.CharField(blank=True, max_length=50, null=True)),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+                ('id_ride', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_events', to='rides.ride')),
+                ('user', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'db_table': 'ride_event_archive',
+            },
+        ),
+    ]
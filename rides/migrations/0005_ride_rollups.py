@@ -0,0 +1,36 @@
+# Generated by Django 5.2 on 2026-10-17 19:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rides', '0004_ride_event_archive'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RideStatusCount',
+            fields=[
+                ('status', models.CharField(max_length=50, primary_key=True, serialize=False)),
+                ('count', models.IntegerField(default=0)),
+            ],
+            options={
+                'db_table': 'ride_status_count',
+            },
+        ),
+        migrations.CreateModel(
+            name='RideHourlyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('hour', models.DateTimeField()),
+                ('status', models.CharField(max_length=50)),
+                ('count', models.IntegerField(default=0)),
+            ],
+            options={
+                'db_table': 'ride_hourly_rollup',
+                'constraints': [models.UniqueConstraint(fields=('hour', 'status'), name='ride_hourly_rollup_unique')],
+            },
+        ),
+    ]
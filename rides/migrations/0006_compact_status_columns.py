@@ -0,0 +1,115 @@
+# Generated by Django 5.2 on 2026-10-17 19:16
+
+import rides.fields
+from django.db import migrations, models
+from django.db.models import Case, CharField, OuterRef, Subquery, Value, When
+from django.db.models.functions import Cast
+
+STATUS_COLUMNS = (('Ride', 'status'), ('RideEvent', 'old_status'), ('RideEvent', 'new_status'),
+                  ('RideEventArchive', 'old_status'), ('RideEventArchive', 'new_status'))
+DESCRIPTION_MODELS = ('RideEvent', 'RideEventArchive')
+
+
+# The columns are converted in place, as text ('1', '42'), before they are
+# altered: the type change (SQLite's table copy, PostgreSQL's USING cast)
+# then turns the text into integers
+
+
+def encode(apps, schema_editor):
+    using = schema_editor.connection.alias
+    for model_name, column in STATUS_COLUMNS:
+        model = apps.get_model('rides', model_name)
+        unknown = set(
+            model.objects.using(using).exclude(**{f'{column}__in': rides.fields.RIDE_STATUSES})
+            .exclude(**{f'{column}__isnull': True}).values_list(column, flat=True).distinct()
+        )
+        if unknown:
+            raise ValueError(f'{model_name}.{column} has statuses outside RIDE_STATUSES: {sorted(unknown)}')
+        model.objects.using(using).update(**{column: Case(
+            *[When(**{column: status}, then=Value(str(code))) for status, code in rides.fields.STATUS_CODES.items()],
+            default=column,
+        )})
+
+    EventDescription = apps.get_model('rides', 'EventDescription')
+    for model_name in DESCRIPTION_MODELS:
+        model = apps.get_model('rides', model_name)
+        texts = set(model.objects.using(using).values_list('description', flat=True).distinct())
+        texts -= set(EventDescription.objects.using(using).values_list('text', flat=True))
+        EventDescription.objects.using(using).bulk_create([EventDescription(text=text) for text in texts])
+        model.objects.using(using).update(description=Cast(Subquery(
+            EventDescription.objects.using(using).filter(text=OuterRef('description')).values('pk')[:1]
+        ), CharField()))
+
+
+def decode(apps, schema_editor):
+    using = schema_editor.connection.alias
+    for model_name, column in STATUS_COLUMNS:
+        model = apps.get_model('rides', model_name)
+        model.objects.using(using).update(**{column: Case(
+            *[When(**{column: str(code)}, then=Value(status)) for status, code in rides.fields.STATUS_CODES.items()],
+            default=column,
+        )})
+
+    EventDescription = apps.get_model('rides', 'EventDescription')
+    for model_name in DESCRIPTION_MODELS:
+        model = apps.get_model('rides', model_name)
+        model.objects.using(using).update(description=Subquery(
+            EventDescription.objects.using(using).annotate(key=Cast('pk', CharField()))
+            .filter(key=OuterRef('description')).values('text')[:1]
+        ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rides', '0005_ride_rollups'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EventDescription',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('text', models.CharField(max_length=255, unique=True)),
+            ],
+            options={
+                'db_table': 'ride_event_description',
+            },
+        ),
+        migrations.RunPython(encode, decode),
+        migrations.AlterField(
+            model_name='ride',
+            name='status',
+            field=rides.fields.StatusField(db_index=True),
+        ),
+        migrations.AlterField(
+            model_name='rideevent',
+            name='description',
+            field=rides.fields.InternedTextField('rides.EventDescription', default='Event recorded', max_length=255),
+        ),
+        migrations.AlterField(
+            model_name='rideevent',
+            name='new_status',
+            field=rides.fields.StatusField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='rideevent',
+            name='old_status',
+            field=rides.fields.StatusField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='rideeventarchive',
+            name='description',
+            field=rides.fields.InternedTextField('rides.EventDescription', default='Event recorded', max_length=255),
+        ),
+        migrations.AlterField(
+            model_name='rideeventarchive',
+            name='new_status',
+            field=rides.fields.StatusField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='rideeventarchive',
+            name='old_status',
+            field=rides.fields.StatusField(blank=True, null=True),
+        ),
+    ]
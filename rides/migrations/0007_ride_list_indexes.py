@@ -0,0 +1,74 @@
+# Generated by Django 5.2 on 2026-10-17 19:27
+
+import django.db.models.deletion
+import rides.fields
+from django.db import migrations, models
+
+# Only indexes change, but SQLite's schema editor would copy the whole ride
+# table (three times) and ride_event table to apply the AlterFields below, so
+# their database side is written out as plain CREATE/DROP INDEX, with the
+# names Django generates for db_index=True
+INDEX_CHANGES = (
+    ('CREATE INDEX "ride_created_at_2a0924ee" ON "ride" ("created_at")',
+     'DROP INDEX "ride_created_at_2a0924ee"'),
+    ('CREATE INDEX "ride_updated_at_c2a7534d" ON "ride" ("updated_at")',
+     'DROP INDEX "ride_updated_at_c2a7534d"'),
+    ('DROP INDEX "ride_status_96b64fae"',
+     'CREATE INDEX "ride_status_96b64fae" ON "ride" ("status")'),
+    ('DROP INDEX "ride_event_id_ride_id_cbd13a86"',
+     'CREATE INDEX "ride_event_id_ride_id_cbd13a86" ON "ride_event" ("id_ride_id")'),
+)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rides', '0006_compact_status_columns'),
+    ]
+
+    operations = [
+        # The composites first: they replace the indexes dropped below
+        migrations.AddIndex(
+            model_name='ride',
+            index=models.Index(fields=['status', 'created_at'], name='ride_status_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ride',
+            index=models.Index(fields=['status', 'pickup_time'], name='ride_status_pickup_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ride',
+            index=models.Index(fields=['status', 'updated_at'], name='ride_status_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='rideevent',
+            index=models.Index(
+                fields=['id_ride', '-created_at', '-id_ride_event'], name='ride_event_ride_created_idx'
+            ),
+        ),
+        migrations.SeparateDatabaseAndState(
+            database_operations=[migrations.RunSQL(sql, reverse_sql) for sql, reverse_sql in INDEX_CHANGES],
+            state_operations=[
+                migrations.AlterField(
+                    model_name='ride',
+                    name='created_at',
+                    field=models.DateTimeField(auto_now_add=True, db_index=True),
+                ),
+                migrations.AlterField(
+                    model_name='ride',
+                    name='status',
+                    field=rides.fields.StatusField(),
+                ),
+                migrations.AlterField(
+                    model_name='ride',
+                    name='updated_at',
+                    field=models.DateTimeField(auto_now=True, db_index=True),
+                ),
+                migrations.AlterField(
+                    model_name='rideevent',
+                    name='id_ride',
+                    field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='events', to='rides.ride'),
+                ),
+            ],
+        ),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 5.2 on 2026-10-17 21:02
+
+from collections import Counter
+from datetime import timezone
+
+from django.db import migrations
+from django.db.models import Count, F
+from django.db.models.functions import TruncHour
+
+
+# 0005 created the rollup tables empty, so databases that already had rides
+# would serve zero counts until someone ran rebuild_ride_rollups. Same
+# computation as rides.rollups.rebuild(), frozen here on the historical
+# models.
+def seed_rollups(apps, schema_editor):
+    using = schema_editor.connection.alias
+    Ride = apps.get_model('rides', 'Ride')
+    RideStatusCount = apps.get_model('rides', 'RideStatusCount')
+    RideHourlyRollup = apps.get_model('rides', 'RideHourlyRollup')
+
+    hourly = Counter()
+    utc_hour = TruncHour('created_at', tzinfo=timezone.utc)
+    rides = Ride.objects.using(using)
+    for row in rides.annotate(hour=utc_hour).values('hour').annotate(count=Count('pk')).order_by():
+        hourly[row['hour'], 'REQUESTED'] += row['count']
+    for model_name in ('RideEvent', 'RideEventArchive'):
+        changes = apps.get_model('rides', model_name).objects.using(using).exclude(
+            old_status__isnull=True
+        ).exclude(new_status__isnull=True).exclude(old_status=F('new_status'))
+        rows = changes.annotate(hour=utc_hour).values('hour', 'new_status').annotate(count=Count('pk')).order_by()
+        for row in rows:
+            hourly[row['hour'], row['new_status']] += row['count']
+
+    RideStatusCount.objects.using(using).all().delete()
+    RideStatusCount.objects.using(using).bulk_create([
+        RideStatusCount(status=row['status'], count=row['count'])
+        for row in rides.values('status').annotate(count=Count('pk')).order_by()
+    ])
+    RideHourlyRollup.objects.using(using).all().delete()
+    RideHourlyRollup.objects.using(using).bulk_create([
+        RideHourlyRollup(hour=hour, status=status, count=count) for (hour, status), count in hourly.items()
+    ], batch_size=5000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rides', '0007_ride_list_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(seed_rollups, migrations.RunPython.noop, elidable=True),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.2 on 2026-10-17 23:10
+
+import math
+
+from django.conf import settings
+from django.db import migrations
+
+BATCH_SIZE = 1000
+
+
+# 0002 added the pickup grid columns empty, so rides created before it were
+# invisible to distance sorting until someone ran backfill_ride_grid. Same
+# cell formula as rides.geo.grid_cell(), frozen here on the historical model.
+def fill_pickup_grid(apps, schema_editor):
+    Ride = apps.get_model('rides', 'Ride')
+    size = getattr(settings, 'RIDE_GRID_CELL_DEGREES', 0.01)
+    rides = Ride.objects.using(schema_editor.connection.alias).filter(pickup_grid_x__isnull=True).only(
+        'id_ride', 'pickup_latitude', 'pickup_longitude'
+    ).order_by('id_ride')
+
+    last_id = 0
+    while True:
+        batch = list(rides.filter(id_ride__gt=last_id)[:BATCH_SIZE])
+        if not batch:
+            break
+        for ride in batch:
+            ride.pickup_grid_x = math.floor(ride.pickup_latitude / size)
+            ride.pickup_grid_y = math.floor(ride.pickup_longitude / size)
+        Ride.objects.using(schema_editor.connection.alias).bulk_update(batch, ['pickup_grid_x', 'pickup_grid_y'])
+        last_id = batch[-1].id_ride
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rides', '0008_seed_ride_rollups'),
+    ]
+
+    operations = [
+        migrations.RunPython(fill_pickup_grid, migrations.RunPython.noop, elidable=True),
+    ]
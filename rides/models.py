@@ -1,7 +1,12 @@
-from django.db import models
+from datetime import timedelta
+from django.db import models, transaction
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
 from django.core.validators import MinValueValidator
 from django.contrib.auth.models import AbstractBaseUser, BaseUserManager, PermissionsMixin
 from django.utils import timezone
+from .fields import InternedTextField, StatusField
+from .geo import grid_cell
 
 class UserManager(BaseUserManager):
     def create_user(self, username, email, password=None, **extra_fields):
@@ -32,6 +37,9 @@ class User(AbstractBaseUser, PermissionsMixin):
     first_name = models.CharField(max_length=100)
     last_name = models.CharField(max_length=100)
     email = models.EmailField(unique=True)
+    # Lowercased copy of email, kept in sync on save, for indexed (prefix)
+    # searches (see rides.queries)
+    email_lower = models.CharField(max_length=254, db_index=True, editable=False, default='')
     phone_number = models.CharField(max_length=20)
     
     # Django authentication fields
@@ -61,13 +69,24 @@ class User(AbstractBaseUser, PermissionsMixin):
     
     def get_short_name(self):
         return self.first_name
+    
+    def update_email_lower(self):
+        self.email_lower = (self.email or '').lower()
+    
+    def save(self, *args, **kwargs):
+        self.update_email_lower()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'email' in update_fields:
+            kwargs['update_fields'] = set(update_fields) | {'email_lower'}
+        super().save(*args, **kwargs)
 
 class Ride(models.Model):
     """
     Ride model matching the provided schema
     """
     id_ride = models.AutoField(primary_key=True)
-    status = models.CharField(max_length=50, db_index=True)
+    # Indexed through the (status, ...) composites below
+    status = StatusField()
     id_rider = models.ForeignKey(User, on_delete=models.CASCADE, related_name='rides_as_rider', to_field='id_user')
     id_driver = models.ForeignKey(User, on_delete=models.SET_NULL, related_name='rides_as_driver', null=True, blank=True, to_field='id_user')
     pickup_latitude = models.FloatField(db_index=True)
@@ -76,34 +95,177 @@ class Ride(models.Model):
     dropoff_longitude = models.FloatField(default=0.0)
     pickup_time = models.DateTimeField(db_index=True)
     
+    # Grid cell of the pickup location, kept in sync on save (see rides.geo)
+    pickup_grid_x = models.IntegerField(null=True, blank=True, editable=False)
+    pickup_grid_y = models.IntegerField(null=True, blank=True, editable=False)
+    
     # Additional fields for compatibility with existing code
-    created_at = models.DateTimeField(auto_now_add=True)
-    updated_at = models.DateTimeField(auto_now=True)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
     
     class Meta:
         db_table = 'ride'
+        indexes = [
+            models.Index(fields=['pickup_grid_x', 'pickup_grid_y'], name='ride_pickup_grid_idx'),
+            # One per list ordering, so ?status= lists come out of the index
+            # already sorted (see QueryPlanTests). Ascending: read backwards
+            # they also give the primary key tie-break of the cursor pages in
+            # descending order.
+            models.Index(fields=['status', 'created_at'], name='ride_status_created_idx'),
+            models.Index(fields=['status', 'pickup_time'], name='ride_status_pickup_idx'),
+            models.Index(fields=['status', 'updated_at'], name='ride_status_updated_idx'),
+        ]
     
     def __str__(self):
         return f"Ride {self.id_ride}: {self.status} - {self.pickup_time}"
+    
+    def update_pickup_grid(self):
+        self.pickup_grid_x, self.pickup_grid_y = grid_cell(self.pickup_latitude, self.pickup_longitude)
+    
+    # The status as last read from or written to the database, so saves can
+    # tell the rollups what changed without reading it again (rides.signals)
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance.remember_loaded_status()
+        return instance
+    
+    def refresh_from_db(self, using=None, fields=None, from_queryset=None):
+        super().refresh_from_db(using=using, fields=fields, from_queryset=from_queryset)
+        if fields is None or 'status' in fields:
+            self.remember_loaded_status()
+    
+    def remember_loaded_status(self):
+        if 'status' in self.__dict__:
+            self._loaded_status = self.status
+    
+    def save(self, *args, **kwargs):
+        self.update_pickup_grid()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and {'pickup_latitude', 'pickup_longitude'} & set(update_fields):
+            kwargs['update_fields'] = set(update_fields) | {'pickup_grid_x', 'pickup_grid_y'}
+        # The rollups (rides.rollups) are updated by post_save, in the same
+        # transaction as the ride
+        with transaction.atomic(using=kwargs.get('using'), savepoint=False):
+            super().save(*args, **kwargs)
+
+class EventDescription(models.Model):
+    """
+    Distinct ride event descriptions; events store the id (see
+    rides.fields.InternedTextField). Rows are never updated or deleted.
+    """
+    text = models.CharField(max_length=255, unique=True)
+    
+    class Meta:
+        db_table = 'ride_event_description'
+    
+    def __str__(self):
+        return self.text
+
+class RideEventQuerySet(models.QuerySet):
+    def recent(self, hours=24, limit=None):
+        """
+        Events from the last ``hours`` hours. With a ``limit``, only the latest
+        ``limit`` events of each ride are kept; the cap is applied in SQL with
+        a ROW_NUMBER() window partitioned by ride.
+        """
+        queryset = self.filter(created_at__gte=timezone.now() - timedelta(hours=hours))
+        if limit is not None:
+            queryset = queryset.annotate(
+                recent_rank=Window(
+                    RowNumber(),
+                    partition_by=F('id_ride'),
+                    order_by=[F('created_at').desc(), F('id_ride_event').desc()]
+                )
+            ).filter(recent_rank__lte=limit)
+        return queryset
 
 class RideEvent(models.Model):
     """
     RideEvent model matching the provided schema
     """
     id_ride_event = models.AutoField(primary_key=True)
-    id_ride = models.ForeignKey(Ride, on_delete=models.CASCADE, related_name='events', to_field='id_ride')
-    description = models.CharField(max_length=255, default="Event recorded")
+    # Indexed through ride_event_ride_created_idx
+    id_ride = models.ForeignKey(
+        Ride, on_delete=models.CASCADE, related_name='events', to_field='id_ride', db_index=False
+    )
+    description = InternedTextField('rides.EventDescription', max_length=255, default="Event recorded")
     created_at = models.DateTimeField(db_index=True, default=timezone.now)
     
     # Additional field to track user who created the event
     user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, to_field='id_user')
     
     # For compatibility with existing code
-    old_status = models.CharField(max_length=50, null=True, blank=True)
-    new_status = models.CharField(max_length=50, null=True, blank=True)
+    old_status = StatusField(null=True, blank=True)
+    new_status = StatusField(null=True, blank=True)
+    
+    objects = RideEventQuerySet.as_manager()
     
     class Meta:
         db_table = 'ride_event'
+        indexes = [
+            # The events of a ride, newest first, the recent-events prefetch
+            # (id_ride IN (...) AND created_at >= ?) and its per-ride
+            # ROW_NUMBER() window, which orders by id_ride, -created_at and
+            # -id_ride_event
+            models.Index(fields=['id_ride', '-created_at', '-id_ride_event'], name='ride_event_ride_created_idx'),
+        ]
+    
+    def save(self, *args, **kwargs):
+        with transaction.atomic(using=kwargs.get('using'), savepoint=False):
+            super().save(*args, **kwargs)
     
     def __str__(self):
         return f"Event {self.id_ride_event} for Ride {self.id_ride_id}: {self.description}"
+
+class RideEventArchive(models.Model):
+    """
+    Ride events moved out of ride_event once they are old (see rides.archive).
+    Rows keep the id they had in ride_event.
+    """
+    id_ride_event = models.IntegerField(primary_key=True)
+    id_ride = models.ForeignKey(Ride, on_delete=models.CASCADE, related_name='archived_events', to_field='id_ride')
+    description = InternedTextField('rides.EventDescription', max_length=255, default="Event recorded")
+    created_at = models.DateTimeField(db_index=True)
+    user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, to_field='id_user', related_name='+')
+    old_status = StatusField(null=True, blank=True)
+    new_status = StatusField(null=True, blank=True)
+    archived_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        db_table = 'ride_event_archive'
+    
+    def __str__(self):
+        return f"Archived event {self.id_ride_event} for Ride {self.id_ride_id}: {self.description}"
+
+class RideStatusCount(models.Model):
+    """
+    Number of rides per status, kept current with every ride change (see
+    rides.rollups)
+    """
+    status = models.CharField(max_length=50, primary_key=True)
+    count = models.IntegerField(default=0)
+    
+    class Meta:
+        db_table = 'ride_status_count'
+    
+    def __str__(self):
+        return f"{self.status}: {self.count}"
+
+class RideHourlyRollup(models.Model):
+    """
+    Rides that entered a status per hour (UTC): requests are counted by ride
+    creation time, other statuses by their status-change events
+    """
+    hour = models.DateTimeField()
+    status = models.CharField(max_length=50)
+    count = models.IntegerField(default=0)
+    
+    class Meta:
+        db_table = 'ride_hourly_rollup'
+        constraints = [
+            models.UniqueConstraint(fields=['hour', 'status'], name='ride_hourly_rollup_unique'),
+        ]
+    
+    def __str__(self):
+        return f"{self.hour:%Y-%m-%d %H:00} {self.status}: {self.count}"
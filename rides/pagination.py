@@ -0,0 +1,162 @@
+import base64
+import json
+from collections import OrderedDict
+
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.pagination import BasePagination, _positive_int
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor pagination keyed on ``(ordering field, primary key)``.
+
+    Each page is fetched with a ``WHERE (field, pk) < (value, pk)`` style
+    condition instead of an ``OFFSET``, and no ``COUNT(*)`` is issued, so deep
+    pages cost the same as the first one. The primary key breaks ties between
+    rows sharing the same ordering value.
+    """
+    cursor_query_param = 'cursor'
+    page_size = 10
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    ordering_fields = ()
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        self.field, self.descending = self.get_ordering(queryset)
+        self.model_field = queryset.model._meta.get_field(self.field)
+        self.pk_name = queryset.model._meta.pk.name
+
+        cursor = self.decode_cursor(request)
+        reverse = bool(cursor and cursor['r'])
+        descending = self.descending != reverse
+        prefix = '-' if descending else ''
+        queryset = queryset.order_by(prefix + self.field, prefix + self.pk_name)
+
+        if cursor is not None:
+            lookup = 'lt' if descending else 'gt'
+            queryset = queryset.filter(
+                Q(**{f'{self.field}__{lookup}': cursor['v']}) |
+                Q(**{self.field: cursor['v'], f'{self.pk_name}__{lookup}': cursor['k']})
+            )
+
+        results = list(queryset[:self.page_size + 1])
+        has_more = len(results) > self.page_size
+        results = results[:self.page_size]
+        if reverse:
+            results.reverse()
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next, self.has_previous = has_more, cursor is not None
+
+        self.page = results
+        return results
+
+    def get_page_size(self, request):
+        if self.page_size_query_param:
+            try:
+                return _positive_int(
+                    request.query_params[self.page_size_query_param],
+                    strict=True,
+                    cutoff=self.max_page_size
+                )
+            except (KeyError, ValueError):
+                pass
+        return self.page_size
+
+    def get_ordering(self, queryset):
+        ordering = queryset.query.order_by
+        if not ordering:
+            raise ValidationError({'ordering': 'Cursor pagination requires an ordering'})
+        term = ordering[0]
+        if not isinstance(term, str) or term.lstrip('-') not in self.ordering_fields:
+            raise ValidationError({'ordering': f'Cursor pagination does not support ordering by {term}'})
+        return term.lstrip('-'), term.startswith('-')
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            cursor = json.loads(base64.urlsafe_b64decode(encoded.encode('ascii')))
+            value = self.model_field.to_python(cursor['v'])
+            if value is None:
+                raise ValueError(cursor['v'])
+            return {'v': value, 'k': int(cursor['k']), 'r': bool(cursor['r'])}
+        except (TypeError, ValueError, KeyError, UnicodeError, DjangoValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, instance, reverse):
+        cursor = {
+            'v': self.model_field.value_to_string(instance),
+            'k': getattr(instance, self.pk_name),
+            'r': int(reverse),
+        }
+        encoded = base64.urlsafe_b64encode(json.dumps(cursor, separators=(',', ':')).encode('ascii'))
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded.decode('ascii'))
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        return self.encode_cursor(self.page[0], reverse=True)
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data)
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+
+class RideCursorPagination(KeysetPagination):
+    ordering_fields = ('created_at', 'pickup_time', 'updated_at')
+
+
+class RideEventCursorPagination(KeysetPagination):
+    ordering_fields = ('created_at',)
+
+
+class PaginationModeMixin:
+    """
+    Lets clients opt into cursor pagination with ``?pagination=cursor`` (or by
+    following a ``cursor`` link) while ``pagination_class`` stays the default
+    """
+    cursor_pagination_class = None
+    pagination_mode_query_param = 'pagination'
+
+    @property
+    def paginator(self):
+        if not hasattr(self, '_paginator') and self.use_cursor_pagination():
+            self._paginator = self.cursor_pagination_class()
+        return super().paginator
+
+    def use_cursor_pagination(self):
+        if self.cursor_pagination_class is None:
+            return False
+        params = self.request.query_params
+        return (params.get(self.pagination_mode_query_param) == 'cursor'
+                or self.cursor_pagination_class.cursor_query_param in params)
@@ -0,0 +1,77 @@
+"""
+Query building shared by the ride and ride event endpoints
+"""
+import sys
+
+from django.conf import settings
+
+
+def filter_rides(queryset, query_params):
+    """
+    Apply the ``status`` and ``rider_email`` filters of the ride list
+    """
+    # Filter by status
+    status = query_params.get('status')
+    if status:
+        queryset = queryset.filter(status=status.upper())
+    
+    # Filter by rider email
+    rider_email = query_params.get('rider_email')
+    if rider_email:
+        queryset = filter_rider_email(queryset, rider_email, query_params.get('rider_email_match'))
+    
+    return queryset
+
+
+def filter_rider_email(queryset, value, match=None):
+    """
+    Filter rides on their rider's email. ``prefix`` (the default) and
+    ``exact`` compare against the indexed ``user.email_lower`` column and are
+    case-insensitive; ``contains`` is the old substring match, which can't use
+    an index and scans the rides.
+    """
+    value = value.lower()
+    if match == 'contains':
+        return queryset.filter(id_rider__email__icontains=value)
+    if match == 'exact':
+        return queryset.filter(id_rider__email_lower=value)
+    # A range rather than LIKE 'value%', which SQLite only runs on an index
+    # with NOCASE collation
+    queryset = queryset.filter(id_rider__email_lower__gte=value)
+    if ord(value[-1]) < sys.maxunicode:
+        queryset = queryset.filter(id_rider__email_lower__lt=value[:-1] + chr(ord(value[-1]) + 1))
+    return queryset
+
+
+def filter_ride_events(queryset, query_params):
+    """
+    Apply the ``ride_id`` filter of the ride event list
+    """
+    ride_id = query_params.get('ride_id')
+    if ride_id:
+        queryset = queryset.filter(id_ride=ride_id)
+    return queryset
+
+
+def get_recent_events_window(query_params):
+    """
+    Read the recent-events window (hours) and per-ride cap from the
+    ``events_window_hours`` and ``events_limit`` query parameters
+    """
+    hours = getattr(settings, 'RIDE_EVENTS_WINDOW_HOURS', 24)
+    max_hours = getattr(settings, 'RIDE_EVENTS_MAX_WINDOW_HOURS', 24 * 7)
+    limit = getattr(settings, 'RIDE_EVENTS_LIMIT', None)
+    
+    # Invalid values are ignored, like the other list parameters
+    try:
+        hours = min(max(int(query_params['events_window_hours']), 1), max_hours)
+    except (KeyError, ValueError, TypeError):
+        pass
+    try:
+        value = int(query_params['events_limit'])
+    except (KeyError, ValueError, TypeError):
+        pass
+    else:
+        if value >= 0:
+            limit = value
+    return hours, limit
@@ -0,0 +1,197 @@
+import csv
+import io
+import json
+import struct
+
+from rest_framework.renderers import BaseRenderer
+from rest_framework.settings import api_settings
+from rest_framework.utils.encoders import JSONEncoder
+
+
+class NDJSONRenderer(BaseRenderer):
+    """
+    Newline-delimited JSON. Exports stream their rows themselves (see
+    rides.export); this renders the non-streamed payloads, such as errors,
+    as a single line.
+    """
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return json.dumps(data, cls=JSONEncoder, ensure_ascii=False).encode('utf-8') + b'\n'
+
+
+class CSVRenderer(BaseRenderer):
+    """
+    CSV. Exports stream their rows themselves (see rides.export); this renders
+    the non-streamed payloads, such as errors, as a header and a single row.
+    """
+    media_type = 'text/csv'
+    format = 'csv'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        if not isinstance(data, dict):
+            data = {'detail': data}
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(data.keys())
+        writer.writerow(data.values())
+        return buffer.getvalue().encode('utf-8')
+
+
+def to_columns(data):
+    """
+    Column-oriented form of a list response (a list of rows, or a page with
+    the rows in ``results``): each table is ``{'length': rows, 'columns':
+    {key: [value per row]}}``. Nested users (dicts with an ``id_user``) are
+    replaced by their id and listed once in ``users``; nested lists of rows,
+    such as ``todays_ride_events``, are flattened into a table of their own
+    under ``tables``, whose ``lengths`` give the number of nested rows of
+    each row. Anything else is returned unchanged.
+    """
+    if isinstance(data, dict) and isinstance(data.get('results'), list):
+        users = {}
+        return {**data, 'results': _table(data['results'], users), 'users': users}
+    if isinstance(data, list):
+        users = {}
+        return {'results': _table(data, users), 'users': users}
+    return data
+
+
+def _table(rows, users):
+    names = {}
+    for row in rows:
+        names.update(dict.fromkeys(row))
+    columns = {}
+    tables = {}
+    for name in names:
+        values = [row.get(name) for row in rows]
+        if any(isinstance(value, list) for value in values):
+            nested = [item for value in values if value for item in value]
+            tables[name] = {'lengths': [len(value) if value else 0 for value in values], **_table(nested, users)}
+            continue
+        for index, value in enumerate(values):
+            if isinstance(value, dict) and 'id_user' in value:
+                users.setdefault(str(value['id_user']), value)
+                values[index] = value['id_user']
+        columns[name] = values
+    table = {'length': len(rows), 'columns': columns}
+    if tables:
+        table['tables'] = tables
+    return table
+
+
+class ColumnarJSONRenderer(BaseRenderer):
+    """
+    JSON in the column-oriented form of to_columns, which doesn't repeat
+    every key and every rider/driver on every row
+    """
+    media_type = 'application/vnd.wingz.columnar+json'
+    format = 'columnar'
+    charset = None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return json.dumps(to_columns(data), cls=JSONEncoder, ensure_ascii=False, separators=(',', ':')).encode()
+
+
+def packb(value):
+    """
+    MessagePack encoding of the JSON types; other values (dates, decimals...)
+    are packed as DRF's JSON encoder would represent them
+    """
+    chunks = []
+    _pack(value, chunks.append, JSONEncoder().default)
+    return b''.join(chunks)
+
+
+_FLOAT = struct.Struct('>Bd')
+_STR_CODES = ((0xd9, struct.Struct('>BB')), (0xda, struct.Struct('>BH')), (0xdb, struct.Struct('>BI')))
+_ARRAY_CODES = ((0xdc, struct.Struct('>BH')), (0xdd, struct.Struct('>BI')))
+_MAP_CODES = ((0xde, struct.Struct('>BH')), (0xdf, struct.Struct('>BI')))
+_UINT_CODES = ((0xcc, struct.Struct('>BB')), (0xcd, struct.Struct('>BH')), (0xce, struct.Struct('>BI')),
+               (0xcf, struct.Struct('>BQ')))
+_INT_CODES = ((0xd0, struct.Struct('>Bb')), (0xd1, struct.Struct('>Bh')), (0xd2, struct.Struct('>Bi')),
+              (0xd3, struct.Struct('>Bq')))
+# Positive and negative fixints
+_BYTES = {value: struct.pack('>b', value) for value in range(-0x20, 0)}
+_BYTES.update({value: bytes((value,)) for value in range(0x80)})
+
+
+def _pack_header(length, write, fix_code, fix_limit, codes):
+    if length < fix_limit:
+        write(bytes((fix_code | length,)))
+        return
+    for code, packer in codes:
+        if length < 1 << (8 * (packer.size - 1)):
+            write(packer.pack(code, length))
+            return
+    raise ValueError(f'Too long for MessagePack: {length}')
+
+
+def _pack(value, write, default):
+    kind = type(value)
+    if kind is str:
+        encoded = value.encode('utf-8')
+        _pack_header(len(encoded), write, 0xa0, 32, _STR_CODES)
+        write(encoded)
+    elif value is None:
+        write(b'\xc0')
+    elif kind is bool:
+        write(b'\xc3' if value else b'\xc2')
+    elif kind is int:
+        if -0x20 <= value < 0x80:
+            write(_BYTES[value])
+            return
+        for code, packer in _UINT_CODES if value >= 0 else _INT_CODES:
+            try:
+                write(packer.pack(code, value))
+                return
+            except struct.error:
+                continue
+        raise ValueError(f'Integer too large for MessagePack: {value}')
+    elif kind is float:
+        write(_FLOAT.pack(0xcb, value))
+    elif kind is list or kind is tuple:
+        _pack_header(len(value), write, 0x90, 16, _ARRAY_CODES)
+        for item in value:
+            _pack(item, write, default)
+    elif isinstance(value, dict):
+        _pack_header(len(value), write, 0x80, 16, _MAP_CODES)
+        for key, item in value.items():
+            _pack(key, write, default)
+            _pack(item, write, default)
+    else:
+        # Subclasses (such as DRF's ReturnList) as their base type
+        for base in (str, bool, int, float, list):
+            if isinstance(value, base):
+                _pack(base(value), write, default)
+                return
+        _pack(default(value), write, default)
+
+
+class MessagePackRenderer(BaseRenderer):
+    """
+    MessagePack (binary) encoding of the column-oriented form of to_columns
+    """
+    media_type = 'application/x-msgpack'
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return packb(to_columns(data))
+
+
+# The ride and event endpoints also answer in the compact formats, with
+# Accept or ?format=columnar|msgpack
+LIST_RENDERER_CLASSES = [*api_settings.DEFAULT_RENDERER_CLASSES, ColumnarJSONRenderer, MessagePackRenderer]
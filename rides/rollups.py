@@ -0,0 +1,128 @@
+"""
+Ride counts per status and per hour, maintained incrementally.
+
+``ride_status_count`` holds the number of rides in each status.
+``ride_hourly_rollup`` holds, per UTC hour, the rides requested (by ride
+creation time) and the rides that moved to each other status (by the
+status-change events: events whose ``old_status`` is set and differs from
+``new_status``, archived ones included).
+
+Ride and event saves/deletes update them through rides.signals, in the
+transaction of the change; the transitions, which use ``update()`` and
+``bulk_create()``, update them directly. Bulk inserts that skip signals
+(the ``create_test_data --bulk`` generator, fixtures) leave them stale until
+``rebuild_ride_rollups`` recomputes both tables from the rows.
+"""
+from collections import Counter
+from datetime import timedelta, timezone as dt_timezone
+
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models import Count, F
+from django.db.models.functions import TruncHour
+from django.utils import timezone
+
+from .models import Ride, RideEvent, RideEventArchive, RideHourlyRollup, RideStatusCount
+
+REQUESTED = 'REQUESTED'
+
+
+def hour_bucket(value):
+    return value.astimezone(dt_timezone.utc).replace(minute=0, second=0, microsecond=0)
+
+
+def is_status_change(event):
+    return bool(event.old_status) and bool(event.new_status) and event.old_status != event.new_status
+
+
+def _add(model, delta, **lookup):
+    # An UPDATE ... SET count = count + delta, so concurrent changes add up
+    if not delta or model.objects.filter(**lookup).update(count=F('count') + delta):
+        return
+    model.objects.bulk_create([model(count=0, **lookup)], ignore_conflicts=True)
+    model.objects.filter(**lookup).update(count=F('count') + delta)
+
+
+def add_status_counts(deltas):
+    """
+    Apply ``{status: delta}`` to the status counts
+    """
+    for status, delta in deltas.items():
+        _add(RideStatusCount, delta, status=status)
+
+
+def add_hourly(moment, status, delta=1):
+    _add(RideHourlyRollup, delta, hour=hour_bucket(moment), status=status)
+
+
+def ride_created(ride):
+    add_status_counts({ride.status: 1})
+    add_hourly(ride.created_at, REQUESTED)
+
+
+def ride_deleted(ride):
+    add_status_counts({ride.status: -1})
+    add_hourly(ride.created_at, REQUESTED, -1)
+
+
+def status_changed(old_status, new_status, count=1):
+    """
+    ``count`` rides moved from ``old_status`` to ``new_status``
+    """
+    if old_status != new_status:
+        add_status_counts({old_status: -count, new_status: count})
+
+
+def events_created(events, delta=1):
+    """
+    Count the status changes among ``events`` (or uncount them, delta=-1)
+    """
+    buckets = Counter(
+        (hour_bucket(event.created_at), event.new_status) for event in events if is_status_change(event)
+    )
+    for (hour, status), count in buckets.items():
+        _add(RideHourlyRollup, count * delta, hour=hour, status=status)
+
+
+def rebuild(using=DEFAULT_DB_ALIAS):
+    """
+    Recompute both tables from the ride, ride_event and ride_event_archive
+    rows; returns the number of hourly rows written
+    """
+    with transaction.atomic(using=using):
+        hourly = Counter()
+        utc_hour = TruncHour('created_at', tzinfo=dt_timezone.utc)
+        rides = Ride.objects.using(using)
+        for row in rides.annotate(hour=utc_hour).values('hour').annotate(count=Count('pk')).order_by():
+            hourly[row['hour'], REQUESTED] += row['count']
+        for model in (RideEvent, RideEventArchive):
+            changes = model.objects.using(using).exclude(old_status__isnull=True).exclude(
+                new_status__isnull=True
+            ).exclude(old_status=F('new_status'))
+            rows = changes.annotate(hour=utc_hour).values('hour', 'new_status').annotate(count=Count('pk')).order_by()
+            for row in rows:
+                hourly[row['hour'], row['new_status']] += row['count']
+
+        RideStatusCount.objects.using(using).all().delete()
+        RideStatusCount.objects.using(using).bulk_create([
+            RideStatusCount(status=row['status'], count=row['count'])
+            for row in rides.values('status').annotate(count=Count('pk')).order_by()
+        ])
+        RideHourlyRollup.objects.using(using).all().delete()
+        RideHourlyRollup.objects.using(using).bulk_create([
+            RideHourlyRollup(hour=hour, status=status, count=count)
+            for (hour, status), count in hourly.items()
+        ], batch_size=5000)
+    return len(hourly)
+
+
+def ride_stats(hours=24):
+    """
+    Status counts and the hourly rollup of the last ``hours`` hours
+    """
+    since = hour_bucket(timezone.now()) - timedelta(hours=hours - 1)
+    hourly = RideHourlyRollup.objects.filter(hour__gte=since).exclude(count=0).order_by('hour', 'status')
+    return {
+        'status_counts': dict(RideStatusCount.objects.order_by('status').values_list('status', 'count')),
+        'hours': hours,
+        'hourly': [{'hour': row.hour, 'status': row.status, 'count': row.count} for row in hourly],
+    }
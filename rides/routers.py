@@ -0,0 +1,95 @@
+"""
+Read/write splitting between the primary database and read replicas.
+
+``ReadReplicaRouter`` sends every write to ``default``. Reads go to
+``default`` too, unless the current request was routed to a replica by
+``ReplicaReadMixin``: safe (GET/HEAD/OPTIONS) requests of the API viewsets
+then read from one of ``DATABASE_READ_REPLICAS``. A user who has just made
+an unsafe request is pinned to the primary for
+``DATABASE_PRIMARY_STICKY_SECONDS``, so they read their own writes while
+the replicas catch up. Pins live in the Django cache, which must be shared
+between processes for pins to follow users across workers.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+import random
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.permissions import SAFE_METHODS
+
+_read_alias = ContextVar('rides_read_alias', default=None)
+
+PIN_KEY = 'rides:primary-pin:{}'
+
+
+def current_read_alias():
+    """
+    Alias reads are routed to in this context (None: the primary)
+    """
+    return _read_alias.get()
+
+
+def choose_replica():
+    replicas = getattr(settings, 'DATABASE_READ_REPLICAS', [])
+    return random.choice(replicas) if replicas else None
+
+
+@contextmanager
+def read_from(alias):
+    """
+    Route the reads of the block to ``alias`` (None: the primary)
+    """
+    token = _read_alias.set(alias)
+    try:
+        yield alias
+    finally:
+        _read_alias.reset(token)
+
+
+def pin_to_primary(user):
+    seconds = getattr(settings, 'DATABASE_PRIMARY_STICKY_SECONDS', 5)
+    if user is not None and user.is_authenticated and seconds:
+        cache.set(PIN_KEY.format(user.pk), True, seconds)
+
+
+def is_pinned_to_primary(user):
+    return user is not None and user.is_authenticated and bool(cache.get(PIN_KEY.format(user.pk)))
+
+
+async def ais_pinned_to_primary(user):
+    return user is not None and user.is_authenticated and bool(await cache.aget(PIN_KEY.format(user.pk)))
+
+
+class ReadReplicaRouter:
+    def db_for_read(self, model, **hints):
+        return _read_alias.get()
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary
+        return True
+
+
+class ReplicaReadMixin:
+    """
+    Serves safe requests from a read replica unless the user wrote recently
+    """
+
+    def dispatch(self, request, *args, **kwargs):
+        # Start every request on the primary; initial() picks a replica once
+        # the user is known
+        with read_from(None):
+            return super().dispatch(request, *args, **kwargs)
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if request.method in SAFE_METHODS and not is_pinned_to_primary(request.user):
+            _read_alias.set(choose_replica())
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        if request.method not in SAFE_METHODS:
+            pin_to_primary(getattr(request, 'user', None))
+        return super().finalize_response(request, response, *args, **kwargs)
@@ -3,6 +3,8 @@ from django.contrib.auth.models import User
 from django.utils import timezone
 from datetime import timedelta
 from .models import Ride, RideEvent, User
+from .transitions import BULK_TRANSITIONS
+from .dispatch import DEFAULT_BATCH_SIZE
 
 class UserSerializer(serializers.ModelSerializer):
     class Meta:
@@ -45,6 +47,15 @@ class RideSerializer(serializers.ModelSerializer):
     def get_todays_ride_events(self, obj):
         return RideEventSerializer(obj.todays_events, many=True).data
     
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Sparse fieldsets, see get_ride_fields
+        fields = self.context.get('fields')
+        if fields is not None:
+            for name in list(self.fields):
+                if name not in fields and not self.fields[name].write_only:
+                    self.fields.pop(name)
+    
     class Meta:
         model = Ride
         fields = (
@@ -53,4 +64,169 @@ class RideSerializer(serializers.ModelSerializer):
             'pickup_time', 'rider', 'rider_id', 'driver', 'driver_id', 
             'status', 'created_at', 'updated_at', 'todays_ride_events', 'distance'
         )
-        read_only_fields = ('created_at', 'updated_at', 'distance') 
\ No newline at end of file
+        read_only_fields = ('created_at', 'updated_at', 'distance')
+
+
+class BulkTransitionSerializer(serializers.Serializer):
+    ride_ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=1000
+    )
+    status = serializers.ChoiceField(choices=BULK_TRANSITIONS)
+
+
+class DriverLocationSerializer(serializers.Serializer):
+    latitude = serializers.FloatField(min_value=-90, max_value=90)
+    longitude = serializers.FloatField(min_value=-180, max_value=180)
+    available = serializers.BooleanField(default=True)
+
+
+class DispatchSerializer(serializers.Serializer):
+    batch_size = serializers.IntegerField(min_value=1, max_value=1000, default=DEFAULT_BATCH_SIZE)
+    limit = serializers.IntegerField(min_value=1, required=False)
+
+
+# Read-only fast path for the ride list/retrieve endpoints.
+#
+# These build plain dicts straight from prefetched model instances instead of
+# instantiating a UserSerializer/RideEventSerializer per row. The output must
+# stay identical to the serializers above (see RideSerializerFastPathTests).
+
+_datetime_field = serializers.DateTimeField()
+
+
+def _datetime(value):
+    if value is None:
+        return None
+    return _datetime_field.to_representation(value)
+
+
+def _float(value):
+    if value is None:
+        return None
+    return float(value)
+
+
+def user_representation(user):
+    if user is None:
+        return None
+    return {
+        'id_user': user.id_user,
+        'username': user.username,
+        'first_name': user.first_name,
+        'last_name': user.last_name,
+        'email': user.email,
+        'phone_number': user.phone_number,
+        'role': user.role,
+    }
+
+
+def ride_event_representation(event):
+    return {
+        'id_ride_event': event.id_ride_event,
+        'id_ride': event.id_ride_id,
+        'description': event.description,
+        'old_status': event.old_status,
+        'new_status': event.new_status,
+        'user': user_representation(event.user),
+        'created_at': _datetime(event.created_at),
+    }
+
+
+def ride_representation(ride, fields=None):
+    """
+    ``fields``: the keys to render (see get_ride_fields), None for all
+    """
+    if fields is not None:
+        return {
+            name: RIDE_FIELD_VALUES[name](ride) for name in RIDE_FIELDS
+            if name in fields and (name != 'distance' or hasattr(ride, 'distance'))
+        }
+    data = {
+        'id_ride': ride.id_ride,
+        'pickup_latitude': _float(ride.pickup_latitude),
+        'pickup_longitude': _float(ride.pickup_longitude),
+        'dropoff_latitude': _float(ride.dropoff_latitude),
+        'dropoff_longitude': _float(ride.dropoff_longitude),
+        'pickup_time': _datetime(ride.pickup_time),
+        'rider': user_representation(ride.id_rider),
+        'driver': user_representation(ride.id_driver),
+        'status': ride.status,
+        'created_at': _datetime(ride.created_at),
+        'updated_at': _datetime(ride.updated_at),
+        'todays_ride_events': [ride_event_representation(event) for event in ride.todays_events],
+    }
+    # Like the serializer field, distance is only present when annotated
+    if hasattr(ride, 'distance'):
+        data['distance'] = _float(ride.distance)
+    return data
+
+
+# Sparse fieldsets: ?fields= picks the keys of each ride, ?expand= opts into
+# the nested objects. Rides are then loaded without the joins, prefetch and
+# columns the response doesn't use (see RideViewSet.get_queryset).
+
+RIDE_FIELDS = (
+    'id_ride', 'pickup_latitude', 'pickup_longitude', 'dropoff_latitude', 'dropoff_longitude', 'pickup_time',
+    'rider', 'driver', 'status', 'created_at', 'updated_at', 'todays_ride_events', 'distance'
+)
+RIDE_EXPANDABLE_FIELDS = ('rider', 'driver', 'todays_ride_events')
+
+RIDE_FIELD_VALUES = {
+    'id_ride': lambda ride: ride.id_ride,
+    'pickup_latitude': lambda ride: _float(ride.pickup_latitude),
+    'pickup_longitude': lambda ride: _float(ride.pickup_longitude),
+    'dropoff_latitude': lambda ride: _float(ride.dropoff_latitude),
+    'dropoff_longitude': lambda ride: _float(ride.dropoff_longitude),
+    'pickup_time': lambda ride: _datetime(ride.pickup_time),
+    'rider': lambda ride: user_representation(ride.id_rider),
+    'driver': lambda ride: user_representation(ride.id_driver),
+    'status': lambda ride: ride.status,
+    'created_at': lambda ride: _datetime(ride.created_at),
+    'updated_at': lambda ride: _datetime(ride.updated_at),
+    'todays_ride_events': lambda ride: [ride_event_representation(event) for event in ride.todays_events],
+    'distance': lambda ride: _float(ride.distance),
+}
+
+# Model fields each key is rendered from, for QuerySet.only(); other keys
+# are rendered from the model field of the same name
+USER_FIELDS = ('id_user', 'username', 'first_name', 'last_name', 'email', 'phone_number', 'role')
+
+RIDE_FIELD_COLUMNS = {
+    'rider': tuple(f'id_rider__{name}' for name in USER_FIELDS),
+    'driver': tuple(f'id_driver__{name}' for name in USER_FIELDS),
+    'todays_ride_events': (),
+    'distance': (),
+}
+
+
+def _names(query_params, param):
+    return {name.strip() for value in query_params.getlist(param) for name in value.split(',')}
+
+
+def get_ride_fields(query_params):
+    """
+    The ride keys requested with ``?fields=`` and ``?expand=`` (comma
+    separated), or None for the full representation. ``expand`` alone adds
+    the listed nested objects to the flat fields. Unknown names are ignored,
+    like invalid values of the other list parameters.
+    """
+    fields = _names(query_params, 'fields') & set(RIDE_FIELDS)
+    expand = _names(query_params, 'expand') & set(RIDE_EXPANDABLE_FIELDS)
+    if not fields and 'expand' not in query_params:
+        return None
+    if not fields:
+        fields = set(RIDE_FIELDS) - set(RIDE_EXPANDABLE_FIELDS)
+    return frozenset(fields | expand)
+
+
+def get_ride_columns(fields):
+    """
+    Model fields needed to render ``fields``
+    """
+    columns = []
+    for name in RIDE_FIELDS:
+        if name in fields:
+            columns.extend(RIDE_FIELD_COLUMNS.get(name, (name,)))
+    return columns
@@ -0,0 +1,77 @@
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from .authentication import AUTH_FIELDS, token_cache
+from .cache import response_cache
+from .streams import event_broker
+from . import rollups
+from .models import Ride, RideEvent, RideEventArchive, User
+
+
+@receiver(post_save, sender=Ride)
+@receiver(post_delete, sender=Ride)
+@receiver(post_save, sender=RideEvent)
+@receiver(post_delete, sender=RideEvent)
+def invalidate_ride_responses(sender, **kwargs):
+    response_cache.invalidate_on_commit()
+
+
+@receiver(post_delete, sender=Token)
+def invalidate_deleted_token(sender, instance, **kwargs):
+    token_cache.invalidate_on_commit(keys=[instance.key])
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_user_tokens(sender, instance, created=False, update_fields=None, **kwargs):
+    if created or (update_fields is not None and not AUTH_FIELDS.intersection(update_fields)):
+        return
+    token_cache.invalidate_on_commit(user_id=instance.pk)
+
+
+@receiver(pre_save, sender=Ride)
+def remember_ride_status(sender, instance, update_fields=None, using=None, **kwargs):
+    if instance._state.adding or (update_fields is not None and 'status' not in update_fields):
+        return
+    loaded = getattr(instance, '_loaded_status', None)
+    if loaded is not None and instance._state.db == using:
+        instance._saved_status = loaded
+    else:
+        instance._saved_status = (
+            Ride.objects.using(using).filter(pk=instance.pk).values_list('status', flat=True).first()
+        )
+
+
+@receiver(post_save, sender=Ride)
+def count_saved_ride(sender, instance, created, update_fields=None, **kwargs):
+    if created:
+        rollups.ride_created(instance)
+    elif getattr(instance, '_saved_status', None) is not None:
+        rollups.status_changed(instance._saved_status, instance.status)
+        del instance._saved_status
+    if update_fields is None or 'status' in update_fields:
+        instance.remember_loaded_status()
+
+
+@receiver(post_delete, sender=Ride)
+def count_deleted_ride(sender, instance, **kwargs):
+    rollups.ride_deleted(instance)
+
+
+@receiver(post_save, sender=RideEvent)
+def count_saved_event(sender, instance, created, **kwargs):
+    if created:
+        rollups.events_created([instance])
+
+
+@receiver(post_save, sender=RideEvent)
+def publish_saved_event(sender, instance, created, using=None, **kwargs):
+    if created:
+        event_broker.publish_on_commit([instance], using=using)
+
+
+@receiver(post_delete, sender=RideEvent)
+@receiver(post_delete, sender=RideEventArchive)
+def count_deleted_event(sender, instance, **kwargs):
+    rollups.events_created([instance], delta=-1)
@@ -0,0 +1,137 @@
+"""
+Server-Sent Events stream of new ride events (see async_views.ride_event_stream).
+
+New RideEvents are published once their transaction commits: by the
+post_save signal, and by the transitions and dispatch after their bulk
+inserts. While streams are open, each one is serialized once and handed to
+the queue of every stream whose filters match, so streams never query the
+database for new events. With no stream open, publishing does nothing.
+
+Events are identified by ``id_ride_event``. A client reconnecting with
+``Last-Event-ID`` gets the events after it from the database.
+
+Only events created in this process are published: serve the streams from
+the process that handles the writes, or from every process with a shared
+publisher in front. Events from concurrent transactions can commit out of
+id order, so a resume can miss an event that committed after a higher id.
+"""
+import asyncio
+import json
+import threading
+
+from django.db import transaction
+from rest_framework.utils.encoders import JSONEncoder
+
+from .models import RideEvent, User
+
+# Most events sent from the database on a resume; clients that missed more
+# reload the event list
+RESUME_LIMIT = 1000
+# Per stream; a client that falls this far behind is disconnected and
+# resumes with Last-Event-ID
+QUEUE_SIZE = 1000
+
+
+class StreamEvent:
+    __slots__ = ('id', 'id_ride', 'status', 'message')
+
+    def __init__(self, event):
+        # Not at module level: the serializers import the transitions, which
+        # publish here
+        from .serializers import ride_event_representation
+
+        self.id = event.id_ride_event
+        self.id_ride = event.id_ride_id
+        self.status = event.new_status
+        data = json.dumps(ride_event_representation(event), cls=JSONEncoder, ensure_ascii=False)
+        self.message = f'id: {self.id}\nevent: ride_event\ndata: {data}\n\n'
+
+
+class Subscription:
+    def __init__(self, ride_id=None, statuses=None):
+        self.ride_id = ride_id
+        self.statuses = statuses
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(QUEUE_SIZE)
+        self.closed = False
+
+    def matches(self, event):
+        return ((self.ride_id is None or event.id_ride == self.ride_id) and
+                (not self.statuses or event.status in self.statuses))
+
+    def put(self, events):
+        # On the subscriber's event loop; None tells the stream to end
+        for event in events:
+            if self.closed:
+                return
+            if self.queue.qsize() < QUEUE_SIZE - 1:
+                self.queue.put_nowait(event)
+            else:
+                self.closed = True
+                self.queue.put_nowait(None)
+
+
+class RideEventBroker:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.subscriptions = set()
+        self.published = 0
+
+    def subscribe(self, ride_id=None, statuses=None):
+        """
+        A new Subscription; call from the event loop of the stream
+        """
+        subscription = Subscription(ride_id, statuses)
+        with self._lock:
+            self.subscriptions.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self.subscriptions.discard(subscription)
+
+    def publish(self, events):
+        """
+        Hand ``events`` (saved RideEvents, in id order) to the matching
+        subscriptions
+        """
+        with self._lock:
+            subscriptions = list(self.subscriptions)
+        events = [event for event in events if event.pk is not None]
+        if not events or not subscriptions:
+            return
+        # One query for the users that aren't loaded yet
+        user_field = RideEvent._meta.get_field('user')
+        missing = {event.user_id for event in events
+                   if event.user_id is not None and not user_field.is_cached(event)}
+        users = User.objects.in_bulk(missing) if missing else {}
+        for event in events:
+            if event.user_id in users:
+                event.user = users[event.user_id]
+        published = [StreamEvent(event) for event in events]
+
+        with self._lock:
+            self.published += len(published)
+        # One callback per stream and batch of events
+        for subscription in subscriptions:
+            matching = [event for event in published if subscription.matches(event)]
+            if matching:
+                try:
+                    subscription.loop.call_soon_threadsafe(subscription.put, matching)
+                except RuntimeError:
+                    # Its event loop is gone
+                    self.unsubscribe(subscription)
+
+    def publish_on_commit(self, events, using=None):
+        # robust: a failure here mustn't fail the write that committed
+        transaction.on_commit(lambda: self.publish(events), using=using, robust=True)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'streams': len(self.subscriptions),
+                'published': self.published,
+            }
+
+
+event_broker = RideEventBroker()
@@ -1,3 +1,1521 @@
-from django.test import TestCase
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from importlib import import_module
+from io import StringIO
+import asyncio
+import base64
+import json
+import math
+import os
+import random
+import shutil
+import tempfile
+import threading
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync, sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import FieldError
+from django.core.management import CommandError, call_command
+from django.db import connection, connections, transaction
+from django.db.migrations.loader import MigrationLoader
+from django.db.models import Min, Prefetch, QuerySet
+from django.db.utils import ConnectionHandler
+from django.test import AsyncClient, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework import serializers
+from rest_framework.authtoken.models import Token
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from .archive import archive_events
+from .authentication import token_cache
+from .datagen import GenerationPlan, ensure_users, generate
+from .dispatch import DriverIndex, driver_index
+from .geo import annotate_distance, grid_cell, nearest_rides
+from .metrics import record_queries
+from .fields import STATUS_CODES
+from .models import (
+    EventDescription, Ride, RideEvent, RideEventArchive, RideHourlyRollup, RideStatusCount, User
+)
+from .renderers import packb
+from .rollups import rebuild
+from .serializers import RideEventSerializer, RideSerializer, ride_representation
+from .streams import event_broker
+from .transitions import transition_ride
+
+
+def forget_event_descriptions():
+    # An empty description cache, as in a new process
+    interner = RideEvent._meta.get_field('description').interner
+    interner._ids.clear()
+    interner._texts.clear()
+    interner._uncommitted.clear()
+
+
+def create_user(username, **extra_fields):
+    extra_fields.setdefault('first_name', username.title())
+    extra_fields.setdefault('last_name', 'Tester')
+    extra_fields.setdefault('phone_number', '555-000-0000')
+    return User.objects.create_user(username, f'{username}@example.com', 'password', **extra_fields)
+
+
+class RideSerializerFastPathTests(TestCase):
+    """
+    The read-only fast path must render byte-for-byte like RideSerializer
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = create_user('admin', role='admin')
+        rider = create_user('rider')
+        driver = create_user('driver', phone_number='555-ü-1234')
+        now = timezone.now()
+        for i in range(4):
+            ride = Ride.objects.create(
+                status='IN_PROGRESS' if i % 2 else 'REQUESTED',
+                id_rider=rider,
+                id_driver=driver if i % 2 else None,
+                pickup_latitude=40.7 + i / 100,
+                pickup_longitude=-74 - i / 100,
+                dropoff_latitude=40.8,
+                dropoff_longitude=-73.9,
+                pickup_time=now + timedelta(hours=i),
+            )
+            RideEvent.objects.create(id_ride=ride, new_status='REQUESTED', user=rider,
+                                     created_at=now - timedelta(hours=1, microseconds=i))
+            RideEvent.objects.create(id_ride=ride, description='GPS update', old_status='REQUESTED',
+                                     new_status='REQUESTED', user=None, created_at=now - timedelta(hours=2))
+            RideEvent.objects.create(id_ride=ride, new_status='REQUESTED', user=rider,
+                                     created_at=now - timedelta(days=3))
+
+    def get_rides(self, queryset=None):
+        queryset = queryset if queryset is not None else Ride.objects.all()
+        todays_events = RideEvent.objects.filter(
+            created_at__gte=timezone.now() - timedelta(hours=24)
+        ).select_related('user')
+        return list(queryset.select_related('id_rider', 'id_driver').prefetch_related(
+            Prefetch('events', queryset=todays_events, to_attr='todays_events')
+        ).order_by('id_ride'))
+
+    def assertSameRendering(self, rides):
+        renderer = JSONRenderer()
+        expected = renderer.render(RideSerializer(rides, many=True).data)
+        actual = renderer.render([ride_representation(ride) for ride in rides])
+        self.assertEqual(actual, expected)
+
+    def test_matches_serializer(self):
+        self.assertSameRendering(self.get_rides())
+
+    def test_matches_serializer_with_distance(self):
+        self.assertSameRendering(self.get_rides(annotate_distance(Ride.objects.all(), 40.7, -74)))
+
+    def test_matches_serializer_in_other_timezone(self):
+        with timezone.override('America/New_York'):
+            self.assertSameRendering(self.get_rides())
+
+    def test_list_and_retrieve_use_fast_path(self):
+        client = APIClient()
+        client.force_authenticate(self.admin)
+        rides = self.get_rides()
+        renderer = JSONRenderer()
+
+        response = client.get('/api/rides/', {'ordering': 'created_at', 'page_size': 100})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            renderer.render(response.data['results']),
+            renderer.render(RideSerializer(rides, many=True).data)
+        )
+
+        response = client.get(f'/api/rides/{rides[1].id_ride}/')
+        self.assertEqual(response.content, renderer.render(RideSerializer(rides[1]).data))
+
+    @override_settings(RIDE_RESPONSE_CACHE_TIMEOUT=0, RIDE_CONDITIONAL_REQUESTS=False)
+    def test_sparse_fieldsets(self):
+        client = APIClient()
+        client.force_authenticate(self.admin)
+        # Cache the event descriptions: setUpTestData's inserts never commit,
+        # so forget they were inserted (see rides.fields.Interner)
+        forget_event_descriptions()
+        self.addCleanup(forget_event_descriptions)
+        list(RideEvent.objects.all())
+        rides = self.get_rides()
+        renderer = JSONRenderer()
+        full = list(RideSerializer(rides[0]).data)
+        flat = ['id_ride', 'pickup_latitude', 'pickup_longitude', 'dropoff_latitude', 'dropoff_longitude',
+                'pickup_time', 'status', 'created_at', 'updated_at']
+        for params, keys, queries in [
+            ({'fields': 'id_ride,status, pickup_latitude'}, ['id_ride', 'pickup_latitude', 'status'], 2),
+            ({'fields': 'id_ride,unknown', 'expand': 'driver,unknown'}, ['id_ride', 'driver'], 2),
+            ({'expand': ''}, flat, 2),
+            ({'expand': 'rider,todays_ride_events'}, flat[:6] + ['rider'] + flat[6:] + ['todays_ride_events'], 3),
+            ({'fields': 'unknown'}, full, 3),
+        ]:
+            with CaptureQueriesContext(connection) as captured:
+                response = client.get('/api/rides/', {'ordering': 'created_at', 'page_size': 100, **params})
+            self.assertEqual(list(response.data['results'][0]), keys, params)
+            serializer = RideSerializer(rides, many=True, context={'fields': set(keys)})
+            self.assertEqual(renderer.render(response.data['results']), renderer.render(serializer.data), params)
+            # No joins, prefetch or columns for what isn't rendered
+            self.assertEqual(len(captured), queries, params)
+            sql = captured[1]['sql']
+            self.assertEqual('JOIN' in sql, 'rider' in keys or 'driver' in keys, params)
+            self.assertEqual('dropoff_latitude' in sql, 'dropoff_latitude' in keys, params)
+            # Sparse rows only load the user columns they render
+            self.assertEqual('password' in sql, keys == full, params)
+
+        response = client.get(f'/api/rides/{rides[1].id_ride}/', {'fields': 'status'})
+        self.assertEqual(response.data, {'status': rides[1].status})
+        response = client.get('/api/rides/', {'pagination': 'cursor', 'page_size': 1, 'fields': 'status'})
+        self.assertEqual(client.get(response.data['next']).data['results'], [{'status': rides[-2].status}])
+
+    def test_compact_renderers(self):
+        client = APIClient()
+        client.force_authenticate(self.admin)
+        rides = client.get('/api/rides/', {'ordering': 'created_at'}).data
+        response = client.get('/api/rides/', {'ordering': 'created_at', 'format': 'columnar'})
+        self.assertEqual(response['Content-Type'], 'application/vnd.wingz.columnar+json')
+        data = json.loads(response.content)
+        self.assertEqual(data['count'], rides['count'])
+        table = data['results']
+        self.assertEqual(table['length'], len(rides['results']))
+        self.assertEqual(list(table['columns']), [key for key in rides['results'][0] if key != 'todays_ride_events'])
+        for name, values in table['columns'].items():
+            expected = [row[name] for row in rides['results']]
+            if name in ('rider', 'driver'):
+                self.assertEqual([data['users'][str(value)] if value else None for value in values], expected)
+            else:
+                self.assertEqual(values, json.loads(JSONRenderer().render(expected)), name)
+        # One entry per user, however many rides and events reference it
+        self.assertEqual(len(data['users']), 2)
+        events = table['tables']['todays_ride_events']
+        self.assertEqual(events['lengths'], [len(row['todays_ride_events']) for row in rides['results']])
+        self.assertEqual(events['columns']['id_ride_event'],
+                         [event['id_ride_event'] for row in rides['results'] for event in row['todays_ride_events']])
+
+        response = client.get('/api/rides/', {'ordering': 'created_at'}, HTTP_ACCEPT='application/x-msgpack')
+        self.assertEqual(response['Content-Type'], 'application/x-msgpack')
+        self.assertLess(len(response.content), len(JSONRenderer().render(rides)) / 2)
+        self.assertNotEqual(response['ETag'], client.get('/api/rides/', {'ordering': 'created_at'})['ETag'])
+        response = client.get(f"/api/rides/{rides['results'][0]['id_ride']}/events/", {'format': 'columnar'})
+        self.assertEqual(json.loads(response.content)['results']['length'], 3)
+
+        # Against the MessagePack specification
+        self.assertEqual(packb({'a': [1, -1, None, True, 1.5, 'x', -200, 300]}).hex(),
+                         '81a16198' '01ff' 'c0c3' 'cb3ff8000000000000' 'a178' 'd1ff38' 'cd012c')
+        self.assertEqual(packb(['x' * 40, list(range(16))])[:5].hex(), '92d92878' '78')
+
+
+@override_settings(RIDE_RESPONSE_CACHE_TIMEOUT=0)
+class RiderEmailFilterTests(TestCase):
+    """
+    ``rider_email`` matches prefixes of the indexed lowercase email by default
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = create_user('admin', role='admin')
+        for username in ['alice', 'malice']:
+            Ride.objects.create(status='REQUESTED', id_rider=create_user(username), pickup_latitude=40.7,
+                                pickup_longitude=-74, pickup_time=timezone.now())
+
+    def get_riders(self, **params):
+        client = APIClient()
+        client.force_authenticate(self.admin)
+        response = client.get('/api/rides/', params)
+        return sorted(ride['rider']['username'] for ride in response.data['results'])
+
+    def test_match_modes(self):
+        self.assertEqual(self.get_riders(rider_email='ALIC'), ['alice'])
+        self.assertEqual(self.get_riders(rider_email='alice', rider_email_match='exact'), [])
+        self.assertEqual(self.get_riders(rider_email='Alice@Example.com', rider_email_match='exact'), ['alice'])
+        self.assertEqual(self.get_riders(rider_email='alic', rider_email_match='contains'), ['alice', 'malice'])
+
+    def test_email_changes_are_indexed(self):
+        user = User.objects.get(username='alice')
+        user.email = 'Zed@Example.com'
+        user.save(update_fields=['email'])
+        self.assertEqual(User.objects.get(pk=user.pk).email_lower, 'zed@example.com')
+        self.assertEqual(self.get_riders(rider_email='zed'), ['alice'])
+
+
+@override_settings(RIDE_RESPONSE_CACHE_TIMEOUT=0, RIDE_CONDITIONAL_REQUESTS=False)
+class RecentEventsWindowTests(TestCase):
+    """
+    todays_ride_events holds the newest events of each ride inside the window
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = create_user('admin', role='admin')
+        now = timezone.now()
+        cls.events = {}
+        for _ in range(2):
+            ride = Ride.objects.create(status='REQUESTED', id_rider=cls.admin, pickup_latitude=40.7,
+                                       pickup_longitude=-74, pickup_time=now)
+            # hours ago -> event id
+            cls.events[ride.id_ride] = {
+                hours: RideEvent.objects.create(id_ride=ride, new_status='REQUESTED',
+                                                created_at=now - timedelta(hours=hours)).id_ride_event
+                for hours in [1, 2, 3, 30, 40]
+            }
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def get_events(self, **params):
+        response = self.client.get('/api/rides/', {'fields': 'id_ride,todays_ride_events', **params})
+        self.assertEqual(response.status_code, 200)
+        return {row['id_ride']: sorted(event['id_ride_event'] for event in row['todays_ride_events'])
+                for row in response.data['results']}
+
+    def expected(self, *hours):
+        return {id_ride: sorted(events[hour] for hour in hours) for id_ride, events in self.events.items()}
+
+    def test_window_and_limit(self):
+        self.assertEqual(self.get_events(), self.expected(1, 2, 3))
+        self.assertEqual(self.get_events(events_limit=2), self.expected(1, 2))
+        self.assertEqual(self.get_events(events_limit=0), self.expected())
+        self.assertEqual(self.get_events(events_window_hours=36), self.expected(1, 2, 3, 30))
+        self.assertEqual(self.get_events(events_window_hours=48, events_limit=4), self.expected(1, 2, 3, 30))
+        self.assertEqual(self.get_events(events_window_hours=2, events_limit=5), self.expected(1))
+
+    @override_settings(RIDE_EVENTS_LIMIT=1, RIDE_EVENTS_MAX_WINDOW_HOURS=35)
+    def test_invalid_values_fall_back(self):
+        self.assertEqual(self.get_events(events_limit=-1), self.expected(1))
+        self.assertEqual(self.get_events(events_limit='x', events_window_hours='y'), self.expected(1))
+        # Capped at RIDE_EVENTS_MAX_WINDOW_HOURS
+        self.assertEqual(self.get_events(events_window_hours=1000, events_limit=10), self.expected(1, 2, 3, 30))
+
+
+@override_settings(RIDE_RESPONSE_CACHE_TIMEOUT=0)
+class KeysetPaginationTests(TestCase):
+    """
+    Cursor pages follow (ordering field, id_ride), forwards and backwards
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = create_user('admin', role='admin')
+        now = timezone.now().replace(microsecond=0)
+        # Mostly ties, which only the primary key breaks
+        for i in range(7):
+            Ride.objects.create(status='REQUESTED', id_rider=cls.admin, pickup_latitude=40.7,
+                                pickup_longitude=-74, pickup_time=now + timedelta(hours=i // 3))
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def get_pages(self, ordering):
+        pages = []
+        response = self.client.get('/api/rides/', {'pagination': 'cursor', 'page_size': 2, 'ordering': ordering})
+        while True:
+            self.assertEqual(response.status_code, 200)
+            pages.append([ride['id_ride'] for ride in response.data['results']])
+            if not response.data['next']:
+                break
+            response = self.client.get(response.data['next'])
+        self.assertIsNone(response.data['next'])
+        # And back again through the previous links
+        for page in reversed(pages[:-1]):
+            response = self.client.get(response.data['previous'])
+            self.assertEqual([ride['id_ride'] for ride in response.data['results']], page)
+        return pages
+
+    def test_round_trip(self):
+        rides = Ride.objects.order_by('pickup_time', 'id_ride')
+        expected = [ride.id_ride for ride in rides]
+        self.assertEqual(sum(self.get_pages('pickup_time'), []), expected)
+        rides = Ride.objects.order_by('-pickup_time', '-id_ride')
+        expected = [ride.id_ride for ride in rides]
+        self.assertEqual(sum(self.get_pages('-pickup_time'), []), expected)
+
+    def test_invalid_cursor(self):
+        for cursor in [{'v': 'notadate', 'k': 1, 'r': 0}, {'v': None, 'k': 1, 'r': 0}, {'v': 1, 'k': 1, 'r': 0},
+                       {'v': '2026-01-01T00:00:00Z', 'k': 'x', 'r': 0}, {'k': 1}]:
+            encoded = base64.urlsafe_b64encode(json.dumps(cursor).encode()).decode()
+            for ordering in ['pickup_time', '-updated_at']:
+                response = self.client.get('/api/rides/', {'cursor': encoded, 'ordering': ordering})
+                self.assertEqual(response.status_code, 404, (cursor, ordering))
+        self.assertEqual(self.client.get('/api/rides/', {'cursor': 'not base64!'}).status_code, 404)
+
+
+class NearestRidesTests(TestCase):
+    """
+    Distance sorting through the grid index gives the same order as sorting
+    the whole table
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        rider = create_user('rider')
+        # A cluster around the point and two rides far outside the rings
+        for latitude, longitude in [(40.7, -74), (40.705, -74.002), (40.73, -73.98), (40.72, -74.03),
+                                    (45, -74), (35, -80)]:
+            Ride.objects.create(status='REQUESTED', id_rider=rider, pickup_latitude=latitude,
+                                pickup_longitude=longitude, pickup_time=timezone.now())
+
+    def get_nearest(self, limit, max_rings=None):
+        with CaptureQueriesContext(connection) as captured:
+            rides = list(nearest_rides(Ride.objects.all(), 40.701, -74.001, limit, max_rings)[:limit])
+        expected = list(annotate_distance(Ride.objects.all(), 40.701, -74.001).order_by('distance')[:limit])
+        self.assertEqual(rides, expected)
+        return len(captured)
+
+    def test_dense_area(self):
+        # Boxes of radius 0, 1, 2, 4, then the sort
+        self.assertEqual(self.get_nearest(4), 5)
+
+    def test_sparse_fallback(self):
+        # One count per doubling up to 64 rings, then the full sort
+        self.assertEqual(self.get_nearest(6), 9)
+        # The last box is max_rings wide
+        self.assertEqual(self.get_nearest(6, max_rings=5), 6)
+
+    def test_migration_fills_grid_cells(self):
+        Ride.objects.update(pickup_grid_x=None, pickup_grid_y=None)
+
+        migration = import_module('rides.migrations.0009_fill_ride_pickup_grid')
+        state = MigrationLoader(connection).project_state(('rides', '0009_fill_ride_pickup_grid'))
+        with mock.patch.object(migration, 'BATCH_SIZE', 4):
+            migration.fill_pickup_grid(state.apps, mock.Mock(connection=connection))
+        for ride in Ride.objects.all():
+            self.assertEqual((ride.pickup_grid_x, ride.pickup_grid_y),
+                             grid_cell(ride.pickup_latitude, ride.pickup_longitude))
+        self.assertEqual(self.get_nearest(4), 5)
+
+
+@override_settings(RIDE_RESPONSE_CACHE_TIMEOUT=60, RIDE_CONDITIONAL_REQUESTS=False)
+class ResponseCacheTests(TestCase):
+    """
+    Cached responses are served without queries until a ride change commits
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = create_user('admin', role='admin')
+        cls.ride = Ride.objects.create(status='REQUESTED', id_rider=cls.admin, pickup_latitude=40.7,
+                                       pickup_longitude=-74, pickup_time=timezone.now())
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def get(self, path):
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.get(path)
+        self.assertEqual(response.status_code, 200)
+        return response, len(captured)
+
+    def test_invalidated_on_commit(self):
+        for path in ['/api/rides/', f'/api/rides/{self.ride.id_ride}/']:
+            response, queries = self.get(path)
+            self.assertGreater(queries, 0)
+            cached, queries = self.get(path)
+            self.assertEqual((cached.content, queries), (response.content, 0))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.ride.dropoff_latitude = 41.5
+            self.ride.save()
+            # Not committed yet: the cached responses still stand
+            self.assertEqual(self.get(f'/api/rides/{self.ride.id_ride}/')[1], 0)
+
+        response, queries = self.get(f'/api/rides/{self.ride.id_ride}/')
+        self.assertGreater(queries, 0)
+        self.assertEqual(response.data['dropoff_latitude'], 41.5)
+        response, queries = self.get('/api/rides/')
+        self.assertEqual(response.data['results'][0]['dropoff_latitude'], 41.5)
+
+    @override_settings(ALLOWED_HOSTS=['testserver', 'api.example.com'])
+    def test_links_follow_host_and_scheme(self):
+        Ride.objects.create(status='REQUESTED', id_rider=self.admin, pickup_latitude=40.7,
+                            pickup_longitude=-74, pickup_time=timezone.now())
+        for host, secure in [('testserver', False), ('api.example.com', False), ('api.example.com', True)]:
+            scheme = 'https' if secure else 'http'
+            for _ in range(2):
+                response = self.client.get('/api/rides/', {'page_size': 1}, HTTP_HOST=host, secure=secure)
+                self.assertEqual(response.data['next'], f'{scheme}://{host}/api/rides/?page=2&page_size=1')
+
+    def test_kept_on_rollback(self):
+        self.get('/api/rides/')
+        with self.captureOnCommitCallbacks() as callbacks:
+            with self.assertRaises(RuntimeError):
+                with transaction.atomic():
+                    self.ride.dropoff_latitude = 41.5
+                    self.ride.save()
+                    RideEvent.objects.create(id_ride=self.ride, new_status='REQUESTED')
+                    raise RuntimeError
+        self.assertEqual(callbacks, [])
+        response, queries = self.get('/api/rides/')
+        self.assertEqual((response.data['results'][0]['dropoff_latitude'], queries), (0.0, 0))
+
+    @override_settings(RIDE_CONDITIONAL_REQUESTS=True)
+    def test_hits_keep_validators(self):
+        token = Token.objects.create(user=self.admin).key
+
+        def async_get(path, headers=None):
+            return async_to_sync(AsyncClient().get)(path, headers={'Authorization': f'Token {token}', **(headers or {})})
+
+        for prefix, get in [('/api/', self.client.get), ('/api/async/', async_get)]:
+            for path in [f'{prefix}rides/', f'{prefix}rides/{self.ride.id_ride}/']:
+                first = get(path)
+                with CaptureQueriesContext(connection) as captured:
+                    cached = get(path)
+                    not_modified = get(path, headers={'If-None-Match': first['ETag']})
+                self.assertEqual(len(captured), 0, path)
+                self.assertEqual((cached.content, cached['ETag'], cached['Last-Modified']),
+                                 (first.content, first['ETag'], first['Last-Modified']))
+                self.assertEqual((not_modified.status_code, not_modified['ETag']), (304, first['ETag']))
+
+
+@override_settings(RIDE_EXPORT_CHUNK_SIZE=2)
+class ExportTests(TestCase):
+    """
+    Exports stream every matching row as NDJSON or CSV
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = create_user('admin', role='admin')
+        now = timezone.now()
+        cls.rides = [
+            Ride.objects.create(status=status, id_rider=cls.admin, pickup_latitude=40.7, pickup_longitude=-74,
+                                pickup_time=now + timedelta(hours=i))
+            for i, status in enumerate(['REQUESTED', 'COMPLETED', 'REQUESTED', 'CANCELLED', 'REQUESTED'])
+        ]
+        RideEvent.objects.create(id_ride=cls.rides[0], description='Ride requested, "soon"',
+                                 new_status='REQUESTED', user=cls.admin)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def get_lines(self, path, content_type, **extra):
+        response = self.client.get(path, **extra)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], content_type)
+        return b''.join(response.streaming_content).decode().splitlines()
+
+    def test_ndjson(self):
+        lines = self.get_lines('/api/rides/export/?status=requested&ordering=pickup_time',
+                               'application/x-ndjson; charset=utf-8')
+        rows = [json.loads(line) for line in lines]
+        self.assertEqual([row['id_ride'] for row in rows], [self.rides[i].id_ride for i in (0, 2, 4)])
+        self.assertEqual(rows[0]['rider_id'], self.admin.id_user)
+        # Same datetime format as the JSON API
+        self.assertEqual(rows[0]['pickup_time'],
+                         serializers.DateTimeField().to_representation(self.rides[0].pickup_time))
+
+        response = self.client.get('/api/rides/export/')
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="rides.ndjson"')
+
+    def test_csv(self):
+        lines = self.get_lines('/api/rides/export/?ordering=pickup_time', 'text/csv; charset=utf-8',
+                               HTTP_ACCEPT='text/csv')
+        self.assertEqual(lines[0].split(','), [
+            'id_ride', 'status', 'rider_id', 'driver_id', 'pickup_latitude', 'pickup_longitude',
+            'dropoff_latitude', 'dropoff_longitude', 'pickup_time', 'created_at', 'updated_at',
+        ])
+        self.assertEqual([line.split(',')[1] for line in lines[1:]],
+                         ['REQUESTED', 'COMPLETED', 'REQUESTED', 'CANCELLED', 'REQUESTED'])
+
+        lines = self.get_lines(f'/api/events/export/?format=csv&ride_id={self.rides[0].id_ride}',
+                               'text/csv; charset=utf-8')
+        self.assertEqual(len(lines), 2)
+        self.assertIn(',"Ride requested, ""soon""",', lines[1])
+
+
+class DispatchTests(TestCase):
+    """
+    Requested rides are started with the nearest available driver
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = create_user('admin', role='admin')
+        cls.drivers = [create_user(f'driver{i}', role='driver') for i in range(3)]
+        cls.rides = [
+            Ride.objects.create(status='REQUESTED', id_rider=cls.admin, pickup_latitude=40.7 + i / 100,
+                                pickup_longitude=-74, pickup_time=timezone.now() + timedelta(minutes=i))
+            for i in range(3)
+        ]
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+        driver_index.clear()
+        self.addCleanup(driver_index.clear)
+
+    def report(self, driver, latitude, longitude=-74, **data):
+        return self.client.post(f'/api/users/{driver.id_user}/location/',
+                                {'latitude': latitude, 'longitude': longitude, **data}, format='json')
+
+    def test_dispatch(self):
+        self.assertEqual(self.report(self.drivers[0], 40.711).status_code, 200)
+        self.report(self.drivers[1], 40.701)
+        self.report(self.drivers[2], 40.7, available=False)
+        self.assertEqual(self.report(self.drivers[2], 91).status_code, 400)
+        self.assertEqual(self.client.post('/api/users/999999/location/', {'latitude': 0, 'longitude': 0},
+                                          format='json').status_code, 404)
+        # Riders and admins aren't dispatched
+        self.assertEqual(self.report(self.admin, 40.7).status_code, 400)
+        self.assertEqual(len(driver_index), 2)
+
+        response = self.client.post('/api/rides/auto_dispatch/', {'batch_size': 2}, format='json')
+        # Earliest pickup first; the third ride has no driver left
+        self.assertEqual([(result['id_ride'], result['id_driver']) for result in response.data['results']],
+                         [(self.rides[0].id_ride, self.drivers[1].id_user),
+                          (self.rides[1].id_ride, self.drivers[0].id_user)])
+        self.assertEqual(response.data['available_drivers'], 0)
+        ride = Ride.objects.get(pk=self.rides[1].pk)
+        self.assertEqual((ride.status, ride.id_driver_id), ('IN_PROGRESS', self.drivers[0].id_user))
+        event = ride.events.get()
+        self.assertEqual((event.old_status, event.new_status, event.user_id),
+                         ('REQUESTED', 'IN_PROGRESS', self.drivers[0].id_user))
+        self.assertEqual(event.description, 'Ride started with driver Driver0 Tester')
+        self.assertEqual(RideStatusCount.objects.get(status='IN_PROGRESS').count, 2)
+
+        # A driver with a ride in progress isn't matched, and leaves the index
+        self.report(self.drivers[0], 40.72)
+        response = self.client.post('/api/rides/auto_dispatch/', format='json')
+        self.assertEqual((response.data['started'], response.data['available_drivers']), (0, 0))
+        self.assertEqual(Ride.objects.get(pk=self.rides[2].pk).status, 'REQUESTED')
+
+    def test_nearest_matches_brute_force(self):
+        rng = random.Random(1)
+        index = DriverIndex(size=0.01)
+        drivers = {}
+        for driver_id in range(500):
+            drivers[driver_id] = (40.6 + rng.random() / 5, -74.1 + rng.random() / 5)
+            index.update(driver_id, *drivers[driver_id])
+        rides = [(id_ride, 40.55 + rng.random() / 4, -74.15 + rng.random() / 4) for id_ride in range(600)]
+        matches = index.match(rides, rings=100)
+        for id_ride, latitude, longitude in rides[:500]:
+            expected = min(drivers, key=lambda driver_id: (
+                math.hypot(drivers[driver_id][0] - latitude, drivers[driver_id][1] - longitude), driver_id
+            ))
+            self.assertEqual(matches[id_ride][0], expected)
+            del drivers[expected]
+        self.assertEqual((len(matches), len(index)), (500, 0))
+
+    def test_non_drivers_arent_started(self):
+        # In the index from before their role changed
+        self.report(self.drivers[0], 40.7)
+        User.objects.filter(pk=self.drivers[0].pk).update(role='rider')
+        response = self.client.post('/api/rides/auto_dispatch/', format='json')
+        self.assertEqual((response.data['started'], response.data['available_drivers']), (0, 0))
+        self.assertFalse(Ride.objects.filter(status='IN_PROGRESS').exists())
+
+
+class DataGenerationTests(TestCase):
+    """
+    Generated rides have their own timestamps, and the same seed gives the
+    same data
+    """
+
+    def generate(self):
+        rider_ids, driver_ids = ensure_users('gen', 5, 3)
+        plan = GenerationPlan(rides=60, events_per_ride=3, rider_ids=rider_ids, driver_ids=driver_ids,
+                              seed=7, batch_size=25)
+        first = Ride.objects.order_by('-id_ride').values_list('id_ride', flat=True).first() or 0
+        generate(plan)
+        rides = Ride.objects.filter(id_ride__gt=first).order_by('id_ride')
+        return plan, rides
+
+    def test_timestamps(self):
+        fields = [Ride._meta.get_field('created_at'), Ride._meta.get_field('updated_at')]
+        bulk_create = QuerySet.bulk_create
+        flags = []
+
+        def record_flags(queryset, *args, **kwargs):
+            flags.append([(field.auto_now, field.auto_now_add) for field in fields])
+            return bulk_create(queryset, *args, **kwargs)
+
+        with mock.patch.object(QuerySet, 'bulk_create', record_flags):
+            plan, rides = self.generate()
+        # Other threads saving rides meanwhile still get the current time
+        self.assertEqual({tuple(flag) for flag in flags}, {((False, True), (True, False))})
+        self.assertGreater(len({ride.created_at for ride in rides}), 55)
+        first_events = {
+            id_ride: created_at for id_ride, created_at in
+            RideEvent.objects.values('id_ride').annotate(first=Min('created_at')).values_list('id_ride', 'first')
+        }
+        for ride in rides:
+            self.assertLessEqual(ride.created_at, first_events[ride.id_ride])
+            self.assertLessEqual(ride.created_at, ride.updated_at)
+            self.assertLessEqual(ride.updated_at, plan.anchor)
+        ride = Ride.objects.create(status='REQUESTED', id_rider=rides[0].id_rider, pickup_latitude=40.7,
+                                   pickup_longitude=-74, pickup_time=plan.anchor)
+        self.assertGreater(ride.created_at, plan.anchor)
+
+    def test_reproducible(self):
+        columns = ('status', 'pickup_time', 'created_at', 'updated_at', 'pickup_latitude')
+        _, rides = self.generate()
+        first = list(rides.values_list(*columns))
+        _, rides = self.generate()
+        self.assertEqual(list(rides.values_list(*columns)), first)
+
+
+class RideEventArchiveTests(TestCase):
+    """
+    Old events move to the archive in resumable batches and stay reachable
+    through ?history=full
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = create_user('admin', role='admin')
+        cls.ride = Ride.objects.create(status='REQUESTED', id_rider=cls.admin, pickup_latitude=40.7,
+                                       pickup_longitude=-74, pickup_time=timezone.now())
+        now = timezone.now()
+        for days in [0, 1, 100, 200, 300]:
+            RideEvent.objects.create(id_ride=cls.ride, new_status='REQUESTED', user=cls.admin,
+                                     description=f'{days} days old', created_at=now - timedelta(days=days))
+
+    def test_archive_and_full_history(self):
+        client = APIClient()
+        client.force_authenticate(self.admin)
+        before = client.get(f'/api/rides/{self.ride.id_ride}/events/').content
+
+        out = StringIO()
+        call_command('archive_ride_events', older_than_days=90, batch_size=2, max_batches=1, stdout=out)
+        self.assertEqual(RideEventArchive.objects.count(), 2)
+        # Resuming picks up the remaining old event only
+        call_command('archive_ride_events', older_than_days=90, batch_size=2, stdout=out)
+        self.assertEqual(RideEventArchive.objects.count(), 3)
+        self.assertEqual(RideEvent.objects.count(), 2)
+
+        recent = client.get(f'/api/rides/{self.ride.id_ride}/events/').data
+        self.assertEqual([event['description'] for event in recent], ['0 days old', '1 days old'])
+        full = client.get(f'/api/rides/{self.ride.id_ride}/events/', {'history': 'full'})
+        self.assertEqual(full.content, before)
+
+    def test_recent_events_cant_be_archived(self):
+        with self.assertRaises(CommandError):
+            call_command('archive_ride_events', older_than_days=1, stdout=StringIO())
+
+    def test_batch_query_count(self):
+        cutoff = timezone.now() - timedelta(days=90)
+        RideEvent.objects.bulk_create([
+            RideEvent(id_ride=self.ride, new_status='REQUESTED', description=f'Old event {number}',
+                      created_at=cutoff - timedelta(days=1))
+            for number in range(40)
+        ])
+        self.addCleanup(forget_event_descriptions)
+        counts = []
+        # The three old events of setUpTestData, then the 40 above
+        for batch_size in [3, 40]:
+            forget_event_descriptions()
+            with CaptureQueriesContext(connection) as queries:
+                self.assertEqual(next(archive_events(cutoff, batch_size=batch_size)), batch_size)
+            counts.append(len(queries))
+        self.assertEqual(counts[0], counts[1])
+        self.assertEqual(RideEventArchive.objects.filter(description='Old event 39').count(), 1)
+
+    def test_delete_chunked_by_query_params(self):
+        cutoff = timezone.now() - timedelta(days=90)
+        with mock.patch.object(connection.features, 'max_query_params', 2), \
+                CaptureQueriesContext(connection) as queries:
+            self.assertEqual(list(archive_events(cutoff, batch_size=5)), [3])
+        deletes = [query['sql'] for query in queries if query['sql'].startswith('DELETE')]
+        self.assertEqual(len(deletes), 2)
+        self.assertEqual(RideEvent.objects.count(), 2)
+        self.assertEqual(RideEventArchive.objects.count(), 3)
+
+
+class RideRollupTests(TestCase):
+    """
+    The incrementally maintained rollups always match a rebuild from scratch
+    """
+
+    def rollup_state(self):
+        return (
+            {row.status: row.count for row in RideStatusCount.objects.exclude(count=0)},
+            {(row.hour, row.status): row.count for row in RideHourlyRollup.objects.exclude(count=0)},
+        )
+
+    def test_incremental_updates_match_rebuild(self):
+        admin = create_user('admin', role='admin')
+        driver = create_user('driver')
+        client = APIClient()
+        client.force_authenticate(admin)
+        rides = [
+            Ride.objects.create(status='REQUESTED', id_rider=admin, pickup_latitude=40.7, pickup_longitude=-74,
+                                pickup_time=timezone.now())
+            for _ in range(5)
+        ]
+        RideEvent.objects.create(id_ride=rides[0], old_status='REQUESTED', new_status='IN_PROGRESS',
+                                 created_at=timezone.now() - timedelta(days=2))
+
+        client.post(f'/api/rides/{rides[0].id_ride}/start/', {'driver_id': driver.id_user})
+        client.post(f'/api/rides/{rides[0].id_ride}/complete/')
+        client.post('/api/rides/bulk_transition/', {'ride_ids': [r.id_ride for r in rides[1:3]], 'status': 'CANCELLED'},
+                    format='json')
+        client.patch(f'/api/rides/{rides[3].id_ride}/', {'status': 'COMPLETED'}, format='json')
+        rides[4].delete()
+
+        status_counts, hourly = self.rollup_state()
+        self.assertEqual(status_counts, {'CANCELLED': 2, 'COMPLETED': 2})
+        self.assertEqual(sorted(status for _, status in hourly), ['CANCELLED', 'COMPLETED', 'IN_PROGRESS',
+                                                                  'IN_PROGRESS', 'REQUESTED'])
+        rebuild()
+        self.assertEqual(self.rollup_state(), (status_counts, hourly))
+
+        stats = client.get('/api/rides/stats/', {'hours': 1}).data
+        self.assertEqual(stats['status_counts'], status_counts)
+        self.assertEqual({row['status']: row['count'] for row in stats['hourly']},
+                         {'REQUESTED': 4, 'IN_PROGRESS': 1, 'COMPLETED': 1, 'CANCELLED': 2})
+
+    def test_save_uses_loaded_status(self):
+        admin = create_user('admin', role='admin')
+        Ride.objects.create(status='REQUESTED', id_rider=admin, pickup_latitude=40.7, pickup_longitude=-74,
+                            pickup_time=timezone.now())
+        ride = Ride.objects.get()
+        ride.status = 'CANCELLED'
+        with CaptureQueriesContext(connection) as queries:
+            ride.save()
+        self.assertFalse([query for query in queries if query['sql'].startswith('SELECT "ride"."status"')])
+        self.assertEqual(self.rollup_state()[0], {'CANCELLED': 1})
+
+        ride.status = 'COMPLETED'
+        ride.save()
+        # Deferred status: read once to count the change
+        deferred = Ride.objects.defer('status').get()
+        deferred.status = 'REQUESTED'
+        with CaptureQueriesContext(connection) as queries:
+            deferred.save()
+        self.assertEqual(len([query for query in queries if query['sql'].startswith('SELECT')]), 1)
+        self.assertEqual(self.rollup_state()[0], {'REQUESTED': 1})
+
+    def test_migration_seeds_rollups(self):
+        admin = create_user('admin', role='admin')
+        for status in ['REQUESTED', 'REQUESTED', 'COMPLETED']:
+            Ride.objects.create(status=status, id_rider=admin, pickup_latitude=40.7, pickup_longitude=-74,
+                                pickup_time=timezone.now())
+        expected = self.rollup_state()
+        RideStatusCount.objects.all().delete()
+        RideHourlyRollup.objects.all().delete()
+
+        migration = import_module('rides.migrations.0008_seed_ride_rollups')
+        state = MigrationLoader(connection).project_state(('rides', '0008_seed_ride_rollups'))
+        migration.seed_rollups(state.apps, mock.Mock(connection=connection))
+        self.assertEqual(self.rollup_state(), expected)
+
+
+class CompactColumnTests(TestCase):
+    """
+    Statuses and event descriptions are stored as integers but read as strings
+    """
+
+    def test_round_trip(self):
+        rider = create_user('rider')
+        ride = Ride.objects.create(status='IN_PROGRESS', id_rider=rider, pickup_latitude=40.7, pickup_longitude=-74,
+                                   pickup_time=timezone.now())
+        for _ in range(2):
+            RideEvent.objects.create(id_ride=ride, description='GPS update', old_status='REQUESTED',
+                                     new_status='IN_PROGRESS')
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT status FROM ride WHERE id_ride = %s', [ride.id_ride])
+            self.assertEqual(cursor.fetchone(), (STATUS_CODES['IN_PROGRESS'],))
+            cursor.execute('SELECT DISTINCT description, old_status, new_status FROM ride_event')
+            self.assertEqual(cursor.fetchall(), [(EventDescription.objects.get(text='GPS update').pk,
+                                                  STATUS_CODES['REQUESTED'], STATUS_CODES['IN_PROGRESS'])])
+
+        self.assertEqual(Ride.objects.get(status='IN_PROGRESS').status, 'IN_PROGRESS')
+        self.assertFalse(Ride.objects.filter(status='UNKNOWN').exists())
+        events = RideEvent.objects.filter(description='GPS update').values_list('description', 'new_status')
+        self.assertEqual(list(events), [('GPS update', 'IN_PROGRESS')] * 2)
+        self.assertFalse(RideEvent.objects.filter(description='Never used').exists())
+        with self.assertRaises(ValueError):
+            Ride.objects.filter(pk=ride.pk).update(status='UNKNOWN')
+
+    def test_rolled_back_descriptions_arent_cached(self):
+        rider = create_user('rider')
+        ride = Ride.objects.create(status='REQUESTED', id_rider=rider, pickup_latitude=40.7, pickup_longitude=-74,
+                                   pickup_time=timezone.now())
+        interner = RideEvent._meta.get_field('description').interner
+        # The wrapper itself, as the field gets it, not the django.db.connection proxy
+        wrapper = connections['default']
+        # The test's rollback undoes the commit cached below
+        self.addCleanup(forget_event_descriptions)
+        cached = interner._ids.setdefault(wrapper.settings_dict['NAME'], {})
+        with self.captureOnCommitCallbacks(execute=True):
+            RideEvent.objects.create(id_ride=ride, description='Kept', new_status='REQUESTED')
+            with transaction.atomic():
+                RideEvent.objects.create(id_ride=ride, description='Rolled back', new_status='REQUESTED')
+                self.assertIsNotNone(interner.get_id('Rolled back', wrapper, create=False))
+                transaction.set_rollback(True)
+            self.assertIsNone(interner.get_id('Rolled back', wrapper, create=False))
+            # Read back, but not shared with other connections before the commit
+            self.assertEqual(RideEvent.objects.get(description='Kept').description, 'Kept')
+            self.assertNotIn('Kept', cached)
+        self.assertEqual(cached['Kept'], EventDescription.objects.get(text='Kept').pk)
+        self.assertNotIn('Rolled back', cached)
+
+    def test_only_equality_lookups_on_descriptions(self):
+        self.assertFalse(RideEvent.objects.filter(description__in=['GPS update'], description__isnull=False).exists())
+        for lookup in ['icontains', 'startswith', 'gt', 'lower']:
+            with self.assertRaises(FieldError):
+                RideEvent.objects.filter(**{f'description__{lookup}': 'GPS'})
+
+
+@override_settings(RIDE_RESPONSE_CACHE_TIMEOUT=0)
+class QueryPlanTests(TestCase):
+    """
+    Every SELECT the read endpoints run must be answered from an index:
+    EXPLAIN QUERY PLAN may show neither a full table scan nor a temporary
+    B-tree sort, apart from the ALLOWED cases
+    """
+
+    # (path fragment, plan line): inherent scans and sorts
+    ALLOWED = {
+        # The rider email filter drives the query from the user index, so the
+        # matching riders' rides are sorted after the join
+        ('rider_email=', 'USE TEMP B-TREE FOR ORDER BY'),
+        # Only the rides of the nearest grid cells are sorted by distance
+        ('sort_by_distance=', 'USE TEMP B-TREE FOR ORDER BY'),
+        # The description lookup table is small and read whole, see
+        # rides.fields.Interner
+        ('', 'SCAN ride_event_description'),
+        # The user list isn't filtered or paginated
+        ('/api/users/', 'SCAN user'),
+        # One row per status
+        ('/api/rides/stats/', 'SCAN ride_status_count'),
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = create_user('admin', role='admin')
+        driver = create_user('driver')
+        now = timezone.now()
+        for i, status in enumerate(['REQUESTED', 'IN_PROGRESS', 'COMPLETED', 'CANCELLED'] * 3):
+            cls.ride = Ride.objects.create(
+                status=status, id_rider=cls.admin, id_driver=None if status == 'REQUESTED' else driver,
+                pickup_latitude=40.7 + i / 100, pickup_longitude=-74, pickup_time=now + timedelta(hours=i)
+            )
+            for hours in [1, 2, 30]:
+                RideEvent.objects.create(id_ride=cls.ride, new_status=status, user=driver,
+                                         created_at=now - timedelta(hours=hours + i))
+        RideEventArchive.objects.create(id_ride_event=10 ** 6, id_ride=cls.ride, new_status='REQUESTED',
+                                        created_at=now - timedelta(days=200))
+
+    def get_paths(self):
+        ride_id = self.ride.id_ride
+        paths = [
+            '/api/rides/', '/api/rides/?page=2&page_size=2', '/api/rides/?events_limit=2',
+            '/api/rides/?events_window_hours=48', '/api/rides/?rider_email=adm',
+            '/api/rides/?rider_email=admin@example.com&rider_email_match=exact',
+            '/api/rides/?lat=40.7&lng=-74&sort_by_distance=true', f'/api/rides/{ride_id}/',
+            f'/api/rides/{ride_id}/events/', f'/api/rides/{ride_id}/events/?history=full', '/api/rides/stats/',
+            '/api/rides/export/?format=ndjson', '/api/rides/export/?format=csv&status=completed',
+            '/api/events/', f'/api/events/?ride_id={ride_id}', '/api/events/?pagination=cursor&page_size=2',
+            f'/api/events/?pagination=cursor&page_size=2&ride_id={ride_id}', '/api/events/export/?format=ndjson',
+            '/api/users/', '/api/rides/?fields=id_ride,status', '/api/rides/?expand=driver&status=completed',
+            '/api/rides/?rider_email=adm&fields=status', f'/api/rides/{ride_id}/events/?history=full&fields=status',
+        ]
+        for ordering in ['', 'pickup_time', '-pickup_time', 'created_at', 'updated_at', '-updated_at']:
+            for status in ['', 'requested']:
+                paths.append(f'/api/rides/?status={status}&ordering={ordering}')
+                paths.append(f'/api/rides/?pagination=cursor&page_size=2&status={status}&ordering={ordering}')
+        return paths
+
+    def get_bad_plan_lines(self, path, sql):
+        tables = set(connection.introspection.table_names())
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+            plan = [row[-1] for row in cursor.fetchall()]
+        bad = []
+        for line in plan:
+            words = line.replace('SCAN TABLE ', 'SCAN ').split()
+            full_scan = words[0] == 'SCAN' and words[1] in tables and 'USING' not in words
+            if (full_scan or 'USE TEMP B-TREE' in line) and not any(
+                fragment in path and line == allowed for fragment, allowed in self.ALLOWED
+            ):
+                bad.append(line)
+        return bad
+
+    def test_read_endpoints_use_indexes(self):
+        client = APIClient()
+        client.force_authenticate(self.admin)
+        problems = []
+        for path in self.get_paths():
+            with CaptureQueriesContext(connection) as queries:
+                response = client.get(path)
+                if response.streaming:
+                    b''.join(response.streaming_content)
+                elif 'cursor' in path:
+                    # The following page adds the keyset condition
+                    response = client.get(response.data['next'])
+            self.assertEqual(response.status_code, 200, path)
+            for query in queries.captured_queries:
+                if query['sql'].startswith('SELECT'):
+                    bad = self.get_bad_plan_lines(path, query['sql'])
+                    if bad:
+                        problems.append(f"{path}\n  {query['sql']}\n  {bad}")
+        self.assertEqual(problems, [], '\n'.join(problems))
+
+
+@override_settings(RIDE_RESPONSE_CACHE_TIMEOUT=0)
+class ConditionalRequestTests(TestCase):
+    """
+    Unchanged rides and events are answered with a 304 computed from
+    aggregates, and any change gives a new ETag
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = create_user('admin', role='admin')
+        cls.ride = Ride.objects.create(status='REQUESTED', id_rider=cls.admin, pickup_latitude=40.7,
+                                       pickup_longitude=-74, pickup_time=timezone.now())
+        RideEvent.objects.create(id_ride=cls.ride, new_status='REQUESTED', user=cls.admin)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def assertNotModified(self, path, **params):
+        first = self.client.get(path, params)
+        self.assertEqual(first.status_code, 200)
+        self.assertTrue(first['ETag'].startswith('W/"'))
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(path, params, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(response.status_code, 304, path)
+        self.assertEqual(response['ETag'], first['ETag'])
+        self.assertEqual(response.content, b'')
+        # No ride or event rows were loaded
+        loaded = [query for query in queries.captured_queries
+                  if '"ride"."pickup_latitude"' in query['sql'] or '"ride_event"."description"' in query['sql']]
+        self.assertFalse(loaded, path)
+        response = self.client.get(path, params, HTTP_IF_MODIFIED_SINCE=first['Last-Modified'])
+        self.assertEqual(response.status_code, 304, path)
+        return first['ETag']
+
+    def test_not_modified_until_changed(self):
+        paths = [
+            ('/api/rides/', {}), ('/api/rides/', {'status': 'requested', 'fields': 'status'}),
+            ('/api/rides/', {'rider_email': 'adm'}), (f'/api/rides/{self.ride.id_ride}/', {}),
+            (f'/api/rides/{self.ride.id_ride}/events/', {}),
+            (f'/api/rides/{self.ride.id_ride}/events/', {'history': 'full'}),
+        ]
+        etags = [self.assertNotModified(path, **params) for path, params in paths]
+        self.assertEqual(len(set(etags)), len(etags))
+
+        self.client.post(f'/api/rides/{self.ride.id_ride}/cancel/')
+        for (path, params), etag in zip(paths, etags):
+            response = self.client.get(path, params, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 200, path)
+            self.assertNotEqual(response['ETag'], etag, path)
+
+        # Deletions change the ride count
+        ride = Ride.objects.create(status='REQUESTED', id_rider=self.admin, pickup_latitude=40.7,
+                                   pickup_longitude=-74, pickup_time=timezone.now())
+        etag = self.assertNotModified('/api/rides/', fields='status')
+        ride.delete()
+        self.assertEqual(self.client.get('/api/rides/', {'fields': 'status'}, HTTP_IF_NONE_MATCH=etag).status_code,
+                         200)
+
+    def test_bulk_inserts_change_list_etag(self):
+        etags = [self.assertNotModified('/api/rides/', **params) for params in [{}, {'status': 'requested'}]]
+        # Like rides.datagen: no signals, so no rollup update, and an
+        # updated_at older than the newest ride's
+        ride = Ride.objects.bulk_create([
+            Ride(status='REQUESTED', id_rider=self.admin, pickup_latitude=40.7, pickup_longitude=-74,
+                 pickup_time=timezone.now())
+        ])[0]
+        Ride.objects.filter(pk=ride.pk).update(updated_at=self.ride.updated_at - timedelta(days=1))
+        for params, etag in zip([{}, {'status': 'requested'}], etags):
+            self.assertEqual(self.client.get('/api/rides/', params, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_async_endpoints(self):
+        token = Token.objects.create(user=self.admin).key
+        get = async_to_sync(AsyncClient().get)
+        for path in ['/api/async/rides/', f'/api/async/rides/{self.ride.id_ride}/']:
+            first = get(path, headers={'Authorization': f'Token {token}'})
+            self.assertEqual(first.status_code, 200, path)
+            response = get(path, headers={'Authorization': f'Token {token}', 'If-None-Match': first['ETag']})
+            self.assertEqual(response.status_code, 304, path)
+            self.assertEqual(response['ETag'], first['ETag'])
+
+
+class RideEventStreamTests(TestCase):
+    """
+    New events are pushed to the open streams whose filters match, and
+    streams resume after Last-Event-ID
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = admin = create_user('admin', role='admin')
+        cls.headers = {'Authorization': f'Token {Token.objects.create(user=admin).key}'}
+        cls.rides = [
+            Ride.objects.create(status='REQUESTED', id_rider=admin, pickup_latitude=40.7, pickup_longitude=-74,
+                                pickup_time=timezone.now())
+            for _ in range(2)
+        ]
+
+    def setUp(self):
+        self.addCleanup(event_broker.subscriptions.clear)
+        # The descriptions cached by the commit callbacks below are rolled back
+        self.addCleanup(forget_event_descriptions)
+
+    def transition(self, ride, target, **kwargs):
+        # on_commit never fires inside the test's transaction
+        with self.captureOnCommitCallbacks(execute=True):
+            transition_ride(ride.id_ride, target, **kwargs)
+        return RideEvent.objects.filter(id_ride=ride).latest('id_ride_event')
+
+    async def open(self, path, **headers):
+        response = await AsyncClient().get(path, headers={**self.headers, **headers})
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        stream = aiter(response.streaming_content)
+        self.assertEqual(await anext(stream), b'retry: 3000\n\n')
+        return stream
+
+    async def read(self, stream):
+        message = (await asyncio.wait_for(anext(stream), 5)).decode()
+        if message.startswith(':'):
+            return message
+        lines = dict(line.split(': ', 1) for line in message.strip().split('\n'))
+        return int(lines['id']), json.loads(lines['data'])
+
+    def test_push_and_resume(self):
+        async def run():
+            first, second = self.rides
+            cancelled = await self.open('/api/async/events/stream/?status=cancelled')
+            of_ride = await self.open(f'/api/async/rides/{second.id_ride}/events/stream/')
+
+            started = await sync_to_async(self.transition)(first, 'IN_PROGRESS', driver=self.admin)
+            event = await sync_to_async(self.transition)(second, 'CANCELLED')
+            expected = await sync_to_async(lambda: json.loads(JSONRenderer().render(
+                RideEventSerializer(RideEvent.objects.get(pk=event.pk)).data
+            )))()
+            self.assertEqual(await self.read(cancelled), (event.pk, expected))
+            self.assertEqual(await self.read(of_ride), (event.pk, expected))
+
+            # Resumed from the database
+            stream = await self.open('/api/async/events/stream/', **{'Last-Event-ID': str(started.pk - 1)})
+            self.assertEqual([(await self.read(stream))[0] for _ in range(2)], [started.pk, event.pk])
+            ids = await sync_to_async(lambda: list(
+                RideEvent.objects.filter(id_ride=first).order_by('id_ride_event').values_list('pk', flat=True)
+            ))()
+            with override_settings(RIDE_EVENT_STREAM_KEEPALIVE=0.01):
+                stream = await self.open(f'/api/async/events/stream/?ride_id={first.id_ride}&last_event_id=0')
+                self.assertEqual([(await self.read(stream))[0] for _ in ids], ids)
+                self.assertEqual(await self.read(stream), ': keepalive\n\n')
+
+            get = AsyncClient().get
+            self.assertEqual((await get('/api/async/rides/999999/events/stream/', headers=self.headers)).status_code,
+                             404)
+            self.assertEqual((await get('/api/async/events/stream/?ride_id=x', headers=self.headers)).status_code,
+                             400)
+            self.assertEqual((await get('/api/async/events/stream/')).status_code, 401)
+        async_to_sync(run)()
+
+    def test_nothing_published_without_streams(self):
+        event = RideEvent.objects.create(id_ride=self.rides[0], new_status='REQUESTED', user=self.admin)
+        # The user isn't loaded, publishing would query it
+        event = RideEvent.objects.get(pk=event.pk)
+        published = event_broker.stats()['published']
+        with mock.patch('rides.streams.StreamEvent') as stream_event, self.assertNumQueries(0):
+            event_broker.publish([event])
+        stream_event.assert_not_called()
+        self.assertEqual(event_broker.stats()['published'], published)
+
+
+class BulkTransitionTests(TestCase):
+    """
+    Bulk transitions update every eligible ride at once, or none of them
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = create_user('admin', role='admin')
+        cls.driver = create_user('driver', role='driver')
+        cls.rides = [
+            Ride.objects.create(status=status, id_rider=cls.admin,
+                                id_driver=None if status == 'REQUESTED' else cls.driver,
+                                pickup_latitude=40.7, pickup_longitude=-74, pickup_time=timezone.now())
+            for status in ['REQUESTED', 'IN_PROGRESS', 'COMPLETED']
+        ]
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def post(self, ride_ids, target):
+        return self.client.post('/api/rides/bulk_transition/', {'ride_ids': ride_ids, 'status': target},
+                                format='json')
+
+    def test_mixed_results(self):
+        ride_ids = [ride.id_ride for ride in self.rides]
+        with CaptureQueriesContext(connection) as captured:
+            response = self.post(ride_ids + [999999, ride_ids[0]], 'CANCELLED')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['updated'], 2)
+        self.assertEqual([(result['id_ride'], result['result'], result['old_status'])
+                          for result in response.data['results']],
+                         [(ride_ids[0], 'updated', 'REQUESTED'), (ride_ids[1], 'updated', 'IN_PROGRESS'),
+                          (ride_ids[2], 'invalid_status', 'COMPLETED'), (999999, 'not_found', None)])
+        # One UPDATE per old status and one insert of the events
+        statements = [query['sql'] for query in captured]
+        self.assertEqual(sum(sql.startswith('UPDATE "ride" ') for sql in statements), 2)
+        self.assertEqual(sum(sql.startswith('INSERT INTO "ride_event" ') for sql in statements), 1)
+
+        self.assertEqual(list(Ride.objects.order_by('id_ride').values_list('status', flat=True)),
+                         ['CANCELLED', 'CANCELLED', 'COMPLETED'])
+        events = RideEvent.objects.order_by('id_ride')
+        self.assertEqual([(event.id_ride_id, event.old_status, event.description, event.user_id) for event in events],
+                         [(ride_ids[0], 'REQUESTED', 'Ride cancelled', self.admin.id_user),
+                          (ride_ids[1], 'IN_PROGRESS', 'Ride cancelled', self.admin.id_user)])
+        self.assertEqual(RideStatusCount.objects.get(status='CANCELLED').count, 2)
+
+    def test_query_count_independent_of_batch(self):
+        rides = [
+            Ride.objects.create(status='REQUESTED', id_rider=self.admin, pickup_latitude=40.7,
+                                pickup_longitude=-74, pickup_time=timezone.now())
+            for _ in range(10)
+        ]
+        self.addCleanup(forget_event_descriptions)
+        self.post([rides.pop().id_ride], 'CANCELLED')
+        counts = []
+        for batch in [rides[:1], rides[1:]]:
+            forget_event_descriptions()
+            with CaptureQueriesContext(connection) as queries:
+                response = self.post([ride.id_ride for ride in batch], 'CANCELLED')
+            self.assertEqual(response.data['updated'], len(batch))
+            counts.append(len(queries))
+        self.assertEqual(counts[0], counts[1])
+
+    def test_conflict_rolls_back(self):
+        update = QuerySet.update
+
+        def concurrent_update(queryset, **kwargs):
+            # Another request completes the second ride between the read and
+            # the write
+            if queryset.model is Ride and kwargs.get('status') == 'CANCELLED':
+                update(Ride.objects.filter(pk=self.rides[1].pk), status='COMPLETED')
+            return update(queryset, **kwargs)
+
+        with mock.patch.object(QuerySet, 'update', concurrent_update):
+            response = self.post([self.rides[0].id_ride, self.rides[1].id_ride], 'CANCELLED')
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(list(Ride.objects.order_by('id_ride').values_list('status', flat=True)),
+                         ['REQUESTED', 'IN_PROGRESS', 'COMPLETED'])
+        self.assertFalse(RideEvent.objects.exists())
+        self.assertFalse(RideStatusCount.objects.filter(status='CANCELLED', count__gt=0).exists())
+
+    def test_conflict_on_change_between_allowed_statuses(self):
+        update = QuerySet.update
+
+        def concurrent_update(queryset, **kwargs):
+            # Another request starts the first ride, which can still be
+            # cancelled, between the read and the write
+            if queryset.model is Ride and kwargs.get('status') == 'CANCELLED':
+                update(Ride.objects.filter(pk=self.rides[0].pk), status='IN_PROGRESS')
+            return update(queryset, **kwargs)
+
+        with mock.patch.object(QuerySet, 'update', concurrent_update):
+            response = self.post([self.rides[0].id_ride, self.rides[1].id_ride], 'CANCELLED')
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(list(Ride.objects.order_by('id_ride').values_list('status', flat=True)),
+                         ['REQUESTED', 'IN_PROGRESS', 'COMPLETED'])
+        self.assertFalse(RideEvent.objects.exists())
+
+
+class ConcurrentTransitionTests(TransactionTestCase):
+    """
+    Transitions are single conditional UPDATEs, so only one of many
+    concurrent requests for the same ride can win
+    """
+    workers = 8
+
+    def setUp(self):
+        self.admin = create_user('admin', role='admin')
+        self.driver = create_user('driver')
+        self.ride = Ride.objects.create(
+            status='REQUESTED', id_rider=self.admin, pickup_latitude=40.7, pickup_longitude=-74,
+            pickup_time=timezone.now()
+        )
+
+    def hammer(self, path, data=None):
+        barrier = threading.Barrier(self.workers)
+
+        def post(_):
+            client = APIClient()
+            client.force_authenticate(self.admin)
+            barrier.wait()
+            try:
+                return client.post(path, data or {}, format='json').status_code
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(self.workers) as executor:
+            return sorted(executor.map(post, range(self.workers)))
+
+    def test_concurrent_cancels(self):
+        codes = self.hammer(f'/api/rides/{self.ride.id_ride}/cancel/')
+
+        self.assertEqual(codes, [200] + [400] * (self.workers - 1))
+        self.ride.refresh_from_db()
+        self.assertEqual(self.ride.status, 'CANCELLED')
+        self.assertEqual(RideEvent.objects.filter(id_ride=self.ride, new_status='CANCELLED').count(), 1)
+
+    def test_concurrent_starts(self):
+        codes = self.hammer(f'/api/rides/{self.ride.id_ride}/start/', {'driver_id': self.driver.id_user})
+
+        self.assertEqual(codes, [200] + [400] * (self.workers - 1))
+        self.ride.refresh_from_db()
+        self.assertEqual((self.ride.status, self.ride.id_driver_id), ('IN_PROGRESS', self.driver.id_user))
+        event = RideEvent.objects.get(id_ride=self.ride)
+        self.assertEqual((event.old_status, event.new_status, event.user_id),
+                         ('REQUESTED', 'IN_PROGRESS', self.driver.id_user))
+
+    def test_complete_after_start(self):
+        client = APIClient()
+        client.force_authenticate(self.admin)
+        path = f'/api/rides/{self.ride.id_ride}'
+
+        self.assertEqual(client.post(f'{path}/complete/').status_code, 400)
+        self.assertEqual(client.post(f'{path}/start/', {'driver_id': self.driver.id_user}).status_code, 200)
+        self.assertEqual(client.post(f'{path}/complete/').status_code, 200)
+        self.assertEqual(client.post(f'{path}/cancel/').status_code, 400)
+        self.assertEqual(client.post('/api/rides/999999/cancel/').status_code, 404)
+        self.assertEqual(
+            list(RideEvent.objects.order_by('id_ride_event').values_list('new_status', 'user_id')),
+            [('IN_PROGRESS', self.driver.id_user), ('COMPLETED', self.driver.id_user)]
+        )
+
+
+@override_settings(DATABASE_READ_REPLICAS=['replica'], RIDE_RESPONSE_CACHE_TIMEOUT=0)
+class ReadReplicaRoutingTests(TestCase):
+    """
+    Safe API reads go to the replica, except right after the user wrote
+    """
+    databases = {'default', 'replica'}
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = create_user('admin', role='admin')
+        create_user('driver', role='driver')
+        cls.ride = Ride.objects.create(
+            status='REQUESTED', id_rider=cls.admin, pickup_latitude=40.7, pickup_longitude=-74,
+            pickup_time=timezone.now()
+        )
+        # The stand-in replica lags behind: it only has an older copy of the ride
+        replica_admin = User.objects.db_manager('replica').create_user(
+            'admin', 'admin@example.com', 'password', first_name='Admin', last_name='Tester',
+            phone_number='555-000-0000', role='admin', id_user=cls.admin.id_user
+        )
+        Ride.objects.using('replica').create(
+            id_ride=cls.ride.id_ride, status='REQUESTED', id_rider=replica_admin, pickup_latitude=40.7,
+            pickup_longitude=-74, pickup_time=cls.ride.pickup_time
+        )
+        Ride.objects.using('replica').create(
+            status='COMPLETED', id_rider=replica_admin, pickup_latitude=40.7, pickup_longitude=-74,
+            pickup_time=cls.ride.pickup_time
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def test_reads_use_replica(self):
+        self.assertEqual(self.client.get('/api/rides/').data['count'], 2)
+        self.assertEqual(len(self.client.get('/api/users/').data), 1)
+
+    def test_writes_use_primary_and_pin_reads(self):
+        response = self.client.post(f'/api/rides/{self.ride.id_ride}/cancel/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Ride.objects.get(id_ride=self.ride.id_ride).status, 'CANCELLED')
+        self.assertEqual(Ride.objects.using('replica').get(id_ride=self.ride.id_ride).status, 'REQUESTED')
+
+        # Pinned to the primary: the user sees their own write
+        detail = self.client.get(f'/api/rides/{self.ride.id_ride}/')
+        self.assertEqual(detail.data['status'], 'CANCELLED')
+        self.assertEqual(len(self.client.get('/api/events/').data), 1)
+
+        # Once the pin expires, reads go back to the replica
+        cache.clear()
+        self.assertEqual(self.client.get(f'/api/rides/{self.ride.id_ride}/').data['status'], 'REQUESTED')
+
+    @override_settings(DATABASE_READ_REPLICAS=[])
+    def test_without_replicas_reads_use_primary(self):
+        self.assertEqual(self.client.get('/api/rides/').data['count'], 1)
+        self.assertEqual(len(self.client.get('/api/users/').data), 2)
+
+
+class SQLiteProfileTests(SimpleTestCase):
+    """
+    Each SQLite profile applies its PRAGMAs to new connections
+    """
+
+    def get_pragmas(self, profile):
+        path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, path)
+        handler = ConnectionHandler({'default': {}, 'profile': {
+            **settings.DATABASES['default'], **settings.SQLITE_PROFILES[profile],
+            'NAME': os.path.join(path, 'profile.sqlite3'),
+        }})
+        self.addCleanup(handler['profile'].close)
+        with handler['profile'].cursor() as cursor:
+            pragmas = {}
+            for pragma in ['journal_mode', 'synchronous', 'cache_size', 'mmap_size', 'temp_store']:
+                cursor.execute(f'PRAGMA {pragma}')
+                pragmas[pragma] = cursor.fetchone()[0]
+        return handler['profile'], pragmas
+
+    def test_default_profile(self):
+        connection, pragmas = self.get_pragmas('default')
+        self.assertEqual((pragmas['journal_mode'], pragmas['synchronous']), ('delete', 2))
+        self.assertIsNone(connection.transaction_mode)
+
+    def test_performance_profile(self):
+        connection, pragmas = self.get_pragmas('performance')
+        # synchronous=NORMAL is 1, temp_store=MEMORY is 2
+        self.assertEqual(pragmas, {'journal_mode': 'wal', 'synchronous': 1, 'cache_size': -65536,
+                                   'mmap_size': 268435456, 'temp_store': 2})
+        self.assertEqual(connection.transaction_mode, 'IMMEDIATE')
+        self.assertEqual(connection.settings_dict['CONN_MAX_AGE'], 600)
+
+    def test_performance_asgi_profile(self):
+        connection, pragmas = self.get_pragmas('performance_asgi')
+        self.assertEqual(pragmas['journal_mode'], 'wal')
+        self.assertEqual(connection.transaction_mode, 'IMMEDIATE')
+        self.assertEqual(connection.settings_dict['CONN_MAX_AGE'], 0)
+
+
+@override_settings(RIDE_RESPONSE_CACHE_TIMEOUT=0)
+class RequestMetricsTests(TestCase):
+    """
+    Server-Timing reports every query of the request
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = create_user('admin', role='admin')
+        ride = Ride.objects.create(status='REQUESTED', id_rider=cls.admin, pickup_latitude=40.7,
+                                   pickup_longitude=-74, pickup_time=timezone.now())
+        RideEvent.objects.create(id_ride=ride, new_status='REQUESTED', user=cls.admin)
+        cls.token = Token.objects.create(user=cls.admin)
+
+    def setUp(self):
+        token_cache.clear()
+
+    def get_timing(self, response):
+        timing = dict(entry.split(';', 1) for entry in response['Server-Timing'].split(', '))
+        return int(timing['db'].split('desc="')[1].split()[0]), timing
+
+    def test_server_timing_counts_queries(self):
+        headers = {'HTTP_AUTHORIZATION': f'Token {self.token.key}'}
+        for path in ['/api/rides/', '/api/events/', '/api/users/', '/api/rides/999999/']:
+            with CaptureQueriesContext(connection) as captured:
+                response = self.client.get(path, **headers)
+            queries, timing = self.get_timing(response)
+            self.assertEqual(queries, len(captured), path)
+            self.assertEqual(set(timing), {'db', 'view', 'render', 'total'})
+
+        # Including the queries the async views run on threads
+        with CaptureQueriesContext(connection) as captured:
+            response = async_to_sync(AsyncClient().get)('/api/async/rides/', headers={
+                'Authorization': f'Token {self.token.key}'
+            })
+        self.assertEqual(self.get_timing(response)[0], len(captured))
+
+        with override_settings(REQUEST_METRICS_SERVER_TIMING=False):
+            self.assertFalse(self.client.get('/api/rides/', **headers).has_header('Server-Timing'))
+
+
+class CachedTokenAuthenticationTests(TestCase):
+    """
+    Tokens are authenticated from the cache until the token or the user's
+    role/active flag changes
+    """
+
+    def setUp(self):
+        token_cache.clear()
+        self.admin = create_user('admin', role='admin')
+        self.token = Token.objects.create(user=self.admin)
+        self.client.defaults['HTTP_AUTHORIZATION'] = f'Token {self.token.key}'
+
+    def test_cached_requests_skip_token_query(self):
+        with record_queries() as first:
+            self.assertEqual(self.client.get('/api/users/').status_code, 200)
+        with record_queries() as second:
+            self.assertEqual(self.client.get('/api/users/').status_code, 200)
+        self.assertEqual(second.count, first.count - 1)
+
+    def test_role_and_active_changes_invalidate(self):
+        self.client.get('/api/users/')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.admin.role = 'rider'
+            self.admin.save()
+        self.assertEqual(self.client.get('/api/users/').status_code, 403)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.admin.role = 'admin'
+            self.admin.is_active = False
+            self.admin.save()
+        self.assertEqual(self.client.get('/api/users/').status_code, 401)
+
+    def test_token_deletion_invalidates(self):
+        self.client.get('/api/users/')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.token.delete()
+        self.assertEqual(self.client.get('/api/users/').status_code, 401)
+
+
+@override_settings(RIDE_RESPONSE_CACHE_TIMEOUT=0)
+class AsyncReadEndpointTests(TestCase):
+    """
+    The async read endpoints answer exactly like their DRF counterparts
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        admin = create_user('admin', role='admin')
+        cls.auth = {'HTTP_AUTHORIZATION': f'Token {Token.objects.create(user=admin).key}'}
+        cls.rider_auth = {'HTTP_AUTHORIZATION': f'Token {Token.objects.create(user=create_user("rider")).key}'}
+        now = timezone.now()
+        for i in range(5):
+            ride = Ride.objects.create(
+                status='REQUESTED' if i % 2 else 'COMPLETED', id_rider=admin, pickup_latitude=40.7 + i / 100,
+                pickup_longitude=-74, pickup_time=now + timedelta(hours=i)
+            )
+            RideEvent.objects.create(id_ride=ride, new_status=ride.status, user=admin,
+                                     created_at=now - timedelta(hours=i))
+        cls.ride = ride
+
+    def assertSameResponse(self, path, **extra):
+        expected = self.client.get(f'/api/{path}', **extra)
+        headers = {'Authorization': extra['HTTP_AUTHORIZATION']} if extra else None
+        actual = async_to_sync(AsyncClient().get)(f'/api/async/{path}', headers=headers)
+        self.assertEqual(actual.status_code, expected.status_code, path)
+        # Pagination links point back at the endpoint that was called
+        self.assertEqual(actual.content.replace(b'/api/async/', b'/api/'), expected.content, path)
+
+    def test_ride_list(self):
+        for query in ['', '?status=requested', '?ordering=pickup_time&page_size=2', '?page=2&page_size=2',
+                      '?page=last&page_size=2', '?page=99', '?pagination=cursor&page_size=2',
+                      '?lat=40.7&lng=-74&sort_by_distance=true&page_size=3', '?events_limit=0',
+                      '?fields=id_ride,status&expand=rider']:
+            self.assertSameResponse(f'rides/{query}', **self.auth)
+
+    def test_ride_detail(self):
+        for pk in [self.ride.id_ride, 999999, 'abc']:
+            self.assertSameResponse(f'rides/{pk}/', **self.auth)
+
+    def test_event_list(self):
+        for query in ['', f'?ride_id={self.ride.id_ride}', '?pagination=cursor&page_size=2']:
+            self.assertSameResponse(f'events/{query}', **self.auth)
+
+    def test_authentication_errors(self):
+        self.assertSameResponse('rides/')
+        self.assertSameResponse('rides/', HTTP_AUTHORIZATION='Token invalid')
+        self.assertSameResponse('rides/', **self.rider_auth)
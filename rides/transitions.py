@@ -0,0 +1,155 @@
+"""
+Ride status transitions shared by the ride actions
+"""
+from django.db import transaction
+from django.utils import timezone
+
+from . import rollups
+from .cache import response_cache
+from .models import Ride, RideEvent
+from .streams import event_broker
+
+# Target status -> statuses a ride may move from
+TRANSITIONS = {
+    'CANCELLED': ('REQUESTED', 'IN_PROGRESS'),
+    'IN_PROGRESS': ('REQUESTED',),
+    'COMPLETED': ('IN_PROGRESS',),
+}
+
+# Transitions available through bulk_transition (starting needs a driver per ride)
+BULK_TRANSITIONS = ('CANCELLED', 'COMPLETED')
+
+EVENT_DESCRIPTIONS = {
+    'CANCELLED': 'Ride cancelled',
+    'COMPLETED': 'Ride completed',
+}
+
+UPDATED = 'updated'
+NOT_FOUND = 'not_found'
+INVALID_STATUS = 'invalid_status'
+
+
+class TransitionConflict(Exception):
+    """
+    Raised when rides changed status between the read and the write of a
+    bulk transition; the whole transition is rolled back
+    """
+
+
+def transition_ride(ride_id, target, user=None, driver=None):
+    """
+    Move a single ride to ``target`` without reading it first.
+
+    Each allowed source status is tried with an
+    ``UPDATE ... WHERE id_ride = ? AND status = ?`` that only writes the
+    changed columns, so concurrent requests can't both succeed and the
+    previous status is known from whichever statement matched. Returns that
+    previous status, or None if the ride doesn't exist or can't make the
+    transition.
+    """
+    now = timezone.now()
+    changes = {'status': target, 'updated_at': now}
+    if driver is not None:
+        changes['id_driver'] = driver
+
+    with transaction.atomic():
+        for old_status in TRANSITIONS[target]:
+            if Ride.objects.filter(id_ride=ride_id, status=old_status).update(**changes):
+                break
+        else:
+            return None
+        # The event's post_save counts it in the hourly rollup
+        rollups.status_changed(old_status, target)
+
+        if driver is not None:
+            description = f"Ride started with driver {driver.first_name} {driver.last_name}"
+            user = driver
+        elif target == 'COMPLETED':
+            description = EVENT_DESCRIPTIONS[target]
+            user = Ride.objects.filter(id_ride=ride_id).values_list('id_driver', flat=True).first()
+        else:
+            description = EVENT_DESCRIPTIONS[target]
+
+        RideEvent.objects.create(
+            id_ride_id=ride_id,
+            description=description,
+            old_status=old_status,
+            new_status=target,
+            user_id=getattr(user, 'pk', user),
+            created_at=now
+        )
+
+    return old_status
+
+
+def bulk_transition(ride_ids, target, user=None):
+    """
+    Move every ride in ``ride_ids`` that allows it to ``target`` with one
+    conditional UPDATE per current status and one bulk insert of the
+    matching RideEvents.
+
+    Returns a list of ``{'id_ride', 'result', 'old_status'}`` dicts in the
+    order of ``ride_ids``. Cancellation events are attributed to ``user``,
+    completion events to the ride's driver, like the single-ride actions.
+    """
+    allowed = TRANSITIONS[target]
+    ride_ids = list(dict.fromkeys(ride_ids))
+    now = timezone.now()
+
+    with transaction.atomic():
+        current = {
+            id_ride: (status, driver_id)
+            for id_ride, status, driver_id in Ride.objects.select_for_update().filter(
+                id_ride__in=ride_ids
+            ).values_list('id_ride', 'status', 'id_driver')
+        }
+        matched = [id_ride for id_ride in ride_ids
+                   if id_ride in current and current[id_ride][0] in allowed]
+
+        if matched:
+            # One UPDATE per status read above, so a ride that moved in
+            # between (even to another allowed status) is a conflict rather
+            # than an event with a stale old_status
+            by_status = {}
+            for id_ride in matched:
+                by_status.setdefault(current[id_ride][0], []).append(id_ride)
+            for old_status, ids in by_status.items():
+                updated = Ride.objects.filter(status=old_status, id_ride__in=ids).update(
+                    status=target, updated_at=now
+                )
+                if updated != len(ids):
+                    raise TransitionConflict()
+
+            events = RideEvent.objects.bulk_create([
+                RideEvent(
+                    id_ride_id=id_ride,
+                    description=EVENT_DESCRIPTIONS[target],
+                    old_status=current[id_ride][0],
+                    new_status=target,
+                    user_id=current[id_ride][1] if target == 'COMPLETED' else getattr(user, 'pk', None),
+                    created_at=now,
+                )
+                for id_ride in matched
+            ])
+            # update() and bulk_create() don't send model signals
+            response_cache.invalidate_on_commit()
+            event_broker.publish_on_commit(events)
+            for old_status, ids in by_status.items():
+                rollups.status_changed(old_status, target, len(ids))
+            rollups.events_created(events)
+
+    matched = set(matched)
+    results = []
+    for id_ride in ride_ids:
+        if id_ride in matched:
+            result = UPDATED
+        elif id_ride in current:
+            result = INVALID_STATUS
+        else:
+            result = NOT_FOUND
+        results.append({
+            'id_ride': id_ride,
+            'result': result,
+            'old_status': current[id_ride][0] if id_ride in current else None,
+        })
+    return results
@@ -1,6 +1,7 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import RideViewSet, UserViewSet, RideEventViewSet, query_performance
+from . import async_views
+from .views import RideViewSet, UserViewSet, RideEventViewSet, query_performance, request_metrics_view
 
 router = DefaultRouter()
 router.register(r'rides', RideViewSet)
@@ -10,4 +11,11 @@ router.register(r'events', RideEventViewSet)
 urlpatterns = [
     path('', include(router.urls)),
     path('performance/', query_performance, name='query_performance'),
+    path('metrics/', request_metrics_view, name='request_metrics'),
+    # Async versions of the read endpoints, for ASGI deployments
+    path('async/rides/', async_views.ride_list, name='async-ride-list'),
+    path('async/rides/<pk>/', async_views.ride_detail, name='async-ride-detail'),
+    path('async/events/', async_views.ride_event_list, name='async-rideevent-list'),
+    path('async/events/stream/', async_views.ride_event_stream, name='async-rideevent-stream'),
+    path('async/rides/<pk>/events/stream/', async_views.ride_event_stream, name='async-ride-event-stream'),
 ] 
\ No newline at end of file
@@ -3,16 +3,30 @@ from rest_framework import viewsets, permissions, filters
 from rest_framework.response import Response
 from rest_framework import status
 from rest_framework.decorators import action
-from django.db.models import F, ExpressionWrapper, FloatField, Prefetch, Count
-from django.db.models.functions import Power, Sqrt
+from rest_framework.exceptions import NotFound
+from django.db.models import Prefetch, Count
 from django.db.models import Q
-from django.utils import timezone
-from datetime import timedelta
 from .models import Ride, RideEvent, User
-from .serializers import RideSerializer, UserSerializer, RideEventSerializer
+from .serializers import (
+    RideSerializer, UserSerializer, RideEventSerializer, BulkTransitionSerializer, DriverLocationSerializer,
+    DispatchSerializer, ride_representation,
+    ride_event_representation, get_ride_fields, get_ride_columns
+)
+from .transitions import transition_ride, bulk_transition, TransitionConflict, UPDATED
 from .permissions import IsAdminUser
+from .geo import nearest_rides
+from .archive import ride_event_history
+from .rollups import ride_stats
+from .dispatch import dispatch, driver_index
+from . import conditional
+from .cache import response_cache
+from .queries import filter_rides, filter_ride_events, get_recent_events_window
+from .renderers import NDJSONRenderer, CSVRenderer, LIST_RENDERER_CLASSES
+from .export import export_response, RIDE_EXPORT_COLUMNS, RIDE_EVENT_EXPORT_COLUMNS
+from .pagination import PaginationModeMixin, RideCursorPagination, RideEventCursorPagination
+from .routers import ReplicaReadMixin
+from .metrics import record_queries, request_metrics, merge_snapshots, summarize
 from rest_framework.pagination import PageNumberPagination
-from django.db import connection, reset_queries
 import json
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAdminUser as DRFIsAdminUser
@@ -22,132 +36,251 @@ class RidePagination(PageNumberPagination):
     page_size_query_param = 'page_size'
     max_page_size = 100
 
-class UserViewSet(viewsets.ReadOnlyModelViewSet):
+class RideOrderingFilter(filters.OrderingFilter):
+    """
+    Ordering filter that leaves distance-sorted querysets alone
+    """
+    
+    def filter_queryset(self, request, queryset, view):
+        if 'distance' in queryset.query.annotations:
+            return queryset
+        return super().filter_queryset(request, queryset, view)
+
+class UserViewSet(ReplicaReadMixin, viewsets.ReadOnlyModelViewSet):
     """
     API viewset for retrieving user information
     """
     queryset = User.objects.all()
     serializer_class = UserSerializer
     permission_classes = [IsAdminUser]
+    
+    @action(detail=True, methods=['post'])
+    def location(self, request, pk=None):
+        """
+        Report a driver's position and availability for auto-dispatch
+        (see rides.dispatch)
+        """
+        serializer = DriverLocationSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        driver = self.get_object()
+        if driver.role != 'driver':
+            return Response(
+                {'error': 'Only drivers can report a location'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        driver_index.update(driver.id_user, **serializer.validated_data)
+        return Response({'id_user': driver.id_user, **serializer.validated_data})
 
-class RideEventViewSet(viewsets.ReadOnlyModelViewSet):
+class RideEventViewSet(ReplicaReadMixin, PaginationModeMixin, viewsets.ReadOnlyModelViewSet):
     """
     API viewset for retrieving ride event information
     """
-    queryset = RideEvent.objects.all().order_by('-created_at')
+    queryset = RideEvent.objects.select_related('user').order_by('-created_at')
     serializer_class = RideEventSerializer
     permission_classes = [IsAdminUser]
+    renderer_classes = LIST_RENDERER_CLASSES
+    cursor_pagination_class = RideEventCursorPagination
     
     def get_queryset(self):
-        queryset = super().get_queryset()
-        ride_id = self.request.query_params.get('ride_id')
-        if ride_id:
-            queryset = queryset.filter(id_ride=ride_id)
-        return queryset
+        return filter_ride_events(super().get_queryset(), self.request.query_params)
+    
+    @action(detail=False, methods=['get'], renderer_classes=[NDJSONRenderer, CSVRenderer])
+    def export(self, request):
+        """
+        Stream every matching event as NDJSON or CSV (?format=ndjson|csv)
+        """
+        return export_response(
+            self.get_queryset(),
+            RIDE_EVENT_EXPORT_COLUMNS,
+            request.accepted_renderer.format,
+            filename='ride_events'
+        )
 
-class RideViewSet(viewsets.ModelViewSet):
+class RideViewSet(ReplicaReadMixin, PaginationModeMixin, viewsets.ModelViewSet):
     """
     API viewset for handling ride operations
     """
     queryset = Ride.objects.all()
     serializer_class = RideSerializer
     permission_classes = [IsAdminUser]
+    renderer_classes = LIST_RENDERER_CLASSES
     pagination_class = RidePagination
-    filter_backends = [filters.OrderingFilter]
+    cursor_pagination_class = RideCursorPagination
+    filter_backends = [RideOrderingFilter]
     ordering_fields = ['pickup_time', 'created_at', 'updated_at']
     ordering = ['-created_at']
     
+    def get_distance_limit(self):
+        page_size = self.paginator.get_page_size(self.request)
+        try:
+            page = int(self.request.query_params.get(getattr(self.paginator, 'page_query_param', 'page'), 1))
+        except (TypeError, ValueError):
+            page = 1
+        return max(page, 1) * page_size + 1
+    
+    def get_ride_fields(self):
+        return get_ride_fields(self.request.query_params)
+    
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['fields'] = self.get_ride_fields()
+        return context
+    
     def get_queryset(self):
-        # Get events from the last 24 hours
-        last_24_hours = timezone.now() - timedelta(hours=24)
-        todays_events = RideEvent.objects.filter(
-            created_at__gte=last_24_hours
-        ).select_related('user')
+        # Sparse fieldsets (?fields=, ?expand=) skip what they don't render
+        fields = self.get_ride_fields()
         
         # Base queryset with select_related to minimize queries
-        queryset = Ride.objects.all().select_related(
-            'id_rider', 
-            'id_driver'
-        ).prefetch_related(
-            # Use Prefetch to customize the related objects that are retrieved
-            Prefetch(
-                'events',
-                queryset=todays_events,
-                to_attr='todays_events'
+        related = [
+            name for key, name in (('rider', 'id_rider'), ('driver', 'id_driver'))
+            if fields is None or key in fields
+        ]
+        queryset = Ride.objects.all().select_related(*related) if related else Ride.objects.all()
+        
+        if fields is None or 'todays_ride_events' in fields:
+            # Get recent events (last 24 hours by default), optionally capped per ride
+            window_hours, events_limit = get_recent_events_window(self.request.query_params)
+            todays_events = RideEvent.objects.recent(window_hours, events_limit).select_related('user')
+            queryset = queryset.prefetch_related(
+                # Use Prefetch to customize the related objects that are retrieved
+                Prefetch(
+                    'events',
+                    queryset=todays_events,
+                    to_attr='todays_events'
+                )
             )
-        )
         
-        # Filter by status
-        status = self.request.query_params.get('status')
-        if status:
-            queryset = queryset.filter(status=status.upper())
+        if fields is not None and self.action in ('list', 'retrieve'):
+            # The ordering column too: cursor links are built from it
+            ordering = RideOrderingFilter().get_ordering(self.request, queryset, self) or []
+            queryset = queryset.only(*get_ride_columns(fields), *[term.lstrip('-') for term in ordering])
         
-        # Filter by rider email
-        rider_email = self.request.query_params.get('rider_email')
-        if rider_email:
-            queryset = queryset.filter(id_rider__email__icontains=rider_email)
+        # Filter by status and rider email
+        queryset = filter_rides(queryset, self.request.query_params)
         
         # Sort by distance to pickup if lat/lng provided
         lat = self.request.query_params.get('lat')
         lng = self.request.query_params.get('lng')
         sort_by_distance = self.request.query_params.get('sort_by_distance')
         
-        if lat and lng and sort_by_distance:
+        if lat and lng and sort_by_distance and self.action in ('list', 'query_stats'):
             try:
                 lat = float(lat)
                 lng = float(lng)
-                
-                # Calculate distance using the Pythagorean theorem
-                # For production, consider using PostGIS for geographic distance calculations
-                queryset = queryset.annotate(
-                    distance=ExpressionWrapper(
-                        Sqrt(
-                            Power(F('pickup_latitude') - lat, 2) + 
-                            Power(F('pickup_longitude') - lng, 2)
-                        ),
-                        output_field=FloatField()
-                    )
-                ).order_by('distance')
             except (ValueError, TypeError):
                 # If conversion fails, ignore the distance sorting
                 pass
+            else:
+                # Only the rides needed to fill the requested page (plus one,
+                # so the paginator still knows whether a next page exists)
+                # are located through the grid index, see rides.geo
+                queryset = nearest_rides(queryset, lat, lng, limit=self.get_distance_limit())
                 
         return queryset
     
-    @action(detail=True, methods=['post'])
-    def cancel(self, request, pk=None):
-        ride = self.get_object()
-        if ride.status in ['COMPLETED', 'CANCELLED']:
-            return Response(
-                {'error': 'Cannot cancel a completed or already cancelled ride'},
-                status=status.HTTP_400_BAD_REQUEST
+    def get_validators(self):
+        """
+        ETag/Last-Modified of the response to a list, retrieve or events
+        request (see rides.conditional); None when there are none
+        """
+        if not conditional.enabled() or self.request.method not in ('GET', 'HEAD'):
+            return None
+        fields = self.get_ride_fields()
+        with_events = fields is None or 'todays_ride_events' in fields
+        if self.action == 'list':
+            return conditional.ride_list_validators(self.request, with_events)
+        ride_id = self.kwargs.get(self.lookup_url_kwarg or self.lookup_field)
+        if self.action == 'retrieve':
+            return conditional.ride_validators(self.request, ride_id, with_events)
+        if self.action == 'events':
+            return conditional.ride_events_validators(
+                self.request, ride_id, history=self.request.query_params.get('history') == 'full'
             )
+        return None
+    
+    def get_not_modified_response(self):
+        """
+        The validators and, if the client's copy is current, the 304 to
+        answer with
+        """
+        validators = self.get_validators()
+        return validators, validators and validators.get_not_modified_response(self.request)
+    
+    def add_validators(self, response, validators):
+        return validators.add_headers(response) if validators is not None else response
+    
+    def get_cached_response(self, cached, response_class=Response):
+        """
+        The response to a cache hit: the cache holds the data along with
+        the validators it was built with, so a 304 needs no query either
+        """
+        data, validators = cached
+        if validators is None or not conditional.enabled():
+            return response_class(data)
+        validators = validators.for_request(self.request)
+        not_modified = validators.get_not_modified_response(self.request)
+        if not_modified is not None:
+            return not_modified
+        return self.add_validators(response_class(data), validators)
+    
+    def list(self, request, *args, **kwargs):
+        cache_key, cached = response_cache.get(request)
+        if cached is not None:
+            return self.get_cached_response(cached)
         
-        old_status = ride.status
-        ride.status = 'CANCELLED'
-        ride.save()
+        # Unchanged since the client's copy: answered from aggregates alone
+        validators, not_modified = self.get_not_modified_response()
+        if not_modified is not None:
+            return not_modified
         
-        # Create a RideEvent for the cancellation
-        RideEvent.objects.create(
-            id_ride=ride,
-            description=f"Ride cancelled",
-            old_status=old_status,
-            new_status='CANCELLED',
-            user=request.user if hasattr(request, 'user') else None,
-            created_at=timezone.now()
-        )
+        # Reads bypass RideSerializer, see serializers.ride_representation
+        queryset = self.filter_queryset(self.get_queryset())
+        fields = self.get_ride_fields()
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            response = self.get_paginated_response([ride_representation(ride, fields) for ride in page])
+        else:
+            response = Response([ride_representation(ride, fields) for ride in queryset])
+        response_cache.set(cache_key, (response.data, validators))
+        return self.add_validators(response, validators)
+    
+    def retrieve(self, request, *args, **kwargs):
+        cache_key, cached = response_cache.get(request)
+        if cached is not None:
+            return self.get_cached_response(cached)
+        
+        validators, not_modified = self.get_not_modified_response()
+        if not_modified is not None:
+            return not_modified
+        
+        data = ride_representation(self.get_object(), self.get_ride_fields())
+        response_cache.set(cache_key, (data, validators))
+        return self.add_validators(Response(data), validators)
+    
+    def get_ride_id(self):
+        # Transitions address the ride by primary key without loading it
+        try:
+            return int(self.kwargs[self.lookup_url_kwarg or self.lookup_field])
+        except (TypeError, ValueError):
+            raise NotFound()
+    
+    def transition_failed(self, ride_id, error):
+        if not Ride.objects.filter(id_ride=ride_id).exists():
+            raise NotFound()
+        return Response({'error': error}, status=status.HTTP_400_BAD_REQUEST)
+    
+    @action(detail=True, methods=['post'])
+    def cancel(self, request, pk=None):
+        ride_id = self.get_ride_id()
+        user = request.user if hasattr(request, 'user') else None
+        if transition_ride(ride_id, 'CANCELLED', user=user) is None:
+            return self.transition_failed(ride_id, 'Cannot cancel a completed or already cancelled ride')
         
         return Response({'status': 'Ride cancelled'})
     
     @action(detail=True, methods=['post'])
     def start(self, request, pk=None):
-        ride = self.get_object()
-        if ride.status != 'REQUESTED':
-            return Response(
-                {'error': 'Only requested rides can be started'},
-                status=status.HTTP_400_BAD_REQUEST
-            )
-        
+        ride_id = self.get_ride_id()
         driver_id = request.data.get('driver_id')
         if not driver_id:
             return Response(
@@ -157,77 +290,134 @@ class RideViewSet(viewsets.ModelViewSet):
             
         try:
             driver = User.objects.get(id_user=driver_id)
-            old_status = ride.status
-            ride.id_driver = driver
-            ride.status = 'IN_PROGRESS'
-            ride.save()
-            
-            # Create a RideEvent for starting the ride
-            RideEvent.objects.create(
-                id_ride=ride,
-                description=f"Ride started with driver {driver.first_name} {driver.last_name}",
-                old_status=old_status,
-                new_status='IN_PROGRESS',
-                user=driver,
-                created_at=timezone.now()
-            )
-            
-            return Response({'status': 'Ride started'})
-        except User.DoesNotExist:
+        except (User.DoesNotExist, ValueError, TypeError):
             return Response(
                 {'error': 'Driver not found'},
                 status=status.HTTP_404_NOT_FOUND
             )
+        
+        if transition_ride(ride_id, 'IN_PROGRESS', driver=driver) is None:
+            return self.transition_failed(ride_id, 'Only requested rides can be started')
+        
+        return Response({'status': 'Ride started'})
     
     @action(detail=True, methods=['post'])
     def complete(self, request, pk=None):
-        ride = self.get_object()
-        if ride.status != 'IN_PROGRESS':
-            return Response(
-                {'error': 'Only in-progress rides can be completed'},
-                status=status.HTTP_400_BAD_REQUEST
-            )
-        
-        old_status = ride.status
-        ride.status = 'COMPLETED'
-        ride.save()
-        
-        # Create a RideEvent for completing the ride
-        RideEvent.objects.create(
-            id_ride=ride,
-            description="Ride completed",
-            old_status=old_status,
-            new_status='COMPLETED',
-            user=ride.id_driver,
-            created_at=timezone.now()
-        )
+        ride_id = self.get_ride_id()
+        if transition_ride(ride_id, 'COMPLETED') is None:
+            return self.transition_failed(ride_id, 'Only in-progress rides can be completed')
         
         return Response({'status': 'Ride completed'})
+    
+    @action(detail=False, methods=['post'])
+    def bulk_transition(self, request):
+        """
+        Cancel or complete many rides at once
+        """
+        serializer = BulkTransitionSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        target = serializer.validated_data['status']
         
+        try:
+            results = bulk_transition(
+                serializer.validated_data['ride_ids'],
+                target,
+                user=request.user if hasattr(request, 'user') else None
+            )
+        except TransitionConflict:
+            return Response(
+                {'error': 'Some rides changed status concurrently, nothing was updated'},
+                status=status.HTTP_409_CONFLICT
+            )
+        
+        return Response({
+            'status': target,
+            'updated': sum(1 for result in results if result['result'] == UPDATED),
+            'results': results
+        })
+    
+    @action(detail=False, methods=['post'])
+    def auto_dispatch(self, request):
+        """
+        Start requested rides, earliest pickup first, with the nearest
+        available drivers (see rides.dispatch)
+        """
+        serializer = DispatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        results = dispatch(**serializer.validated_data)
+        return Response({
+            'started': len(results),
+            'available_drivers': len(driver_index),
+            'results': results
+        })
+    
     @action(detail=True, methods=['get'])
     def events(self, request, pk=None):
+        """
+        Events of the ride, newest first; ?history=full adds archived events
+        """
+        validators, not_modified = self.get_not_modified_response()
+        if not_modified is not None:
+            return not_modified
+        
         ride = self.get_object()
-        events = ride.events.all().order_by('-created_at')
-        serializer = RideEventSerializer(events, many=True)
-        return Response(serializer.data)
+        if request.query_params.get('history') == 'full':
+            response = Response([ride_event_representation(event) for event in ride_event_history(ride)])
+        else:
+            events = ride.events.select_related('user').order_by('-created_at')
+            response = Response(RideEventSerializer(events, many=True).data)
+        return self.add_validators(response, validators)
         
+    @action(detail=False, methods=['get'], renderer_classes=[NDJSONRenderer, CSVRenderer])
+    def export(self, request):
+        """
+        Stream every matching ride as NDJSON or CSV (?format=ndjson|csv),
+        with the same filters and ordering as the list
+        """
+        queryset = self.filter_queryset(filter_rides(Ride.objects.all(), request.query_params))
+        return export_response(
+            queryset,
+            RIDE_EXPORT_COLUMNS,
+            request.accepted_renderer.format,
+            filename='rides'
+        )
+    
+    @action(detail=False, methods=['get'])
+    def stats(self, request):
+        """
+        Ride counts per status and rides per status and hour (?hours=24,
+        up to a month) from the rollup tables, see rides.rollups
+        """
+        try:
+            hours = min(max(int(request.query_params.get('hours', 24)), 1), 24 * 31)
+        except (TypeError, ValueError):
+            hours = 24
+        return Response(ride_stats(hours))
+    
+    @action(detail=False, methods=['get'])
+    def cache_stats(self, request):
+        """
+        Hit/miss counters of the ride response cache in this process
+        """
+        return Response(response_cache.stats())
+    
     @action(detail=False, methods=['get'])
     def query_stats(self, request):
         """
         Debug endpoint to show the number of queries executed
         """
-        # Reset query log
-        reset_queries()
-        
-        # Perform the query with our optimized queryset
-        queryset = self.get_queryset()
-        rides = self.paginate_queryset(queryset)
-        serializer = self.get_serializer(rides, many=True)
-        response = self.get_paginated_response(serializer.data)
+        # Record the queries of this request; unlike connection.queries this
+        # doesn't need DEBUG
+        with record_queries(capture=True) as recorder:
+            # Perform the query with our optimized queryset
+            queryset = self.get_queryset()
+            rides = self.paginate_queryset(queryset)
+            serializer = self.get_serializer(rides, many=True)
+            response = self.get_paginated_response(serializer.data)
         
         # Get query information
-        query_count = len(connection.queries)
-        query_details = connection.queries
+        query_count = recorder.count
+        query_details = recorder.queries
         
         response.data['query_stats'] = {
             'total_queries': query_count,
@@ -247,36 +437,34 @@ def query_performance(request):
     rides_count = Ride.objects.count()
     
     # Test 1: Unoptimized approach (loads all events)
-    reset_queries()
-    
-    # Unoptimized query - loads all events for all rides
-    rides_unoptimized = Ride.objects.all().select_related('id_rider', 'id_driver').prefetch_related('events')[:10]
-    
-    # Force evaluation of the queryset
-    list(rides_unoptimized)
+    with record_queries() as unoptimized:
+        # Unoptimized query - loads all events for all rides
+        rides_unoptimized = Ride.objects.all().select_related('id_rider', 'id_driver').prefetch_related('events')[:10]
+        
+        # Force evaluation of the queryset
+        list(rides_unoptimized)
     
-    unoptimized_query_count = len(connection.queries)
+    unoptimized_query_count = unoptimized.count
     
     # Test 2: Optimized approach (only loads today's events)
-    reset_queries()
-    
-    # Get events from the last 24 hours
-    last_24_hours = timezone.now() - timedelta(hours=24)
-    todays_events = RideEvent.objects.filter(created_at__gte=last_24_hours).select_related('user')
-    
-    # Optimized query - only loads events from last 24 hours
-    rides_optimized = Ride.objects.all().select_related('id_rider', 'id_driver').prefetch_related(
-        Prefetch('events', queryset=todays_events, to_attr='todays_events')
-    )[:10]
-    
-    # Force evaluation of the queryset
-    rides_list = list(rides_optimized)
-    
-    # Access todays_events for each ride to ensure it's loaded
-    for ride in rides_list:
-        list(ride.todays_events)
+    with record_queries() as optimized:
+        # Get recent events, using the same window parameters as the ride list
+        window_hours, events_limit = get_recent_events_window(request.query_params)
+        todays_events = RideEvent.objects.recent(window_hours, events_limit).select_related('user')
+        
+        # Optimized query - only loads recent events
+        rides_optimized = Ride.objects.all().select_related('id_rider', 'id_driver').prefetch_related(
+            Prefetch('events', queryset=todays_events, to_attr='todays_events')
+        )[:10]
+        
+        # Force evaluation of the queryset
+        rides_list = list(rides_optimized)
+        
+        # Access todays_events for each ride to ensure it's loaded
+        for ride in rides_list:
+            list(ride.todays_events)
     
-    optimized_query_count = len(connection.queries)
+    optimized_query_count = optimized.count
     
     # Calculate events loaded in each approach
     all_events_loaded = sum(ride.events.count() for ride in rides_unoptimized)
@@ -296,10 +484,21 @@ def query_performance(request):
         'optimized_approach': {
             'query_count': optimized_query_count,
             'events_loaded': todays_events_loaded,
-            'description': 'Loads ONLY events from last 24 hours'
+            'description': f'Loads ONLY events from last {window_hours} hours'
+                           + (f', at most {events_limit} per ride' if events_limit is not None else '')
         },
         'improvement': {
             'query_reduction': f"{unoptimized_query_count - optimized_query_count} fewer queries",
             'data_reduction': f"{all_events_loaded - todays_events_loaded} fewer events loaded"
         }
     })
+
+@api_view(['GET'])
+@permission_classes([DRFIsAdminUser])
+def request_metrics_view(request):
+    """
+    Request count, mean and p50/p95/p99 (histogram bucket bounds) of the
+    total, view, render and database time and of the query count per view,
+    for the process serving this request
+    """
+    return Response(summarize(merge_snapshots([request_metrics.snapshot()])))